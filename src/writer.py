@@ -1,89 +1,3451 @@
+import time
+STARTUP_T0 = time.perf_counter()  # Origin for --profile-startup
 import tkinter as tk
-from tkinter import filedialog, ttk, font
 import os
 import sys
 import json
-import time
+import stat
+import queue
 import threading
-import random
-import string
+import zlib
+import codecs
+import mmap
+import bisect
+import itertools
+import math
+import re
+import struct
+import hashlib
+import html
+from array import array
+from collections import deque
+# Dialogs, ttk and modules only the worker threads need are imported where
+# they are first used, keeping them off the path to the first keystroke.
+
+# Base directory for portability (handles PyInstaller)
+if getattr(sys, 'frozen', False):
+    BASE_DIR = os.path.dirname(sys.executable)
+else:
+    BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# File paths
+SESSION_FILE = os.path.join(BASE_DIR, "last_session.txt")
+SETTINGS_FILE = os.path.join(BASE_DIR, "settings.json")
+FONT_CACHE_FILE = os.path.join(BASE_DIR, "font_cache.json")
+README_FILENAME = os.path.join(BASE_DIR, "readme.txt")
+APP_DATA_DIR = os.path.join(BASE_DIR, ".voidwriter")
+BACKUP_DIR = os.path.join(APP_DATA_DIR, "backups")
+SEARCH_DIR = os.path.join(APP_DATA_DIR, "search")
+HISTORY_DIR = os.path.join(APP_DATA_DIR, "history")
+SESSION_STATS_DIR = os.path.join(APP_DATA_DIR, "session")
+STATS_FILE = os.path.join(APP_DATA_DIR, "stats.sqlite3")
+
+# Theme definitions
+NORD_BG = "#2e3440"
+NORD_FG = "#d8dee9"
+
+# Dark theme for menus and popups
+MENU_THEME = {
+    "bg": "#1e1e1e",
+    "fg": "#d4d4d4",
+    "active_bg": "#2a2a2a",
+    "input_bg": "#1f1f1f"
+}
+
+THEMES = {
+    "dark": {"bg": "#1e1e1e", "fg": "#d4d4d4", "insert": "#ffffff"},
+    "paper": {"bg": "#f5f5f5", "fg": "#222222", "insert": "#222222"},
+    "sepia": {"bg": "#f5e6c4", "fg": "#5b4636", "insert": "#5b4636"},
+    "nord": {"bg": NORD_BG, "fg": NORD_FG, "insert": NORD_FG},
+    "gruvbox_light": {"bg": "#fbf1c7", "fg": "#3c3836", "insert": "#3c3836"},
+    "gruvbox_dark": {"bg": "#282828", "fg": "#ebdbb2", "insert": "#ebdbb2"},
+    "monokai": {"bg": "#272822", "fg": "#f8f8f2", "insert": "#f8f8f2"},
+    "cobalt": {"bg": "#002240", "fg": "#ffffff", "insert": "#ffffff"}
+}
+
+THEME_CHOICES = [
+    "dark", "paper", "sepia", "nord", "gruvbox_light", "gruvbox_dark", "monokai", "cobalt", "custom"
+]
+
+# Font options
+BASIC_FONT_FAMILIES = [
+    "Arial", "Calibri", "Cambria", "Century", "Comic Sans", "Consolas",
+    "Courier New", "Serif", "Times New Roman", "Verdana", "More Fonts..."
+]
+
+# Directories whose modification times invalidate the cached font list
+FONT_DIRS = [
+    os.path.join(os.environ.get("WINDIR", r"C:\Windows"), "Fonts"),
+    os.path.join(os.environ.get("LOCALAPPDATA", ""), "Microsoft", "Windows", "Fonts"),
+    "/Library/Fonts",
+    "/System/Library/Fonts",
+    os.path.expanduser("~/Library/Fonts"),
+    "/usr/share/fonts",
+    "/usr/local/share/fonts",
+    os.path.expanduser("~/.fonts"),
+    os.path.expanduser("~/.local/share/fonts")
+]
+
+# Default settings
+DEFAULT_SETTINGS = {
+    "font_family": "Consolas",
+    "full_font_family": "",
+    "font_size": 16,
+    "theme": "nord",
+    "autosave_interval": 10,
+    "max_char_width": 50,
+    "typewriter_position": 0.55,
+    "custom_bg": "#222222",
+    "custom_fg": "#eaeaea",
+    "show_word_count": False,
+    "backup_max_count": 50,
+    "backup_max_age_days": 30,
+    "backup_max_total_mb": 100,
+    "large_file_threshold_mb": 64,
+    "buffer_cache_mb": 256,
+    "undo_memory_mb": 32,
+    "history_interval": 60,
+    "spell_check": False,
+    "markdown_styling": False,
+    "typewriter_scroll": False,
+    "focus_mode": "off",
+    "daily_word_goal": 500
+}
+
+# Resize bursts are coalesced into one layout pass per frame
+LAYOUT_FRAME_MS = 16
+
+# Focus mode dims text to this fraction of the way from the background to the
+# foreground; a sentence ends at terminal punctuation and any closing quotes
+FOCUS_MODES = ("off", "sentence", "paragraph")
+FOCUS_DIM = 0.4
+SENTENCE_END_RE = re.compile(r"[.!?]+[\"'”’)\]]*(?:\s+|$)")
+
+# Autosave waits this long after typing stops; autosave_interval caps the delay
+AUTOSAVE_DEBOUNCE_MS = 2000
+
+# Files are streamed into the text area in chunks of this many bytes,
+# inserting for at most LOAD_FRAME_BUDGET seconds per event loop turn
+LOAD_CHUNK_BYTES = 64 * 1024
+LOAD_FRAME_BUDGET = 0.012
+
+# Encodings: a byte order mark decides outright. Otherwise the first chunk
+# of a file is taken as UTF-16 when more than UTF16_NUL_SHARE of its odd (or
+# even) bytes are NUL, then as UTF-8 if it decodes, else as Windows-1252 or
+# Latin-1
+TEXT_BOMS = (
+    (codecs.BOM_UTF32_LE, "utf-32-le"),  # Checked before UTF-16 LE, whose mark it starts with
+    (codecs.BOM_UTF32_BE, "utf-32-be"),
+    (codecs.BOM_UTF8, "utf-8"),
+    (codecs.BOM_UTF16_LE, "utf-16-le"),
+    (codecs.BOM_UTF16_BE, "utf-16-be")
+)
+UTF16_NUL_SHARE = 0.3
+NON_C1_BYTES = bytes(range(0x80)) + bytes(range(0xa0, 0x100))  # 0x80-0x9f is where Windows-1252 and Latin-1 differ
+
+# Large-file mode: the mapped file is indexed every LARGE_INDEX_BLOCK bytes and
+# the text area holds LARGE_WINDOW_LINES lines, re-centered when the view comes
+# within LARGE_WINDOW_MARGIN lines of either edge
+LARGE_INDEX_BLOCK = 64 * 1024
+LARGE_WINDOW_LINES = 3000
+LARGE_WINDOW_MARGIN = 500
+
+# Rough memory cost of a character in an open buffer: Tk's text storage plus
+# the per-line word counts, for the buffer_cache_mb budget
+BUFFER_BYTES_PER_CHAR = 3
+
+# Undo: keystrokes less than UNDO_GROUP_SECONDS apart merge into one step per
+# word, and a history is held to undo_memory_mb counting UNDO_EDIT_OVERHEAD
+# bytes per stored edit on top of its text. A saved history is a header
+# (magic, content hash, undo groups, redo groups, layout length) then the
+# compressed layout words and text
+UNDO_GROUP_SECONDS = 2.0
+UNDO_EDIT_OVERHEAD = 120
+UNDO_MAGIC = b"VWU1"
+UNDO_HEADER = struct.Struct(">4s16sIII")
+DOCUMENT_NAME_FLASH_MS = 1200
+
+# Session records checksum and word-count documents in blocks of this many
+# lines, so a file changed outside the editor only has its changed blocks
+# recounted; a lost cursor line is searched for this far either side
+SESSION_BLOCK_LINES = 512
+SESSION_RELOCATE_LINES = 2000
+
+# Version history: a pack record header is (time, kind, words, payload length);
+# a full keyframe is stored at least every VERSION_KEYFRAME_EVERY versions
+VERSION_HEADER = struct.Struct(">dBII")
+VERSION_KEYFRAME = 0
+VERSION_DELTA = 1
+VERSION_KEYFRAME_EVERY = 20
+HISTORY_PARAGRAPH_RADIUS = 200  # Lines searched for the paragraph a restore replaces
+
+# Open files are checked for changes by other programs this often; where
+# inotify is available a change is also noticed as soon as writes settle
+WATCH_POLL_MS = 2000
+WATCH_SETTLE_MS = 100
+
+# Export formats and the file extension each one writes
+EXPORT_FORMATS = {"html": ".html", "markdown": ".md", "epub": ".epub"}
+EXPORT_CSS = "body { max-width: 40em; margin: 2em auto; line-height: 1.6; } blockquote { font-style: italic; } pre { white-space: pre-wrap; }"
+
+# Writing statistics are batched in memory and written this often; the
+# dashboard shows this many days
+STATS_FLUSH_MS = 30000
+STATS_DASHBOARD_DAYS = 7
+
+# Edits are appended to the journal in groups this often
+JOURNAL_COMMIT_MS = 250
+
+# Backup on large deletions
+LARGE_DELETION_THRESHOLD = 3000  # Characters deleted within the window
+DELETION_WINDOW_SECONDS = 10
+
+# Latency instrumentation: handlers timed while the overlay is on, and the
+# histogram resolution (buckets per doubling, starting at one microsecond)
+LATENCY_HANDLERS = (
+    "text_proxy",
+    "on_text_modified",
+    "update_word_count_label",
+    "center_text_area",
+    "save_file",
+    "create_backup_file",
+    "load_undo_history"
+)
+LATENCY_BUCKETS_PER_OCTAVE = 4
+LATENCY_BUCKET_COUNT = 96
+LATENCY_OVERLAY_MS = 500
+
+# Full-text search over the app folder
+SEARCH_EXTENSIONS = (".txt", ".md")
+SEARCH_RESULT_LIMIT = 50
+SEARCH_SNIPPET_CHARS = 90
+SEARCH_SHARD_FORMAT = 2  # Shards written in another format are re-indexed
+WORD_RE = re.compile(r"\w+")
+
+# Spell checking: the first word list found is used (one word per line), and
+# words added from the context menu go to the personal dictionary. A pass runs
+# once typing or scrolling pauses for SPELL_DELAY_MS, checks the visible lines
+# plus at most SPELL_PASS_LINES edited ones, and re-tags SPELL_TAG_BATCH lines
+# per event loop turn
+SPELL_WORDLISTS = (os.path.join(BASE_DIR, "words.txt"), "/usr/share/dict/words")
+SPELL_DICTIONARY_FILE = os.path.join(APP_DATA_DIR, "dictionary.txt")
+SPELL_DELAY_MS = 300
+SPELL_PASS_LINES = 2000
+SPELL_TAG_BATCH = 50
+SPELL_WORD_RE = re.compile(r"[^\W\d_]+(?:['’][^\W\d_]+)*")
+
+# Markdown styling of .md files. Fenced code is the only construct spanning
+# lines, so the lexer state at the start of a line is 0 or the fence kind
+MARKDOWN_EXTENSIONS = (".md", ".markdown")
+MARKDOWN_TAGS = ("md_h1", "md_h2", "md_h3", "md_quote", "md_italic", "md_bold", "md_code")
+MD_FENCE_RE = re.compile(r" {0,3}(`{3,}|~{3,})")
+MD_HEADING_RE = re.compile(r" {0,3}(#{1,6})(?:[ \t]|$)")
+MD_QUOTE_RE = re.compile(r" {0,3}>")
+MD_INLINE_RE = re.compile(
+    r"(`+)[^`].*?\1"  # Code span
+    r"|(\*\*|__)(?=\S).+?(?<=\S)\2"  # Bold
+    r"|\*(?=[^\s*]).+?(?<=[^\s*])\*|(?<!\w)_(?=[^\s_]).+?(?<=[^\s_])_(?!\w)"  # Italic
+)
+MD_FENCES = "`~"  # State 1 is inside a ``` fence, state 2 inside a ~~~ fence
+
+README_TEXT = """Right click to see the context menu and hotkeys.
+Open any text document, and it will auto open next time.
+"""
+
+class WordCounter:
+    """Keep per-line word counts so edits only recount the lines they touch."""
+
+    def __init__(self):
+        self.line_counts = [0]
+        self.total = 0
+
+    def reset(self, text):
+        """Recount every line of the given text."""
+        self.line_counts = [len(line.split()) for line in text.split("\n")]
+        self.total = sum(self.line_counts)
+
+    def load(self, line_counts):
+        """Adopt per-line counts computed elsewhere, e.g. by FileLoader."""
+        self.line_counts = line_counts or [0]
+        self.total = sum(self.line_counts)
+
+    def replace_lines(self, first, last, lines):
+        """Replace the counts of lines first..last (1-based, inclusive) with counts for new lines."""
+        counts = [len(line.split()) for line in lines]
+        self.total += sum(counts) - sum(self.line_counts[first - 1:last])
+        self.line_counts[first - 1:last] = counts
+
+def parse_index(index):
+    """Split a Tk "line.col" index into a (line, col) tuple of ints."""
+    line, col = str(index).split(".")
+    return int(line), int(col)
+
+def apply_edit(lines, start, end, chars):
+    """Replace the span start..end of a list of lines with chars, like a Tk replace."""
+    (l1, c1), (l2, c2) = start, end
+    lines[l1 - 1:l2] = (lines[l1 - 1][:c1] + chars + lines[l2 - 1][c2:]).split("\n")
+
+def advance_index(start, chars):
+    """Return the (line, col) just past chars inserted at start."""
+    line, col = start
+    newlines = chars.count("\n")
+    if not newlines:
+        return line, col + len(chars)
+    return line + newlines, len(chars) - chars.rfind("\n") - 1
+
+class DeletionTracker:
+    """Log recent edits and report when deletions within a window grow large."""
+
+    def __init__(self, threshold=LARGE_DELETION_THRESHOLD, window=DELETION_WINDOW_SECONDS):
+        self.threshold = threshold
+        self.window = window
+        self.edits = deque()  # (time, start, deleted, inserted)
+        self.deleted = 0
+
+    def reset(self):
+        """Forget every logged edit."""
+        self.edits.clear()
+        self.deleted = 0
+
+    def record(self, start, deleted, inserted, now=None):
+        """Log an edit; return True when the window's deletions exceed the threshold."""
+        now = time.monotonic() if now is None else now
+        while self.edits and now - self.edits[0][0] > self.window:
+            self.deleted -= len(self.edits.popleft()[2])
+        if not self.edits and not deleted:
+            return False
+        self.edits.append((now, start, deleted, inserted))
+        self.deleted += len(deleted)
+        return self.deleted > self.threshold
+
+    def restore(self, text):
+        """Undo the logged edits on text, giving the document as it was before the window."""
+        lines = text.split("\n")
+        for _, start, deleted, inserted in reversed(self.edits):
+            apply_edit(lines, start, advance_index(start, inserted), deleted)
+        return "\n".join(lines)
+
+def undo_edit_cost(edit):
+    """Return the bytes an (start, deleted, inserted) edit is charged against the undo budget."""
+    return len(edit[1]) + len(edit[2]) + UNDO_EDIT_OVERHEAD
+
+def merge_keystroke(last, edit):
+    """Return last and edit as one edit when edit types or deletes on within the same word, else None.
+
+    A merged run covers a word and the whitespace typed after it (or, deleting
+    backwards, the whitespace before it).
+    """
+    start, deleted, inserted = edit
+    last_start, last_deleted, last_inserted = last
+    if len(inserted) == 1 and not deleted and last_inserted and not last_deleted:
+        if start == advance_index(last_start, last_inserted) and (inserted.isspace() or not last_inserted[-1].isspace()):
+            return last_start, "", last_inserted + inserted
+    elif len(deleted) == 1 and not inserted and last_deleted and not last_inserted:
+        if advance_index(start, deleted) == last_start and (deleted.isspace() or not last_deleted[0].isspace()):
+            return start, deleted + last_deleted, ""  # Backspace
+        if start == last_start and (deleted.isspace() or not last_deleted[-1].isspace()):
+            return start, last_deleted + deleted, ""  # Forward delete
+    return None
+
+class UndoHistory:
+    """Undo and redo stacks of edit groups, merged per word and held to a memory budget.
+
+    An edit is (start, deleted, inserted) with start a (line, col) tuple, and
+    a group is a list of edits undone together. Keystrokes merge into the
+    edit before them until a word ends or typing pauses; any other edit
+    starts a new group. With auto grouping off (Tk's -autoseparators) edits
+    join the open group until the next separator. Once over budget the
+    oldest groups are dropped.
+    """
+
+    def __init__(self, budget=32 * 1024 * 1024):
+        self.budget = budget
+        self.undo_stack = deque()
+        self.redo_stack = []
+        self.size = 0  # Bytes charged for both stacks
+        self.auto = True
+        self.open = False  # Whether the next edit may join the newest group
+        self.keystroke = False  # Whether the newest group ends in a run of keystrokes
+        self.replaying = False  # Set while undo/redo edits are applied, so they are not recorded
+        self.last_time = 0.0
+
+    def clear(self):
+        """Forget both stacks."""
+        self.undo_stack.clear()
+        self.redo_stack = []
+        self.size = 0
+        self.open = False
+
+    def separator(self):
+        """End the open group."""
+        self.open = False
+
+    def set_budget(self, budget):
+        self.budget = budget
+        self.trim()
+
+    def record(self, start, deleted, inserted, now=None):
+        """Add an edit made to the buffer; a new edit clears the redo stack."""
+        if self.replaying:
+            return
+        now = time.monotonic() if now is None else now
+        for group in self.redo_stack:
+            self.size -= sum(map(undo_edit_cost, group))
+        self.redo_stack = []
+        edit = (start, deleted, inserted)
+        single = len(deleted) + len(inserted) == 1
+        group = self.undo_stack[-1] if self.open and self.undo_stack else None
+        merged = None
+        if group is not None and self.auto:
+            if single and self.keystroke and now - self.last_time < UNDO_GROUP_SECONDS:
+                merged = merge_keystroke(group[-1], edit)
+            if merged is None:
+                group = None
+        if merged is not None:
+            group[-1] = merged
+            self.size += 1
+        elif group is not None:
+            group.append(edit)
+            self.size += undo_edit_cost(edit)
+        else:
+            self.undo_stack.append([edit])
+            self.size += undo_edit_cost(edit)
+        self.open = True
+        self.keystroke = single
+        self.last_time = now
+        self.trim()
+
+    def trim(self):
+        """Drop the oldest groups until the history fits its budget."""
+        while self.size > self.budget and self.undo_stack:
+            self.size -= sum(map(undo_edit_cost, self.undo_stack.popleft()))
+        while self.size > self.budget and self.redo_stack:
+            self.size -= sum(map(undo_edit_cost, self.redo_stack.pop(0)))
+        if not self.undo_stack:
+            self.open = False
+
+    def undo(self):
+        """Move the newest group to the redo stack.
+
+        Returns the (start, end, text) replacements that revert it, in order,
+        and where the cursor belongs afterwards; None when there is nothing
+        to undo.
+        """
+        if not self.undo_stack:
+            return None
+        group = self.undo_stack.pop()
+        self.redo_stack.append(group)
+        self.open = False
+        start, deleted, _ = group[0]
+        return [(s, advance_index(s, i), d) for s, d, i in reversed(group)], advance_index(start, deleted)
+
+    def redo(self):
+        """Move the newest undone group back; returns like undo()."""
+        if not self.redo_stack:
+            return None
+        group = self.redo_stack.pop()
+        self.undo_stack.append(group)
+        self.open = False
+        start, _, inserted = group[-1]
+        return [(s, advance_index(s, d), i) for s, d, i in group], advance_index(start, inserted)
+
+    def snapshot(self):
+        """Return copies of the undo and redo groups, for encode_undo on another thread."""
+        return [list(group) for group in self.undo_stack], [list(group) for group in self.redo_stack]
+
+    def adopt(self, undo_groups, redo_groups):
+        """Replace both stacks, as with groups from decode_undo."""
+        self.clear()
+        self.undo_stack.extend(undo_groups)
+        self.redo_stack = redo_groups
+        self.size = sum(undo_edit_cost(edit) for group in itertools.chain(undo_groups, redo_groups) for edit in group)
+        self.trim()
+
+def encode_undo(content_hash, undo_groups, redo_groups):
+    """Pack undo history for the document content with the given blocks_hash.
+
+    The layout is an array of words: each group's edit count, then line,
+    column, deleted length and inserted length for each edit; the text of
+    every edit follows as one UTF-8 string.
+    """
+    layout = array("I")
+    text = []
+    for group in itertools.chain(undo_groups, redo_groups):
+        layout.append(len(group))
+        for (line, col), deleted, inserted in group:
+            layout.extend((line, col, len(deleted), len(inserted)))
+            text.append(deleted)
+            text.append(inserted)
+    header = UNDO_HEADER.pack(UNDO_MAGIC, bytes.fromhex(content_hash), len(undo_groups), len(redo_groups), len(layout))
+    return header + zlib.compress(layout.tobytes() + "".join(text).encode("utf-8"), 1)
+
+def decode_undo(data, content_hash):
+    """Return the (undo groups, redo groups) packed by encode_undo, or None if they are for other content."""
+    try:
+        magic, stored_hash, undo_count, redo_count, layout_len = UNDO_HEADER.unpack_from(data)
+        if magic != UNDO_MAGIC or stored_hash != bytes.fromhex(content_hash):
+            return None
+        payload = zlib.decompress(memoryview(data)[UNDO_HEADER.size:])
+        layout = array("I")
+        layout.frombytes(payload[:layout_len * layout.itemsize])
+        text = payload[layout_len * layout.itemsize:].decode("utf-8")
+        groups = []
+        i = pos = 0
+        while i < len(layout):
+            count = layout[i]
+            i += 1
+            group = []
+            for _ in range(count):
+                line, col, deleted_len, inserted_len = layout[i:i + 4]
+                i += 4
+                deleted = text[pos:pos + deleted_len]
+                pos += deleted_len
+                group.append(((line, col), deleted, text[pos:pos + inserted_len]))
+                pos += inserted_len
+            groups.append(group)
+    except (struct.error, zlib.error, ValueError):
+        return None
+    if len(groups) != undo_count + redo_count or pos != len(text):
+        return None
+    return groups[:undo_count], groups[undo_count:]
+
+def temp_path_for(path):
+    """Return a unique hidden temp path in the same directory as path."""
+    directory, name = os.path.split(os.path.abspath(path))
+    return os.path.join(directory, f".{name}.{os.urandom(4).hex()}.tmp")
+
+def atomic_write(path, data):
+    """Write bytes to path through an fsynced temp file and os.replace."""
+    directory = os.path.dirname(os.path.abspath(path))
+    tmp_path = temp_path_for(path)
+    fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL | getattr(os, "O_BINARY", 0), 0o666)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        try:
+            os.chmod(tmp_path, stat.S_IMODE(os.stat(path).st_mode))
+        except OSError:
+            pass
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+    if hasattr(os, "O_DIRECTORY"):
+        try:
+            dir_fd = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+            try:
+                os.fsync(dir_fd)
+            finally:
+                os.close(dir_fd)
+        except OSError:
+            pass
+
+class ListBuffer:
+    """Text held as a list of lines; the headless stand-in for the Tk text widget."""
+
+    def __init__(self, text=""):
+        self.lines = text.split("\n")
+
+    def text(self):
+        return "\n".join(self.lines)
+
+    def set_text(self, text):
+        self.lines = text.split("\n")
+
+    def get(self, start, end):
+        """Return the characters between two (line, col) positions."""
+        (l1, c1), (l2, c2) = start, end
+        if l1 == l2:
+            return self.lines[l1 - 1][c1:c2]
+        return "\n".join([self.lines[l1 - 1][c1:]] + self.lines[l1:l2 - 1] + [self.lines[l2 - 1][:c2]])
+
+    def get_lines(self, first, last):
+        """Return lines first..last (1-based, inclusive)."""
+        return self.lines[first - 1:last]
+
+    def replace(self, start, end, chars):
+        apply_edit(self.lines, start, end, chars)
+
+    def end(self):
+        """Return the (line, col) of the last character position."""
+        return len(self.lines), len(self.lines[-1])
+
+class TextWidgetBuffer:
+    """Read access to a Tk text widget's contents through its unproxied command."""
+
+    def __init__(self, interp, command):
+        self.call = interp.call
+        self.command = command
+
+    def text(self):
+        return self.call(self.command, "get", "1.0", "end-1c")
+
+    def set_text(self, text):
+        self.call(self.command, "replace", "1.0", "end", text)
+
+    def get(self, start, end):
+        return self.call(self.command, "get", "%d.%d" % start, "%d.%d" % end)
+
+    def get_lines(self, first, last):
+        return self.call(self.command, "get", f"{first}.0", f"{last}.end").split("\n")
+
+    def replace(self, start, end, chars):
+        self.call(self.command, "replace", "%d.%d" % start, "%d.%d" % end, chars)
+
+    def end(self):
+        return parse_index(self.call(self.command, "index", "end-1c"))
+
+class DocumentCore:
+    """Tk-independent document state: buffer, word counts, deletion backups, undo and save bookkeeping.
+
+    DistractionFreeWriter reports every edit of its text widget through
+    edited(); headless callers such as the benchmark edit through apply().
+    """
+
+    def __init__(self, buffer=None):
+        self.buffer = buffer if buffer is not None else ListBuffer()
+        self.word_counter = WordCounter()
+        self.deletion_tracker = DeletionTracker()  # For tracking large deletions
+        self.undo = UndoHistory()
+        self.format = TextFormat()  # How the file is encoded on disk
+        self.generation = 0  # Bumped on every edit
+        self.saved_generation = 0
+
+    @property
+    def dirty(self):
+        return self.generation != self.saved_generation
+
+    def load(self, text=None, line_counts=None):
+        """Start over from freshly loaded contents, which count as saved."""
+        if text is not None:
+            self.buffer.set_text(text)
+        if line_counts is None:
+            self.word_counter.reset(self.buffer.text())
+        else:
+            self.word_counter.load(line_counts)
+        self.deletion_tracker.reset()
+        self.undo.clear()
+        self.mark_saved()
+
+    def touch(self):
+        """Note a change the core could not observe in detail."""
+        self.generation += 1
+
+    def resync(self, full=True):
+        """Recount words after an edit the core did not see; a cheap check first unless full."""
+        if full or len(self.word_counter.line_counts) != self.buffer.end()[0]:
+            self.word_counter.reset(self.buffer.text())
+        if full:
+            self.deletion_tracker.reset()
+
+    def apply(self, start, end, inserted):
+        """Replace start..end of the buffer; return True when a deletion backup is due."""
+        deleted = self.buffer.get(start, end) if start != end else ""
+        self.buffer.replace(start, end, inserted)
+        return self.edited(start, end, deleted, inserted)
+
+    def undo_step(self, redo=False):
+        """Undo (or redo) the newest group of edits; return where the cursor belongs, or None."""
+        step = self.undo.redo() if redo else self.undo.undo()
+        if step is None:
+            return None
+        replacements, cursor = step
+        self.undo.replaying = True
+        try:
+            for start, end, text in replacements:
+                self.apply(start, end, text)
+        finally:
+            self.undo.replaying = False
+        return cursor
+
+    def edited(self, start, end, deleted, inserted, track=True):
+        """Account for an edit already made to the buffer; return True when a backup is due.
+
+        With track off (loading or journal replay) only the word counts follow along.
+        """
+        first, last = start[0], end[0]
+        self.word_counter.replace_lines(first, last, self.buffer.get_lines(first, first + inserted.count("\n")))
+        if not track:
+            return False
+        self.generation += 1
+        self.undo.record(start, deleted, inserted)
+        return self.deletion_tracker.record(start, deleted, inserted)
+
+    def backup_content(self):
+        """Return the text as it was before the tracked deletions, and forget them."""
+        content = self.deletion_tracker.restore(self.buffer.text())
+        self.deletion_tracker.reset()
+        return content
+
+    def snapshot(self):
+        """Return (encoded content, generation) for a save.
+
+        Text the file's encoding cannot hold switches the document to UTF-8,
+        keeping its line breaks.
+        """
+        text = self.buffer.text()
+        try:
+            return self.format.encode(text), self.generation
+        except UnicodeEncodeError:
+            self.format = TextFormat(newline=self.format.newline)
+            return self.format.encode(text), self.generation
+
+    def mark_saved(self, generation=None):
+        """Record that the file on disk matches the given (default: current) generation."""
+        self.saved_generation = self.generation if generation is None else generation
+
+    def save(self, path):
+        """Write the document to path synchronously."""
+        data, generation = self.snapshot()
+        atomic_write(path, data)
+        self.mark_saved(generation)
+
+def block_stats(lines, line_counts):
+    """Return [crc32, words] for each SESSION_BLOCK_LINES-line block of a document."""
+    return [
+        [
+            zlib.crc32("\n".join(lines[i:i + SESSION_BLOCK_LINES]).encode("utf-8")),
+            sum(line_counts[i:i + SESSION_BLOCK_LINES])
+        ]
+        for i in range(0, len(lines), SESSION_BLOCK_LINES)
+    ]
+
+def blocks_hash(blocks):
+    """Return a content hash of a document from its block checksums."""
+    return hashlib.blake2b(array("I", [crc for crc, _ in blocks]).tobytes(), digest_size=16).hexdigest()
+
+def session_data_path(file_path, suffix):
+    """Return where data of a session document with the given suffix is kept."""
+    key = hashlib.sha1(os.path.abspath(file_path).encode("utf-8")).hexdigest()[:20]
+    return os.path.join(SESSION_STATS_DIR, key + suffix)
+
+def stats_path(file_path):
+    """Return where the per-line word counts of a session document are kept."""
+    return session_data_path(file_path, ".counts")
+
+def undo_path(file_path):
+    """Return where the undo history of a session document is kept."""
+    return session_data_path(file_path, ".undo")
+
+def write_line_counts(path, counts):
+    """Persist an array of per-line word counts, compressed."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    atomic_write(path, zlib.compress(counts.tobytes(), 1))
+
+def write_undo_history(path, data):
+    """Persist undo history packed by encode_undo."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    atomic_write(path, data)
+
+def read_line_counts(path):
+    """Return the per-line word counts written by write_line_counts, or None."""
+    try:
+        with open(path, "rb") as f:
+            counts = array("I")
+            counts.frombytes(zlib.decompress(f.read()))
+            return counts
+    except (OSError, zlib.error, ValueError):
+        return None
+
+def file_signature(path):
+    """Return a cheap [size, mtime_ns] fingerprint of a file."""
+    st = os.stat(path)
+    return [st.st_size, st.st_mtime_ns]
+
+def journal_path(file_path):
+    """Return the hidden journal path that sits next to a document."""
+    directory, name = os.path.split(os.path.abspath(file_path))
+    return os.path.join(directory, f".{name}.journal")
+
+class EditJournal:
+    """Append-only log of the edits made since a document was last saved.
+
+    The first line records the signature of the file the edits apply to; each
+    following line is a JSON list [seq, line1, col1, line2, col2, inserted]
+    meaning "replace line1.col1..line2.col2 with inserted". Disk access happens
+    on the BackgroundWriter thread.
+    """
+
+    def __init__(self, file_path, writer, root):
+        self.file_path = file_path
+        self.path = journal_path(file_path)
+        self.writer = writer
+        self.root = root
+        self.lock = threading.Lock()
+        self.buffer = []  # (seq, line) not yet on disk
+        self.needs_header = True  # The next write starts a fresh journal
+        self.closed = False
+        self.commit_id = None
+
+    def recover(self):
+        """Return journaled edits that apply on top of the file as it is on disk."""
+        records = []
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                header = json.loads(f.readline())
+                if header.get("base") != file_signature(self.file_path):
+                    return []
+                for line in f:
+                    try:
+                        records.append(json.loads(line))
+                    except json.JSONDecodeError:
+                        break  # Torn write at the tail
+        except (OSError, ValueError, AttributeError):
+            return []
+        # Rewrite the valid prefix so later appends never follow a torn line
+        with self.lock:
+            self.buffer = [(r[0], json.dumps(r) + "\n") for r in records] + self.buffer
+        self.schedule_commit()
+        return records
+
+    def record(self, seq, start, end, inserted):
+        """Queue an edit for the next group commit."""
+        line = json.dumps([seq, start[0], start[1], end[0], end[1], inserted]) + "\n"
+        with self.lock:
+            self.buffer.append((seq, line))
+        self.schedule_commit()
+
+    def schedule_commit(self):
+        """Group edits arriving within JOURNAL_COMMIT_MS into one append."""
+        if self.commit_id is None and not self.closed:
+            self.commit_id = self.root.after(JOURNAL_COMMIT_MS, self.commit)
+
+    def commit(self):
+        """Hand the buffered edits to the writer thread."""
+        self.commit_id = None
+        self.writer.submit(("journal", self.path), self.write_pending)
+
+    def header(self):
+        """Build the header line for the file as it is on disk now."""
+        return json.dumps({"base": file_signature(self.file_path)}) + "\n"
+
+    def write_pending(self):
+        """Append buffered edits and fsync; runs on the writer thread."""
+        with self.lock:
+            if self.closed or not self.buffer:
+                return
+            lines = [line for _, line in self.buffer]
+            self.buffer = []
+            fresh = self.needs_header
+            self.needs_header = False
+        if fresh:
+            atomic_write(self.path, (self.header() + "".join(lines)).encode("utf-8"))
+            return
+        with open(self.path, "a", encoding="utf-8", newline="\n") as f:
+            f.writelines(lines)
+            f.flush()
+            os.fsync(f.fileno())
+
+    def compact(self, generation):
+        """Drop edits covered by a save of this generation; runs on the writer thread."""
+        with self.lock:
+            if self.closed:
+                return
+            pending = self.buffer
+            self.buffer = []
+            on_disk = not self.needs_header
+        kept = []
+        if on_disk:
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    f.readline()
+                    for line in f:
+                        if json.loads(line)[0] > generation:
+                            kept.append(line)
+            except (OSError, ValueError):
+                pass
+        kept += [line for seq, line in pending if seq > generation]
+        if kept:
+            atomic_write(self.path, (self.header() + "".join(kept)).encode("utf-8"))
+        else:
+            try:
+                os.remove(self.path)
+            except OSError:
+                pass
+        with self.lock:
+            self.needs_header = not kept
+
+    def discard(self):
+        """Stop journaling and delete the journal file."""
+        if self.commit_id is not None:
+            self.root.after_cancel(self.commit_id)
+            self.commit_id = None
+        with self.lock:
+            self.closed = True
+            self.buffer = []
+        self.writer.submit(("journal", self.path), self.remove_file)
+
+    def remove_file(self):
+        """Delete the journal file; runs on the writer thread."""
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+class BackupStore:
+    """Deduplicated, compressed snapshots keyed by the SHA-256 of their content.
+
+    Each snapshot is stored once as <hash>.z; index.json lists when and from
+    which file every snapshot was taken. add() and prune() run on the
+    BackgroundWriter thread, while entries() and read() serve the UI.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.index_path = os.path.join(directory, "index.json")
+        self.lock = threading.Lock()
+        self.index = None  # Loaded on first use
+
+    def load_index(self):
+        """Return the in-memory index, reading it from disk the first time."""
+        if self.index is None:
+            try:
+                with open(self.index_path, "r", encoding="utf-8") as f:
+                    self.index = json.load(f).get("entries", [])
+            except (OSError, ValueError, AttributeError):
+                self.index = []
+        return self.index
+
+    def blob_path(self, digest):
+        """Return the path of a stored snapshot."""
+        return os.path.join(self.directory, f"{digest}.z")
+
+    def entries(self):
+        """Return the snapshot entries, newest first."""
+        with self.lock:
+            return sorted(self.load_index(), key=lambda e: e["time"], reverse=True)
+
+    def read(self, digest):
+        """Return the text of a stored snapshot."""
+        with open(self.blob_path(digest), "rb") as f:
+            return zlib.decompress(f.read()).decode("utf-8")
+
+    def add(self, source, content, max_count, max_age_days, max_total_bytes):
+        """Store a snapshot unless identical content is already kept; then prune."""
+        data = content.encode("utf-8")
+        digest = hashlib.sha256(data).hexdigest()
+        with self.lock:
+            if any(e["hash"] == digest for e in self.load_index()):
+                return False
+        os.makedirs(self.directory, exist_ok=True)
+        packed = zlib.compress(data, 6)
+        atomic_write(self.blob_path(digest), packed)
+        entry = {
+            "hash": digest,
+            "source": os.path.basename(source),
+            "time": time.time(),
+            "size": len(data),
+            "stored": len(packed)
+        }
+        with self.lock:
+            self.index.append(entry)
+            removed = self.apply_retention(max_count, max_age_days, max_total_bytes)
+            snapshot = json.dumps({"entries": self.index}, indent=1)
+        atomic_write(self.index_path, snapshot.encode("utf-8"))
+        for digest in removed:
+            try:
+                os.remove(self.blob_path(digest))
+            except OSError:
+                pass
+        return True
+
+    def apply_retention(self, max_count, max_age_days, max_total_bytes):
+        """Drop the oldest entries beyond the count, age and size limits; return their hashes."""
+        newest_first = sorted(self.index, key=lambda e: e["time"], reverse=True)
+        cutoff = time.time() - max_age_days * 86400
+        kept, removed, total = [], [], 0
+        for i, entry in enumerate(newest_first):
+            total += entry["stored"]
+            if i == 0 or (i < max_count and entry["time"] >= cutoff and total <= max_total_bytes):
+                kept.append(entry)
+            else:
+                removed.append(entry["hash"])
+        self.index = kept
+        return removed
+
+def line_delta(old, new):
+    """Return ops turning the list of lines old into new: [0, i, j] copies old[i:j], [1, lines] inserts."""
+    prefix = 0
+    limit = min(len(old), len(new))
+    while prefix < limit and old[prefix] == new[prefix]:
+        prefix += 1
+    suffix = 0
+    while suffix < limit - prefix and old[-1 - suffix] == new[-1 - suffix]:
+        suffix += 1
+    ops = [[0, 0, prefix]] if prefix else []
+    import difflib
+    middle = difflib.SequenceMatcher(None, old[prefix:len(old) - suffix], new[prefix:len(new) - suffix], autojunk=False)
+    for tag, i1, i2, j1, j2 in middle.get_opcodes():
+        if tag == "equal":
+            ops.append([0, prefix + i1, prefix + i2])
+        elif j2 > j1:
+            ops.append([1, new[prefix + j1:prefix + j2]])
+    if suffix:
+        ops.append([0, len(old) - suffix, len(old)])
+    return ops
+
+def apply_delta(old, ops):
+    """Rebuild a list of lines from old and the ops made by line_delta."""
+    new = []
+    for op in ops:
+        if op[0] == 0:
+            new.extend(old[op[1]:op[2]])
+        else:
+            new.extend(op[1])
+    return new
+
+def delta_hunks(ops, old_count):
+    """Turn line_delta ops into (first, last, lines) replacements of old[first:last], in order."""
+    hunks = []
+    pos = 0  # First old line not yet copied or replaced
+    inserted = []
+    for op in ops:
+        if op[0] == 0:
+            if op[1] > pos or inserted:
+                hunks.append((pos, op[1], inserted))
+            inserted = []
+            pos = op[2]
+        else:
+            inserted = inserted + op[1]
+    if pos < old_count or inserted:
+        hunks.append((pos, old_count, inserted))
+    return hunks
+
+def hunk_edits(hunks, old):
+    """Yield the (start, end, text) text edits making the hunks, last hunk first.
+
+    Applying them in this order keeps the positions of later edits valid.
+    """
+    count = len(old)
+    end = (count, len(old[-1]))
+    for first, last, lines in reversed(hunks):
+        if last < count:
+            yield (first + 1, 0), (last + 1, 0), "".join(line + "\n" for line in lines)
+        elif first == count:
+            yield end, end, "\n" + "\n".join(lines)
+        elif lines:
+            yield (first + 1, 0), end, "\n".join(lines)
+        else:
+            yield (first, len(old[first - 1])) if first else (1, 0), end, ""
+
+class VersionStore:
+    """Per-document version history kept as keyframes plus line deltas in one pack file.
+
+    A pack is a sequence of records: a VERSION_HEADER (time, kind, word count,
+    payload length) followed by a zlib payload holding either the full text
+    (a keyframe) or the line delta from the previous version. A keyframe is
+    written at least every VERSION_KEYFRAME_EVERY versions, so rebuilding any
+    version reads one keyframe and a bounded number of deltas. add() runs on
+    the BackgroundWriter thread; the history window reads from the Tk thread.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.lock = threading.Lock()
+        self.indexes = {}  # pack path -> [(time, kind, words, offset, length)]
+        self.latest = {}  # pack path -> lines of the newest version
+
+    def pack_path(self, file_path):
+        key = hashlib.sha1(os.path.abspath(file_path).encode("utf-8")).hexdigest()[:20]
+        return os.path.join(self.directory, f"{key}.pack")
+
+    def load_index(self, pack):
+        """Return the record index of a pack, scanning its headers the first time."""
+        index = self.indexes.get(pack)
+        if index is not None:
+            return index
+        index = []
+        header_size = VERSION_HEADER.size
+        try:
+            with open(pack, "rb") as f:
+                end = os.fstat(f.fileno()).st_size
+                offset = 0
+                while offset + header_size <= end:
+                    f.seek(offset)
+                    stamp, kind, words, length = VERSION_HEADER.unpack(f.read(header_size))
+                    if offset + header_size + length > end:
+                        break  # Torn write at the tail
+                    index.append((stamp, kind, words, offset + header_size, length))
+                    offset += header_size + length
+            if offset < end:
+                with open(pack, "r+b") as f:
+                    f.truncate(offset)
+        except OSError:
+            pass
+        self.indexes[pack] = index
+        return index
+
+    def versions(self, file_path):
+        """Return [(time, words)] for a document's versions, oldest first."""
+        with self.lock:
+            return [(stamp, words) for stamp, _, words, _, _ in self.load_index(self.pack_path(file_path))]
+
+    def read_payload(self, f, record):
+        f.seek(record[3])
+        return zlib.decompress(f.read(record[4]))
+
+    def read_lines(self, pack, position):
+        """Rebuild version number position from the nearest keyframe at or before it."""
+        index = self.load_index(pack)
+        start = position
+        while index[start][1] != VERSION_KEYFRAME:
+            start -= 1
+        with open(pack, "rb") as f:
+            lines = self.read_payload(f, index[start]).decode("utf-8").split("\n")
+            for record in index[start + 1:position + 1]:
+                lines = apply_delta(lines, json.loads(self.read_payload(f, record)))
+        return lines
+
+    def version_at(self, file_path, when):
+        """Return the text of the newest version saved at or before time when, or None."""
+        pack = self.pack_path(file_path)
+        with self.lock:
+            index = self.load_index(pack)
+            position = bisect.bisect_right([record[0] for record in index], when) - 1
+            if position < 0:
+                return None
+            return "\n".join(self.read_lines(pack, position))
+
+    def add(self, file_path, data, min_interval):
+        """Record saved bytes as a new version unless one was taken within min_interval seconds.
+
+        Returns True if a version was written.
+        """
+        pack = self.pack_path(file_path)
+        now = time.time()
+        with self.lock:
+            index = self.load_index(pack)
+            if index and now - index[-1][0] < min_interval:
+                return False
+            previous = self.latest.get(pack)
+            if previous is None and index:
+                previous = self.read_lines(pack, len(index) - 1)
+        text = data.decode("utf-8", "replace")
+        lines = text.split("\n")
+        if lines == previous:
+            return False
+        words = len(text.split())
+        since_key = 0
+        for record in reversed(index):
+            if record[1] == VERSION_KEYFRAME:
+                break
+            since_key += 1
+        kind, payload = VERSION_KEYFRAME, data
+        if previous is not None and index and since_key + 1 < VERSION_KEYFRAME_EVERY:
+            ops = line_delta(previous, lines)
+            inserted = sum(len(op[1]) for op in ops if op[0])
+            if inserted * 2 < len(lines):
+                kind, payload = VERSION_DELTA, json.dumps(ops, separators=(",", ":")).encode("utf-8")
+        packed = zlib.compress(payload, 6)
+        os.makedirs(self.directory, exist_ok=True)
+        with self.lock:
+            with open(pack, "ab") as f:
+                offset = f.seek(0, os.SEEK_END)
+                f.write(VERSION_HEADER.pack(now, kind, words, len(packed)))
+                f.write(packed)
+                f.flush()
+                os.fsync(f.fileno())
+            index.append((now, kind, words, offset + VERSION_HEADER.size, len(packed)))
+            self.latest[pack] = lines
+        return True
+
+def stats_day(minute):
+    """Return the local calendar day (YYYY-MM-DD) of a minute since the epoch."""
+    return time.strftime("%Y-%m-%d", time.localtime(minute * 60))
+
+def previous_day(day):
+    import datetime
+    return (datetime.date.fromisoformat(day) - datetime.timedelta(days=1)).isoformat()
+
+class StatsStore:
+    """Words added and removed per document and minute, with daily rollups, in SQLite.
+
+    record() only adds an edit's word-count delta to an in-memory batch.
+    flush() runs on the writer thread and folds the batch into the minute
+    table and the per-day rollups in one transaction, and keeps the writing
+    streak up to date, so dashboard() reads a handful of rows however long
+    the history is.
+    """
+
+    SCHEMA = (
+        "CREATE TABLE IF NOT EXISTS edits (minute INTEGER, document TEXT, added INTEGER, removed INTEGER, PRIMARY KEY (minute, document))",
+        "CREATE TABLE IF NOT EXISTS daily (day TEXT, document TEXT, added INTEGER, removed INTEGER, PRIMARY KEY (day, document))",
+        "CREATE TABLE IF NOT EXISTS days (day TEXT PRIMARY KEY, added INTEGER, removed INTEGER, minutes INTEGER)",
+        "CREATE TABLE IF NOT EXISTS summary (key TEXT PRIMARY KEY, value)"
+    )
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.pending = {}  # (minute, document) -> [added, removed]
+        self.writer = None  # Connection used by flush(), on the writer thread
+        self.reader = None  # Connection used by dashboard(), on the Tk thread
+        self.session_minutes = set()
+        self.session_words = 0
+
+    def record(self, document, delta, now=None):
+        """Count an edit that changed the document's word count by delta."""
+        if not delta:
+            return
+        minute = int((time.time() if now is None else now) // 60)
+        with self.lock:
+            counts = self.pending.setdefault((minute, document), [0, 0])
+            counts[0 if delta > 0 else 1] += abs(delta)
+        self.session_minutes.add(minute)
+        self.session_words += delta
+
+    def connect(self):
+        import sqlite3
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=10)
+        conn.execute("PRAGMA journal_mode=WAL")
+        for statement in self.SCHEMA:
+            conn.execute(statement)
+        conn.commit()
+        return conn
+
+    def flush(self):
+        """Write the batch; runs on the writer thread."""
+        with self.lock:
+            batch, self.pending = self.pending, {}
+        if not batch:
+            return
+        if self.writer is None:
+            self.writer = self.connect()
+        conn = self.writer
+        daily = {}
+        days = {}
+        for (minute, document), (added, removed) in batch.items():
+            day = stats_day(minute)
+            for totals, key in ((daily, (day, document)), (days, day)):
+                counts = totals.setdefault(key, [0, 0, 0])
+                counts[0] += added
+                counts[1] += removed
+        with conn:
+            for minute in {minute for minute, document in batch}:
+                if conn.execute("SELECT 1 FROM edits WHERE minute = ? LIMIT 1", (minute,)).fetchone() is None:
+                    days[stats_day(minute)][2] += 1  # A minute spent writing
+            conn.executemany(
+                "INSERT INTO edits VALUES (?, ?, ?, ?) ON CONFLICT (minute, document) DO UPDATE "
+                "SET added = added + excluded.added, removed = removed + excluded.removed",
+                [(minute, document, added, removed) for (minute, document), (added, removed) in batch.items()]
+            )
+            conn.executemany(
+                "INSERT INTO daily VALUES (?, ?, ?, ?) ON CONFLICT (day, document) DO UPDATE "
+                "SET added = added + excluded.added, removed = removed + excluded.removed",
+                [(day, document, added, removed) for (day, document), (added, removed, _) in daily.items()]
+            )
+            conn.executemany(
+                "INSERT INTO days VALUES (?, ?, ?, ?) ON CONFLICT (day) DO UPDATE "
+                "SET added = added + excluded.added, removed = removed + excluded.removed, minutes = minutes + excluded.minutes",
+                [(day, added, removed, minutes) for day, (added, removed, minutes) in days.items()]
+            )
+            self.update_streak(conn, sorted(day for day, counts in days.items() if counts[0] > 0))
+
+    def update_streak(self, conn, days):
+        """Extend the run of consecutive days with words written by the given days."""
+        summary = dict(conn.execute("SELECT key, value FROM summary"))
+        last = summary.get("streak_day")
+        streak = summary.get("streak", 0)
+        best = summary.get("best_streak", 0)
+        for day in days:
+            if last is not None and day <= last:
+                continue
+            streak = streak + 1 if last == previous_day(day) else 1
+            last = day
+            best = max(best, streak)
+        conn.executemany(
+            "INSERT OR REPLACE INTO summary VALUES (?, ?)",
+            [("streak_day", last), ("streak", streak), ("best_streak", best)]
+        )
+
+    def dashboard(self, now=None):
+        """Return the last STATS_DASHBOARD_DAYS days, streaks and session speed, counting unflushed edits."""
+        if self.reader is None:
+            self.reader = self.connect()
+        today = stats_day(int((time.time() if now is None else now) // 60))
+        first = today
+        for _ in range(STATS_DASHBOARD_DAYS - 1):
+            first = previous_day(first)
+        days = {
+            day: [added, removed, minutes]
+            for day, added, removed, minutes in self.reader.execute(
+                "SELECT day, added, removed, minutes FROM days WHERE day BETWEEN ? AND ?", (first, today)
+            )
+        }
+        summary = dict(self.reader.execute("SELECT key, value FROM summary"))
+        with self.lock:
+            pending = list(self.pending.items())
+        pending_minutes = set()
+        for (minute, document), (added, removed) in pending:
+            counts = days.setdefault(stats_day(minute), [0, 0, 0])
+            counts[0] += added
+            counts[1] += removed
+            if minute not in pending_minutes:
+                pending_minutes.add(minute)
+                counts[2] += 1
+        last = summary.get("streak_day")
+        yesterday = previous_day(today)
+        streak = summary.get("streak", 0) if last in (today, yesterday) else 0
+        if days.get(today, [0])[0] > 0 and last != today:
+            streak = streak + 1 if last == yesterday else 1
+        minutes = len(self.session_minutes)
+        return {
+            "today": today,
+            "days": sorted(days.items(), reverse=True),
+            "streak": streak,
+            "best_streak": max(summary.get("best_streak", 0), streak),
+            "session_words": self.session_words,
+            "session_wpm": self.session_words / minutes if minutes else 0.0
+        }
+
+def index_terms(path):
+    """Tokenize a text file into {term: [count, line, col, byte offset of first use]}.
+
+    Offsets count from the end of any byte order mark.
+    """
+    terms = {}
+    with open(path, "rb") as f:
+        reader = TextReader(f)
+        offset = 0
+        for number, line in enumerate(reader.lines(), 1):
+            fmt = reader.format
+            for match in WORD_RE.finditer(line):
+                term = match.group().lower()
+                entry = terms.get(term)
+                if entry is None:
+                    col = match.start()
+                    terms[term] = [1, number, col, offset + len(line[:col].encode(fmt.encoding))]
+                else:
+                    entry[0] += 1
+            offset += len(fmt.encode(line + "\n")) - len(fmt.bom)
+    return terms
+
+class SearchIndex:
+    """Inverted index over the text files in the app folder.
+
+    Each document's terms are persisted as one JSON shard in SEARCH_DIR, so a
+    save only rewrites that document's shard. Shards are loaded and stale
+    files re-indexed on a worker thread; search() runs on the Tk thread.
+    """
+
+    def __init__(self, base_dir, shard_dir, skip=()):
+        self.base_dir = base_dir
+        self.shard_dir = shard_dir
+        self.skip = {os.path.abspath(path) for path in skip}
+        self.lock = threading.Lock()
+        self.files = {}  # relative path -> {"size", "mtime_ns", "terms"}
+        self.postings = {}  # term -> {relative path: [count, line, col, offset]}
+        self.jobs = queue.Queue()
+        self.worker = None
+        self.loaded = False
+        self.pending = 0  # Jobs queued or running
+        self.version = 0  # Bumped whenever results could change
+
+    @property
+    def busy(self):
+        return self.pending > 0
+
+    def start(self):
+        """Start the worker if needed and queue a scan for files changed on disk."""
+        if self.worker is None:
+            self.worker = threading.Thread(target=self.run, daemon=True)
+            self.worker.start()
+        self.queue_job(None)
+
+    def update(self, path):
+        """Re-index one saved file; a no-op until the index has been started."""
+        if self.worker is not None:
+            self.queue_job(path)
+
+    def queue_job(self, path):
+        with self.lock:
+            self.pending += 1
+        self.jobs.put(path)
+
+    def run(self):
+        while True:
+            path = self.jobs.get()
+            try:
+                if not self.loaded:
+                    self.load_shards()
+                if path is None:
+                    self.scan()
+                else:
+                    self.index_file(path)
+            except (OSError, ValueError):
+                pass  # The file vanished or cannot be decoded; the next scan settles it
+            finally:
+                with self.lock:
+                    self.pending -= 1
+                    self.version += 1
+
+    def relative(self, path):
+        return os.path.relpath(os.path.abspath(path), self.base_dir)
+
+    def shard_path(self, rel):
+        return os.path.join(self.shard_dir, hashlib.sha1(rel.encode("utf-8")).hexdigest()[:20] + ".json")
+
+    def load_shards(self):
+        """Read every persisted shard into memory."""
+        self.loaded = True
+        try:
+            names = os.listdir(self.shard_dir)
+        except OSError:
+            return
+        for name in names:
+            try:
+                with open(os.path.join(self.shard_dir, name), "r", encoding="utf-8") as f:
+                    shard = json.load(f)
+                if shard.get("format") == SEARCH_SHARD_FORMAT:
+                    self.merge(shard["path"], shard)
+            except (OSError, ValueError, KeyError, TypeError):
+                continue
+
+    def candidates(self):
+        """Yield the absolute paths of the searchable files under base_dir."""
+        for directory, subdirs, names in os.walk(self.base_dir):
+            subdirs[:] = [d for d in subdirs if not d.startswith(".") and d != "__pycache__"]
+            for name in names:
+                path = os.path.join(directory, name)
+                if name.lower().endswith(SEARCH_EXTENSIONS) and not name.startswith(".") and path not in self.skip:
+                    yield path
+
+    def scan(self):
+        """Index new and changed files (by size and mtime) and drop deleted ones."""
+        seen = set()
+        for path in self.candidates():
+            rel = self.relative(path)
+            seen.add(rel)
+            try:
+                st = os.stat(path)
+                known = self.files.get(rel)
+                if known is None or (known["size"], known["mtime_ns"]) != (st.st_size, st.st_mtime_ns):
+                    self.index_file(path)
+            except (OSError, ValueError):
+                continue  # Vanished, unreadable or mixed-encoding files are left out of the index
+        for rel in set(self.files) - seen:
+            self.merge(rel, None)
+            try:
+                os.remove(self.shard_path(rel))
+            except OSError:
+                pass
+
+    def index_file(self, path):
+        """Tokenize one file, persist its shard and swap it into the index."""
+        st = os.stat(path)
+        shard = {
+            "format": SEARCH_SHARD_FORMAT,
+            "path": self.relative(path),
+            "size": st.st_size,
+            "mtime_ns": st.st_mtime_ns,
+            "terms": index_terms(path)
+        }
+        os.makedirs(self.shard_dir, exist_ok=True)
+        atomic_write(self.shard_path(shard["path"]), json.dumps(shard, separators=(",", ":")).encode("utf-8"))
+        self.merge(shard["path"], shard)
+
+    def merge(self, rel, shard):
+        """Replace a file's postings with those of shard (None removes the file)."""
+        with self.lock:
+            old = self.files.pop(rel, None)
+            if old:
+                for term in old["terms"]:
+                    postings = self.postings.get(term)
+                    if postings:
+                        postings.pop(rel, None)
+                        if not postings:
+                            del self.postings[term]
+            if shard is None:
+                return
+            terms = shard["terms"]
+            self.files[rel] = {"size": shard["size"], "mtime_ns": shard["mtime_ns"], "terms": list(terms)}
+            for term, entry in terms.items():
+                self.postings.setdefault(term, {})[rel] = entry
+
+    def search(self, query, limit=SEARCH_RESULT_LIMIT):
+        """Return up to limit (path, line, col, length, byte offset) hits for files holding every query word.
+
+        Files are ranked by tf-idf; each hit points at the earliest occurrence of a query word.
+        """
+        terms = list(dict.fromkeys(match.group().lower() for match in WORD_RE.finditer(query)))
+        if not terms:
+            return []
+        with self.lock:
+            lists = [self.postings.get(term, {}) for term in terms]
+            if not all(lists):
+                return []
+            total = len(self.files)
+            order = sorted(range(len(terms)), key=lambda i: len(lists[i]))
+            ranked = []
+            for rel in lists[order[0]]:
+                entries = [lists[i].get(rel) for i in order]
+                if None in entries:
+                    continue
+                score = sum(
+                    (1 + math.log(entry[0])) * math.log(1 + total / len(lists[i]))
+                    for i, entry in zip(order, entries)
+                )
+                first = min(zip(entries, order), key=lambda pair: pair[0][3])
+                ranked.append((score, rel, first[0], len(terms[first[1]])))
+        ranked.sort(key=lambda hit: -hit[0])
+        return [
+            (os.path.join(self.base_dir, rel), entry[1], entry[2], length, entry[3])
+            for _, rel, entry, length in ranked[:limit]
+        ]
+
+    @staticmethod
+    def snippet(path, offset, width=SEARCH_SNIPPET_CHARS):
+        """Return about width characters of a file's text around an index_terms offset, on one line."""
+        try:
+            with open(path, "rb") as f:
+                fmt = sniff_format(f.read(LOAD_CHUNK_BYTES))
+                unit = len("\n".encode(fmt.encoding))  # Offsets are whole code units
+                back = min(offset, width * 2 * unit)
+                f.seek(len(fmt.bom) + offset - back)
+                before = f.read(back).decode(fmt.encoding, "ignore")
+                after = f.read(width * 4 * unit).decode(fmt.encoding, "ignore")
+        except OSError:
+            return ""
+        before = before.replace("\r", " ").replace("\n", " ")[-(width // 3):]
+        after = after.replace("\r", " ").replace("\n", " ")
+        return (before + after)[:width].strip()
+
+class ExportCancelled(Exception):
+    pass
+
+def export_lines(path, progress):
+    """Yield the lines of a file without their line endings, reporting bytes read."""
+    with open(path, "rb") as f:
+        tail = ""
+        done = 0
+        for text in TextReader(f):
+            progress(f.tell() - done)
+            done = f.tell()
+            lines = (tail + text).split("\n")
+            tail = lines.pop()
+            for line in lines:
+                yield line.rstrip("\r")
+        if tail:
+            yield tail.rstrip("\r")
+
+def export_blocks(lines, markdown):
+    """Group lines into (kind, lines) blocks: "h", "p", "quote" or "code".
+
+    Plain text only has paragraphs, separated by blank lines; Markdown also
+    has headings, block quotes and fenced code.
+    """
+    block = []
+    kind = "p"
+    fence = None
+    for line in lines:
+        if fence:
+            if line.lstrip().startswith(fence):
+                yield "code", block
+                block, kind, fence = [], "p", None
+            else:
+                block.append(line)
+            continue
+        if not line.strip():
+            if block:
+                yield kind, block
+            block, kind = [], "p"
+            continue
+        if markdown:
+            opening = MD_FENCE_RE.match(line)
+            if opening or MD_HEADING_RE.match(line):
+                if block:
+                    yield kind, block
+                block, kind = [], "p"
+                if opening:
+                    fence = opening.group(1)[:3]
+                else:
+                    yield "h", [line]
+                continue
+            quote = MD_QUOTE_RE.match(line) is not None
+            if block and quote != (kind == "quote"):
+                yield kind, block
+                block = []
+            kind = "quote" if quote else "p"
+        block.append(line)
+    if block or fence:
+        yield ("code" if fence else kind), block
+
+def export_inline(text):
+    """Escape text for (X)HTML and convert Markdown code spans and emphasis."""
+
+    def convert(match):
+        marker = match.group(1) or match.group(2) or match.group()[0]
+        inner = match.group()[len(marker):-len(marker)]
+        tag = "code" if match.group(1) else "strong" if match.group(2) else "em"
+        return f"<{tag}>{inner}</{tag}>"
+
+    return MD_INLINE_RE.sub(convert, html.escape(text, quote=False))
+
+def export_html_block(kind, lines, markdown):
+    """Render one block as (X)HTML."""
+    if kind == "code":
+        return "<pre><code>" + html.escape("\n".join(lines), quote=False) + "</code></pre>\n"
+    if kind == "h":
+        level = len(MD_HEADING_RE.match(lines[0]).group(1))
+        return f"<h{level}>{export_inline(lines[0].strip().strip('#').strip())}</h{level}>\n"
+    if kind == "quote":
+        lines = [MD_QUOTE_RE.sub("", line, count=1).strip() for line in lines]
+        return "<blockquote><p>" + export_inline(" ".join(lines)) + "</p></blockquote>\n"
+    if markdown:
+        return "<p>" + export_inline(" ".join(line.strip() for line in lines)) + "</p>\n"
+    return "<p>" + "<br />\n".join(html.escape(line, quote=False) for line in lines) + "</p>\n"
+
+def export_chapters(paths, progress):
+    """Yield (title, markdown, blocks) per file; blocks is a generator over the file's paragraphs.
+
+    The title is the file's first heading when it opens with one, else its name.
+    """
+    for path in paths:
+        markdown = path.lower().endswith(MARKDOWN_EXTENSIONS)
+        blocks = export_blocks(export_lines(path, progress), markdown)
+        first = next(blocks, None)
+        title = os.path.splitext(os.path.basename(path))[0]
+        if first and first[0] == "h":
+            title = first[1][0].strip().strip("#").strip() or title
+        yield title, markdown, itertools.chain([first] if first else [], blocks)
+
+def export_documents(paths, out_path, fmt, title=None, progress=None, cancelled=None):
+    """Export files to one HTML, combined Markdown or EPUB file, a paragraph at a time.
+
+    progress(fraction) is called as the sources are read; cancelled() is polled
+    between paragraphs and aborts the export, leaving out_path untouched.
+    """
+    import zipfile
+    total = sum(os.path.getsize(path) for path in paths) or 1
+    done = 0
+    title = title or os.path.splitext(os.path.basename(out_path))[0]
+
+    def advance(size):
+        nonlocal done
+        done += size
+        if cancelled and cancelled():
+            raise ExportCancelled()
+        if progress:
+            progress(done / total)
+
+    chapters = export_chapters(paths, advance)
+    tmp_path = temp_path_for(out_path)
+    try:
+        if fmt == "epub":
+            spine = []
+            with zipfile.ZipFile(tmp_path, "w", zipfile.ZIP_DEFLATED) as book:
+                book.writestr(zipfile.ZipInfo("mimetype"), "application/epub+zip", compress_type=zipfile.ZIP_STORED)
+                book.writestr("META-INF/container.xml", EPUB_CONTAINER)
+                for number, (chapter_title, markdown, blocks) in enumerate(chapters, 1):
+                    name = "chapter-%03d.xhtml" % number
+                    spine.append((name, chapter_title))
+                    with book.open("OEBPS/" + name, "w") as raw, io_text(raw) as out:
+                        out.write(EPUB_PAGE_HEAD.format(title=html.escape(chapter_title)))
+                        for kind, lines in blocks:
+                            out.write(export_html_block(kind, lines, markdown))
+                        out.write("</body>\n</html>\n")
+                book.writestr("OEBPS/nav.xhtml", epub_nav(spine))
+                book.writestr("OEBPS/content.opf", epub_package(title, spine))
+        else:
+            with open(tmp_path, "w", encoding="utf-8", newline="\n") as out:
+                if fmt == "html":
+                    out.write(f"<!DOCTYPE html>\n<html>\n<head>\n<meta charset=\"utf-8\" />\n<title>{html.escape(title)}</title>\n<style>{EXPORT_CSS}</style>\n</head>\n<body>\n")
+                for number, (chapter_title, markdown, blocks) in enumerate(chapters):
+                    if fmt == "html":
+                        out.write("<section>\n")
+                        for kind, lines in blocks:
+                            out.write(export_html_block(kind, lines, markdown))
+                        out.write("</section>\n")
+                        continue
+                    if number:
+                        out.write("\n")
+                    for kind, lines in blocks:
+                        if kind == "code":
+                            lines = ["```"] + lines + ["```"]
+                        out.write("\n".join(lines) + "\n\n")
+                if fmt == "html":
+                    out.write("</body>\n</html>\n")
+        os.replace(tmp_path, out_path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+def io_text(raw):
+    """Wrap a binary stream, such as a zip member, for writing UTF-8 text."""
+    import io
+    return io.TextIOWrapper(raw, encoding="utf-8", newline="\n")
+
+EPUB_CONTAINER = """<?xml version="1.0" encoding="UTF-8"?>
+<container version="1.0" xmlns="urn:oasis:names:tc:opendocument:xmlns:container">
+<rootfiles><rootfile full-path="OEBPS/content.opf" media-type="application/oebps-package+xml"/></rootfiles>
+</container>
+"""
+
+EPUB_PAGE_HEAD = """<?xml version="1.0" encoding="UTF-8"?>
+<!DOCTYPE html>
+<html xmlns="http://www.w3.org/1999/xhtml" xmlns:epub="http://www.idpf.org/2007/ops">
+<head><title>{title}</title></head>
+<body>
+"""
+
+def epub_nav(spine):
+    """Return the EPUB 3 navigation document listing the chapters."""
+    items = "".join(f'<li><a href="{name}">{html.escape(title)}</a></li>\n' for name, title in spine)
+    return EPUB_PAGE_HEAD.format(title="Contents") + f'<nav epub:type="toc"><ol>\n{items}</ol></nav>\n</body>\n</html>\n'
+
+def epub_package(title, spine):
+    """Return the OPF package document: metadata, manifest and reading order."""
+    import uuid
+    modified = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+    manifest = "".join(f'<item id="c{i}" href="{name}" media-type="application/xhtml+xml"/>\n' for i, (name, _) in enumerate(spine))
+    itemrefs = "".join(f'<itemref idref="c{i}"/>\n' for i in range(len(spine)))
+    return f"""<?xml version="1.0" encoding="UTF-8"?>
+<package xmlns="http://www.idpf.org/2007/opf" version="3.0" unique-identifier="id">
+<metadata xmlns:dc="http://purl.org/dc/elements/1.1/">
+<dc:identifier id="id">urn:uuid:{uuid.uuid4()}</dc:identifier>
+<dc:title>{html.escape(title)}</dc:title>
+<dc:language>en</dc:language>
+<meta property="dcterms:modified">{modified}</meta>
+</metadata>
+<manifest>
+<item id="nav" href="nav.xhtml" media-type="application/xhtml+xml" properties="nav"/>
+{manifest}</manifest>
+<spine>
+{itemrefs}</spine>
+</package>
+"""
+
+class ExportJob:
+    """Run export_documents on its own thread so the Tk thread can show progress and cancel."""
+
+    def __init__(self, paths, out_path, fmt, title=None, before=None):
+        self.fraction = 0.0
+        self.error = None
+        self.done = False
+        self.cancel_event = threading.Event()
+        self.args = (paths, out_path, fmt, title)
+        self.before = before  # Run first on the thread, e.g. to wait for pending saves
+        threading.Thread(target=self.run, daemon=True).start()
+
+    def run(self):
+        try:
+            if self.before:
+                self.before()
+            export_documents(*self.args, progress=self.set_fraction, cancelled=self.cancel_event.is_set)
+        except ExportCancelled:
+            pass
+        except (OSError, ValueError) as e:
+            self.error = e
+        finally:
+            self.done = True
+
+    def set_fraction(self, fraction):
+        self.fraction = fraction
+
+    def cancel(self):
+        self.cancel_event.set()
+
+    @property
+    def cancelled(self):
+        return self.cancel_event.is_set()
+
+class LargeDocument:
+    """A memory-mapped file edited through a line-level piece table.
+
+    Only a window of lines lives in the text area at a time. Lines nobody
+    touched stay in the mapped file; committed windows become "add" pieces
+    that replace ranges of original lines, and are merged back on save.
+    Pieces are immutable tuples, so a copy of the list is a safe snapshot
+    for the writer thread.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.edit_log = []  # (first, last, lines) since the file was mapped
+        self.window_start = 0
+        self.window_len = 0
+        self.saving = False
+        self.released = False
+        self.newline = None  # Detected from the first line break when first mapped
+        self.open_map()
+
+    def open_map(self):
+        """Map the file and build a sparse index of newline counts per block."""
+        self.file = open(self.path, "rb")
+        self.size = os.fstat(self.file.fileno()).st_size
+        # Empty files cannot be mapped; bytes offers the same read interface
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ) if self.size else b""
+        # block_lines[i] = newlines before byte i * LARGE_INDEX_BLOCK
+        self.block_lines = array("Q", [0])
+        newlines = 0
+        for start in range(0, self.size, LARGE_INDEX_BLOCK):
+            newlines += self.map[start:start + LARGE_INDEX_BLOCK].count(b"\n")
+            self.block_lines.append(newlines)
+        self.file_lines = newlines + 1
+        if self.newline is None:
+            first_end = self.map.find(b"\n")
+            self.newline = "\r\n" if first_end > 0 and self.map[first_end - 1] == 13 else "\n"
+        self.pieces = [("orig", 0, self.file_lines)]
+        self.total = self.file_lines
+
+    def close(self):
+        """Unmap the file."""
+        if isinstance(self.map, mmap.mmap):
+            self.map.close()
+        self.file.close()
+
+    def line_start(self, line):
+        """Byte offset where a 0-based original line starts (size + 1 past the end)."""
+        if line <= 0:
+            return 0
+        if line >= self.file_lines:
+            return self.size + 1
+        block = bisect.bisect_left(self.block_lines, line) - 1
+        pos = block * LARGE_INDEX_BLOCK
+        for _ in range(line - self.block_lines[block]):
+            pos = self.map.find(b"\n", pos) + 1
+        return pos
+
+    def original_lines(self, first, last):
+        """Decode original lines first..last-1."""
+        if first >= last:
+            return []
+        data = self.map[self.line_start(first):self.line_start(last) - 1]
+        lines = data.decode("utf-8", errors="replace").split("\n")
+        if self.newline == "\r\n":
+            lines = [line[:-1] if line.endswith("\r") else line for line in lines]
+        return lines
+
+    @staticmethod
+    def piece_len(piece):
+        """Number of lines in a piece."""
+        return piece[2] - piece[1] if piece[0] == "orig" else len(piece[1])
+
+    @staticmethod
+    def slice_piece(piece, i, j):
+        """Lines i..j-1 of a piece, as a new piece."""
+        if piece[0] == "orig":
+            return ("orig", piece[1] + i, piece[1] + j)
+        return ("add", piece[1][i:j])
+
+    def get_lines(self, first, last):
+        """Return logical lines first..last-1."""
+        out, pos = [], 0
+        for piece in self.pieces:
+            n = self.piece_len(piece)
+            lo, hi = max(first, pos), min(last, pos + n)
+            if lo < hi:
+                if piece[0] == "orig":
+                    out.extend(self.original_lines(piece[1] + lo - pos, piece[1] + hi - pos))
+                else:
+                    out.extend(piece[1][lo - pos:hi - pos])
+            pos += n
+            if pos >= last:
+                break
+        return out
+
+    def replace_lines(self, first, last, lines):
+        """Replace logical lines first..last-1 with new lines."""
+        before, after, pos = [], [], 0
+        for piece in self.pieces:
+            n = self.piece_len(piece)
+            if pos < first:
+                before.append(self.slice_piece(piece, 0, min(n, first - pos)))
+            if pos + n > last:
+                after.append(self.slice_piece(piece, max(0, last - pos), n))
+            pos += n
+        middle = [("add", tuple(lines))]
+        self.pieces = [p for p in before + middle + after if self.piece_len(p)]
+        self.total += len(lines) - (last - first)
+        self.edit_log.append((first, last, tuple(lines)))
+
+    def snapshot(self):
+        """Return (pieces, edit log position) for a background save."""
+        return list(self.pieces), len(self.edit_log)
+
+    def write_copy(self, pieces, tmp_path):
+        """Stream a snapshot to tmp_path and fsync it; runs on the writer thread."""
+        newline = self.newline.encode("ascii")
+        with open(tmp_path, "wb") as f:
+            for i, piece in enumerate(pieces):
+                if i:
+                    f.write(newline)
+                if piece[0] == "orig":
+                    start, end = self.line_start(piece[1]), self.line_start(piece[2]) - 1
+                    if piece[2] < self.file_lines and self.newline == "\r\n" and self.map[end - 1] == 13:
+                        end -= 1  # The separator written before the next piece restores it
+                    for offset in range(start, end, 1024 * 1024):
+                        f.write(self.map[offset:min(end, offset + 1024 * 1024)])
+                else:
+                    for offset in range(0, len(piece[1]), 1000):
+                        if offset:
+                            f.write(newline)
+                        chunk = piece[1][offset:offset + 1000]
+                        f.write(self.newline.join(chunk).encode("utf-8"))
+            f.flush()
+            os.fsync(f.fileno())
+
+    def finish_save(self, tmp_path, target, log_position):
+        """Swap the written copy into place and remap it, keeping later edits."""
+        self.saving = False
+        self.close()
+        try:
+            os.replace(tmp_path, target)
+        except OSError:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            if not self.released:
+                self.open_map()
+                self.replay(self.edit_log)
+            raise
+        if self.released:
+            return
+        self.path = target
+        pending = self.edit_log[log_position:]
+        self.open_map()
+        self.replay(pending)
+
+    def replay(self, edits):
+        """Re-apply logged line replacements after remapping."""
+        self.edit_log = []
+        for first, last, lines in edits:
+            self.replace_lines(first, last, lines)
+
+    def release(self):
+        """Close the document once any save in flight has finished."""
+        self.released = True
+        if not self.saving:
+            self.close()
+
+class BackgroundWriter:
+    """Run disk writes on one worker thread, keeping only the newest job per key."""
+
+    def __init__(self, root, poll_ms=50):
+        self.root = root
+        self.poll_ms = poll_ms
+        self.lock = threading.Condition()
+        self.pending = {}  # key -> (job, on_done), oldest first
+        self.outstanding = 0  # Pending plus running jobs
+        self.results = queue.Queue()
+        self.poll_id = None
+        threading.Thread(target=self.run, daemon=True).start()
+
+    def submit(self, key, job, on_done=None):
+        """Queue job() for the worker; on_done(error) is later called on the Tk thread.
+
+        A job still pending under the same key is replaced and its on_done is
+        never called, so the newer job's callback must stand in for it. Saves
+        of one file do; reloads and large-file saves never queue a second job
+        while one is outstanding.
+        """
+        with self.lock:
+            if key in self.pending:
+                del self.pending[key]
+            else:
+                self.outstanding += 1
+            self.pending[key] = (job, on_done)
+            self.lock.notify_all()
+        if self.poll_id is None:
+            self.poll_id = self.root.after(self.poll_ms, self.poll)
+
+    def run(self):
+        """Worker loop: take the oldest pending job and run it."""
+        while True:
+            with self.lock:
+                while not self.pending:
+                    self.lock.wait()
+                key = next(iter(self.pending))
+                job, on_done = self.pending.pop(key)
+            try:
+                job()
+                error = None
+            except Exception as e:
+                error = e
+            self.results.put((on_done, error))
+            with self.lock:
+                self.outstanding -= 1
+                self.lock.notify_all()
+
+    def poll(self):
+        """Deliver finished jobs to their callbacks on the Tk thread."""
+        self.poll_id = None
+        while True:
+            try:
+                on_done, error = self.results.get_nowait()
+            except queue.Empty:
+                break
+            if on_done:
+                on_done(error)
+        with self.lock:
+            busy = self.outstanding > 0
+        if busy or not self.results.empty():
+            self.poll_id = self.root.after(self.poll_ms, self.poll)
+
+    def drain(self):
+        """Run finished callbacks without rescheduling, e.g. after the window closed."""
+        while True:
+            try:
+                on_done, error = self.results.get_nowait()
+            except queue.Empty:
+                return
+            if on_done:
+                try:
+                    on_done(error)
+                except tk.TclError:
+                    pass
+
+    def wait_idle(self, timeout=10):
+        """Block until every queued job has run, or the timeout passes."""
+        deadline = time.monotonic() + timeout
+        with self.lock:
+            while self.outstanding > 0:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self.lock.wait(remaining)
+        return True
+
+class TextFormat:
+    """A file's encoding, byte order mark and line break style, for writing its text back the same way."""
+
+    def __init__(self, encoding="utf-8", newline="\n", bom=b""):
+        self.encoding = encoding
+        self.newline = newline
+        self.bom = bom
+
+    @property
+    def plain(self):
+        """Whether this is the editor's own format: UTF-8 without a BOM, with LF line breaks."""
+        return self.encoding == "utf-8" and self.newline == "\n" and not self.bom
+
+    def encode(self, text):
+        """Return text with LF line breaks as the file's bytes."""
+        if self.newline != "\n":
+            text = text.replace("\n", self.newline)
+        return self.bom + text.encode(self.encoding)
+
+def single_byte_encoding(data):
+    """Return Windows-1252 if it decodes data, else Latin-1, which decodes anything."""
+    try:
+        data.decode("cp1252")
+        return "cp1252"
+    except UnicodeDecodeError:
+        return "latin-1"
+
+def sniff_format(prefix, final=False):
+    """Guess the encoding and BOM of a file from its first bytes; final when they are all of it."""
+    for bom, encoding in TEXT_BOMS:
+        if prefix.startswith(bom):
+            return TextFormat(encoding, bom=bom)
+    sample = prefix[:4096]
+    even, odd = sample[0::2].count(0), sample[1::2].count(0)
+    if odd > len(sample) // 2 * UTF16_NUL_SHARE and even * 10 < odd:
+        return TextFormat("utf-16-le")
+    if even > len(sample) // 2 * UTF16_NUL_SHARE and odd * 10 < even:
+        return TextFormat("utf-16-be")
+    try:
+        codecs.getincrementaldecoder("utf-8")().decode(prefix, final)  # Unless final, a character may be cut off
+        return TextFormat()
+    except UnicodeDecodeError:
+        return TextFormat(single_byte_encoding(prefix))
+
+def newline_style(text):
+    """Return the most common line break in text: CRLF, CR, or LF (also when there are none)."""
+    crlf = text.count("\r\n")
+    cr = text.count("\r") - crlf
+    lf = text.count("\n") - crlf
+    if crlf and crlf >= max(cr, lf):
+        return "\r\n"
+    return "\r" if cr > lf else "\n"
+
+class TextReader:
+    """Decode a binary file chunk by chunk, detecting its TextFormat from the first chunk.
+
+    Iterating yields text in which the detected line breaks are LF; other
+    line breaks are left alone, so format.encode() gives back the original
+    bytes unless a file mixes styles. When a later chunk does not decode,
+    reading switches to a single-byte encoding if that reads everything
+    before the same way (UTF-8 that was ASCII so far, or Windows-1252 that
+    had no bytes where it differs from Latin-1); otherwise it raises
+    UnicodeDecodeError.
+    """
+
+    def __init__(self, f, chunk_bytes=LOAD_CHUNK_BYTES):
+        self.f = f
+        self.chunk_bytes = chunk_bytes
+        self.format = None  # Known once iteration starts
+
+    def lines(self):
+        """Yield the file's lines without their LF line breaks."""
+        tail = ""
+        for text in self:
+            lines = (tail + text).split("\n")
+            tail = lines.pop()
+            yield from lines
+        if tail:
+            yield tail
+
+    def __iter__(self):
+        raw = self.f.read(self.chunk_bytes)
+        fmt = self.format = sniff_format(raw, final=len(raw) < self.chunk_bytes)
+        raw = raw[len(fmt.bom):]
+        decoder = codecs.getincrementaldecoder(fmt.encoding)()
+        held = b""  # Bytes the decoder keeps as the start of an unfinished character
+        ascii_so_far = True  # Of the bytes decoded so far, not counting held ones
+        c1_so_far = False
+        carry = ""  # A CR that may be the first half of a CRLF
+        first = True
+        while True:
+            final = not raw
+            try:
+                text = decoder.decode(raw, final)
+            except UnicodeDecodeError:
+                raw = held + raw  # Decoded afresh, along with what the old decoder held
+                if fmt.encoding == "utf-8" and ascii_so_far and not fmt.bom:
+                    fmt.encoding = single_byte_encoding(raw)
+                elif fmt.encoding == "cp1252" and not c1_so_far:
+                    fmt.encoding = "latin-1"
+                else:
+                    raise
+                decoder = codecs.getincrementaldecoder(fmt.encoding)()
+                text = decoder.decode(raw, final)
+                held = b""
+            pending = decoder.getstate()[0]
+            if ascii_so_far and not raw.isascii():
+                ascii_so_far = (held + raw)[:len(held) + len(raw) - len(pending)].isascii()
+            held = pending
+            if fmt.encoding == "cp1252" and not c1_so_far:
+                c1_so_far = bool(raw.translate(None, NON_C1_BYTES))
+            if first:
+                fmt.newline = newline_style(text if final or not text.endswith("\r") else text[:-1])
+                first = False
+            if fmt.newline != "\n":
+                text = carry + text
+                carry = "\r" if fmt.newline == "\r\n" and not final and text.endswith("\r") else ""
+                text = text[:len(text) - len(carry)].replace(fmt.newline, "\n")
+            if text:
+                yield text
+            if final:
+                return
+            raw = self.f.read(self.chunk_bytes)
+
+class FileLoader:
+    """Read a text file on a worker thread and feed it to the Tk thread in batches.
+
+    The worker also counts the words of every line, so the text area does not
+    have to be recounted once the last batch is in. Given the block stats and
+    counts file of a previous session, blocks whose checksum still matches
+    reuse their stored counts. The file's TextFormat is detected as it is
+    read.
+    """
+
+    def __init__(self, root, path, on_chunk, on_done, known=None):
+        self.root = root
+        self.path = path
+        self.on_chunk = on_chunk  # on_chunk(text, fraction)
+        self.on_done = on_done  # on_done(line_counts, error)
+        self.known = known  # (blocks, counts path) from the session, or None
+        self.blocks = []  # [crc32, words] per block, complete when on_done runs
+        self.format = None  # Set when on_done runs
+        self.reused_blocks = 0
+        self.queue = queue.Queue(maxsize=8)
+        self.cancelled = threading.Event()
+        self.pump_id = None
+
+    def start(self):
+        """Start reading and pumping batches into the event loop."""
+        threading.Thread(target=self.run, daemon=True).start()
+        self.pump_id = self.root.after(1, self.pump)
+
+    def cancel(self):
+        """Stop reading; no further callbacks are made."""
+        self.cancelled.set()
+        if self.pump_id is not None:
+            self.root.after_cancel(self.pump_id)
+            self.pump_id = None
+
+    def put(self, item):
+        """Queue an item for the Tk thread unless the load was cancelled."""
+        while not self.cancelled.is_set():
+            try:
+                self.queue.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+
+    def count_block(self, lines, counts, known_blocks, known_counts):
+        """Checksum one block of lines and append its word counts, reusing stored ones if it is unchanged."""
+        index = len(self.blocks)
+        crc = zlib.crc32("\n".join(lines).encode("utf-8"))
+        start = index * SESSION_BLOCK_LINES
+        if (known_counts is not None and index < len(known_blocks) and known_blocks[index][0] == crc
+                and len(known_counts) >= start + len(lines)):
+            block_counts = known_counts[start:start + len(lines)]
+            self.reused_blocks += 1
+        else:
+            block_counts = [len(line.split()) for line in lines]
+        counts.extend(block_counts)
+        self.blocks.append([crc, sum(block_counts)])
+
+    def run(self):
+        """Worker: read chunks, count words per line in blocks and queue the text."""
+        counts = []
+        pieces = []  # Parts of the line still being read
+        block = []  # Complete lines not yet counted
+        known_blocks, known_counts = [], None
+        if self.known:
+            known_blocks, known_counts = self.known[0], read_line_counts(self.known[1])
+        try:
+            with open(self.path, "rb") as f:
+                size = max(1, os.fstat(f.fileno()).st_size)
+                reader = TextReader(f)
+                for text in reader:
+                    if self.cancelled.is_set():
+                        break
+                    lines = text.split("\n")
+                    if len(lines) > 1:
+                        pieces.append(lines[0])
+                        block.append("".join(pieces))
+                        block.extend(lines[1:-1])
+                        pieces = []
+                        while len(block) >= SESSION_BLOCK_LINES:
+                            self.count_block(block[:SESSION_BLOCK_LINES], counts, known_blocks, known_counts)
+                            del block[:SESSION_BLOCK_LINES]
+                    pieces.append(lines[-1])
+                    self.put(("chunk", text, min(1.0, f.tell() / size)))
+            self.format = reader.format
+            block.append("".join(pieces))
+            self.count_block(block, counts, known_blocks, known_counts)
+            self.put(("done", counts, None))
+        except (OSError, UnicodeDecodeError) as e:
+            self.put(("done", None, e))
+
+    def pump(self):
+        """Hand queued chunks to on_chunk within the frame budget, then yield."""
+        self.pump_id = None
+        deadline = time.perf_counter() + LOAD_FRAME_BUDGET
+        while time.perf_counter() < deadline:
+            try:
+                kind, payload, extra = self.queue.get_nowait()
+            except queue.Empty:
+                self.pump_id = self.root.after(5, self.pump)
+                return
+            if kind == "done":
+                self.on_done(payload, extra)
+                return
+            self.on_chunk(payload, extra)
+            if self.cancelled.is_set():
+                return
+        self.pump_id = self.root.after(1, self.pump)
+
+class AutosaveScheduler:
+    """Save the current file from the Tk event loop, only when it has changed."""
+
+    def __init__(self, app):
+        self.app = app
+        self.saves_done = 0
+        self.saves_skipped = 0
+        self.tick_id = None
+        self.debounce_id = None
+
+    def start(self):
+        """Start the periodic tick if it is not already running."""
+        if self.tick_id is None:
+            self.schedule_tick()
+
+    def schedule_tick(self):
+        """Queue the next tick, re-reading the interval so settings changes apply."""
+        interval = max(1, int(self.app.settings.get("autosave_interval", 10)))
+        self.tick_id = self.app.root.after(interval * 1000, self.tick)
+
+    def tick(self):
+        """Periodic save that bounds how long edits can stay unsaved."""
+        self.schedule_tick()
+        app = self.app
+        if app.current_file and app.autosave_enabled and not app.document.dirty:
+            self.saves_skipped += 1  # The old fixed-interval loop rewrote the file here
+        self.flush()
+
+    def note_edit(self):
+        """Restart the debounce timer after the document changed."""
+        if self.debounce_id is not None:
+            self.app.root.after_cancel(self.debounce_id)
+        self.debounce_id = self.app.root.after(AUTOSAVE_DEBOUNCE_MS, self.flush)
+
+    def flush(self):
+        """Save now if anything changed since the last save."""
+        if self.debounce_id is not None:
+            self.app.root.after_cancel(self.debounce_id)
+            self.debounce_id = None
+        app = self.app
+        if not (app.current_file and app.autosave_enabled):
+            return
+        if not app.document.dirty:
+            return
+        app.save_file(app.current_file)
+        self.saves_done += 1
+
+    def counters(self):
+        """Return the save counts since launch for the latency overlay and export."""
+        return {"saves_done": self.saves_done, "saves_skipped": self.saves_skipped}
+
+def merge_ranges(ranges):
+    """Sort inclusive (first, last) line ranges, joining those that overlap or touch."""
+    merged = []
+    for first, last in sorted(ranges):
+        if merged and first <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], last))
+        else:
+            merged.append((first, last))
+    return merged
+
+def shift_ranges(ranges, first, old_last, new_last):
+    """Follow an edit that turned lines first..old_last into first..new_last.
+
+    Lines after the edit move with it, and the edited lines join the result.
+    """
+    shift = new_last - old_last
+    shifted = [(first, new_last)]
+    for a, b in ranges:
+        if b < first:
+            shifted.append((a, b))
+        elif a > old_last:
+            shifted.append((a + shift, b + shift))
+        else:
+            shifted.append((min(a, first), b + shift if b > old_last else first))
+    return merge_ranges(shifted)
+
+def take_ranges(ranges, limit):
+    """Split ranges into (the first limit lines, the rest)."""
+    taken = []
+    for i, (first, last) in enumerate(ranges):
+        if limit <= 0:
+            return taken, ranges[i:]
+        if last - first + 1 > limit:
+            taken.append((first, first + limit - 1))
+            return taken, [(first + limit, last)] + ranges[i + 1:]
+        taken.append((first, last))
+        limit -= last - first + 1
+    return taken, []
+
+def misspelled_spans(text, words, personal=()):
+    """Return (start, end) columns of the words in a line found in neither word set.
+
+    Both sets hold lowercase words. Single letters and all-caps words are
+    skipped, and a possessive "'s" is tried without its suffix.
+    """
+    spans = []
+    for match in SPELL_WORD_RE.finditer(text):
+        word = match.group()
+        if len(word) < 2 or word.isupper():
+            continue
+        word = word.lower().replace("’", "'")
+        if word in words or word in personal:
+            continue
+        if word.endswith("'s") and (word[:-2] in words or word[:-2] in personal):
+            continue
+        spans.append(match.span())
+    return spans
+
+def markdown_state(text, state):
+    """Return the lexer state after a line that started in state."""
+    if "`" not in text[:4] and "~" not in text[:4]:
+        return state
+    fence = MD_FENCE_RE.match(text)
+    if not fence:
+        return state
+    kind = MD_FENCES.index(fence.group(1)[0]) + 1
+    if state == 0:
+        return kind
+    return 0 if kind == state else state
+
+def markdown_line(text, state):
+    """Return [(tag, start, end)] spans for a line that started in state."""
+    if state or markdown_state(text, state):
+        return [("md_code", 0, len(text))]
+    spans = []
+    heading = MD_HEADING_RE.match(text)
+    if heading:
+        spans.append(("md_h%d" % min(3, len(heading.group(1))), 0, len(text)))
+    elif MD_QUOTE_RE.match(text):
+        spans.append(("md_quote", 0, len(text)))
+    for match in MD_INLINE_RE.finditer(text):
+        tag = "md_code" if match.group(1) else "md_bold" if match.group(2) else "md_italic"
+        spans.append((tag, match.start(), match.end()))
+    return spans
+
+class MarkdownStyler:
+    """Style Markdown files with text tags, lexing only what an edit can have changed.
+
+    states holds the lexer state at the start of every line and styled flags
+    the lines whose tags are current. An edit re-lexes its lines, then the
+    following ones until a line starts in the state it had before; tags are
+    only applied to unstyled lines once they are visible.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.active = False  # Styling the current text area
+        self.states = bytearray()
+        self.styled = bytearray()
+        self.style_id = None
+
+    @property
+    def enabled(self):
+        path = self.app.active.path
+        return bool(self.app.settings.get("markdown_styling", False) and path and path.lower().endswith(MARKDOWN_EXTENSIONS))
+
+    def reset(self):
+        """Lex the whole text area afresh, or drop the styling if it does not apply."""
+        app = self.app
+        self.active = self.enabled
+        if not self.active:
+            self.states = bytearray()
+            self.styled = bytearray()
+            for tag in MARKDOWN_TAGS:
+                app.text_area.tag_remove(tag, "1.0", "end")
+            return
+        lines = app.text_area.get("1.0", "end-1c").split("\n")
+        states = bytearray(len(lines))
+        state = 0
+        for i, text in enumerate(lines):
+            states[i] = state
+            state = markdown_state(text, state)
+        self.states = states
+        self.styled = bytearray(len(lines))
+        self.schedule()
+
+    def resync(self):
+        """Start over if the text area's line count no longer matches the states."""
+        if self.active and len(self.states) != parse_index(self.app.text_area.index("end-1c"))[0]:
+            self.reset()
+
+    def lines_from(self, first):
+        """Yield the text of line first and the ones after it, fetched in growing chunks."""
+        tk_call = self.app.root.tk.call
+        widget = self.app.text_command
+        count = len(self.states)
+        chunk = 16
+        while first <= count:
+            last = min(count, first + chunk - 1)
+            yield from tk_call(widget, "get", "%d.0" % first, "%d.end" % last).split("\n")
+            first = last + 1
+            chunk = min(chunk * 4, 4096)
+
+    def note_edit(self, first, old_last, new_last):
+        """Re-lex after lines first..old_last became first..new_last."""
+        if not self.active:
+            return
+        self.states[first:old_last] = bytes(new_last - first)
+        self.styled[first - 1:old_last] = bytes(new_last - first + 1)
+        count = len(self.states)
+        state = self.states[first - 1]
+        for line, text in zip(itertools.count(first), self.lines_from(first)):
+            if line == count:
+                break
+            state = markdown_state(text, state)
+            if line >= new_last and self.states[line] == state:
+                break
+            self.states[line] = state
+            self.styled[line] = 0
+        self.schedule()
+
+    def schedule(self):
+        """Style the visible lines once the event loop is idle."""
+        if self.active and self.style_id is None:
+            self.style_id = self.app.root.after_idle(self.style_visible)
+
+    def style_visible(self):
+        """Tag the visible lines that are not styled yet, a run of lines at a time."""
+        self.style_id = None
+        app = self.app
+        if not self.active or app.loader:
+            return
+        tk_call = app.root.tk.call
+        widget = app.text_command
+        top = parse_index(tk_call(widget, "index", "@0,0"))[0]
+        bottom = parse_index(tk_call(widget, "index", "@0,%d" % app.text_area.winfo_height()))[0]
+        bottom = min(bottom, len(self.states))
+        first = top
+        while first <= bottom:
+            if self.styled[first - 1]:
+                first += 1
+                continue
+            last = first
+            while last < bottom and not self.styled[last]:
+                last += 1
+            self.style_lines(first, last)
+            first = last + 1
+
+    def style_lines(self, first, last):
+        """Replace the tags of lines first..last with freshly lexed ones."""
+        tk_call = self.app.root.tk.call
+        widget = self.app.text_command
+        texts = tk_call(widget, "get", "%d.0" % first, "%d.end" % last).split("\n")
+        indices = {tag: [] for tag in MARKDOWN_TAGS}
+        for line, text in zip(range(first, last + 1), texts):
+            for tag, start, end in markdown_line(text, self.states[line - 1]):
+                indices[tag] += ["%d.%d" % (line, start), "%d.%d" % (line, end)]
+            self.styled[line - 1] = 1
+        for tag in MARKDOWN_TAGS:
+            tk_call(widget, "tag", "remove", tag, "%d.0" % first, "%d.end" % last)
+            if indices[tag]:
+                tk_call(widget, "tag", "add", tag, *indices[tag])
+
+class SpellChecker:
+    """Underline unknown words, checking only edited lines and the visible ones.
+
+    Edits mark their lines dirty. A pass snapshots the dirty and visible lines
+    for a worker thread, which also loads the word list into a frozenset; the
+    results are tagged a few lines per event loop turn and dropped if the text
+    changed in the meantime, leaving their lines dirty for the next pass.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.words = None  # frozenset of lowercase words, once loaded
+        self.personal = set()
+        self.missing = False  # No word list was found
+        self.jobs = queue.Queue()
+        self.results = queue.Queue()
+        self.worker = None
+        self.dirty = []  # Line ranges edited since they were last checked
+        self.inflight = []  # Line ranges of the pass being checked or tagged
+        self.stamp = None  # (epoch, generation) the in-flight pass was taken at
+        self.epoch = 0  # Bumped when the text area's contents are replaced wholesale
+        self.checked_view = None  # Visible (first, last) lines at the last pass
+        self.pass_id = None
+        self.poll_id = None
+
+    @property
+    def enabled(self):
+        return bool(self.app.settings.get("spell_check", False))
+
+    @staticmethod
+    def wordlist_path():
+        """Return the first word list that exists, or None."""
+        for path in SPELL_WORDLISTS:
+            if os.path.isfile(path):
+                return path
+        return None
+
+    def load_words(self):
+        """Read the word list and personal dictionary; runs on the worker."""
+        path = self.wordlist_path()
+        if path is None:
+            self.missing = True
+            return
+        try:
+            with open(SPELL_DICTIONARY_FILE, "r", encoding="utf-8") as f:
+                self.personal.update(line.strip().lower() for line in f if line.strip())
+        except OSError:
+            pass
+        with open(path, "r", encoding="utf-8", errors="replace") as f:
+            self.words = frozenset(line.strip().lower() for line in f if line.strip())
+
+    def run(self):
+        """Worker loop: check each snapshot of (line number, text) pairs."""
+        try:
+            self.load_words()
+        except OSError:
+            self.missing = True
+        while True:
+            stamp, lines = self.jobs.get()
+            words = self.words or frozenset()
+            checked = [] if self.missing else [(number, misspelled_spans(text, words, self.personal)) for number, text in lines]
+            self.results.put((stamp, checked))
+
+    def note_edit(self, first, old_last, new_last):
+        """Mark lines first..new_last dirty after they replaced first..old_last."""
+        if not self.enabled:
+            return
+        self.dirty = shift_ranges(self.dirty, first, old_last, new_last)
+        if self.inflight:
+            self.inflight = shift_ranges(self.inflight, first, old_last, new_last)
+        self.schedule()
+
+    def schedule(self, delay=SPELL_DELAY_MS):
+        """Run a pass once typing and scrolling have paused for delay ms."""
+        if not self.enabled or self.missing:
+            return
+        if self.worker is None:
+            self.worker = threading.Thread(target=self.run, daemon=True)
+            self.worker.start()
+        root = self.app.root
+        if self.pass_id is not None:
+            root.after_cancel(self.pass_id)
+        self.pass_id = root.after(delay, self.run_pass)
+
+    def reset(self):
+        """Forget the dirty lines and any pass in flight, then check the view afresh."""
+        self.epoch += 1
+        self.dirty = []
+        self.inflight = []
+        self.stamp = None
+        self.checked_view = None
+        self.schedule()
+
+    def refresh(self):
+        """Follow the spell_check setting: check the view again, or drop every underline."""
+        self.reset()
+        if self.enabled:
+            return
+        for doc in self.app.documents:
+            widget = self.app.text_area if doc is self.app.active else doc.text_area
+            if widget is not None:
+                widget.tag_remove("misspelled", "1.0", "end")
+
+    def current_stamp(self):
+        return (self.epoch, self.app.document.generation)
+
+    def run_pass(self):
+        """Send the dirty lines and, if it moved, the visible range to the worker."""
+        self.pass_id = None
+        app = self.app
+        if self.inflight or app.loader or not self.enabled:
+            return  # A pass is out; its completion schedules the next one
+        tk_call = app.root.tk.call
+        widget = app.text_command
+        end = parse_index(tk_call(widget, "index", "end-1c"))[0]
+        view = (
+            parse_index(tk_call(widget, "index", "@0,0"))[0],
+            parse_index(tk_call(widget, "index", "@0,%d" % app.text_area.winfo_height()))[0]
+        )
+        taken, self.dirty = take_ranges(self.dirty, SPELL_PASS_LINES)
+        if view != self.checked_view:
+            taken.append(view)
+        ranges = [(first, min(last, end)) for first, last in merge_ranges(taken) if first <= end]
+        if not ranges:
+            return
+        self.checked_view = view
+        lines = []
+        for first, last in ranges:
+            text = tk_call(widget, "get", "%d.0" % first, "%d.end" % last)
+            lines.extend(zip(range(first, last + 1), text.split("\n")))
+        self.inflight = ranges
+        self.stamp = self.current_stamp()
+        self.jobs.put((self.stamp, lines))
+        if self.poll_id is None:
+            self.poll_id = app.root.after(20, self.poll)
+
+    def poll(self):
+        """Pick up the worker's results for the pass in flight."""
+        self.poll_id = None
+        while True:
+            try:
+                stamp, checked = self.results.get_nowait()
+            except queue.Empty:
+                break
+            if stamp == self.stamp:
+                self.apply(stamp, checked, 0)
+                return
+        if self.stamp is not None:
+            self.poll_id = self.app.root.after(20, self.poll)
+
+    def apply(self, stamp, checked, start):
+        """Re-tag the next batch of checked lines, unless the text changed since the pass."""
+        if stamp != self.stamp:
+            return  # Abandoned by reset()
+        if stamp != self.current_stamp():
+            self.dirty = merge_ranges(self.dirty + self.inflight)
+            self.inflight = []
+            self.stamp = None
+            self.checked_view = None
+            self.schedule()
+            return
+        tk_call = self.app.root.tk.call
+        widget = self.app.text_command
+        for number, spans in checked[start:start + SPELL_TAG_BATCH]:
+            tk_call(widget, "tag", "remove", "misspelled", "%d.0" % number, "%d.end" % number)
+            if spans:
+                indices = []
+                for a, b in spans:
+                    indices += ["%d.%d" % (number, a), "%d.%d" % (number, b)]
+                tk_call(widget, "tag", "add", "misspelled", *indices)
+        start += SPELL_TAG_BATCH
+        if start < len(checked):
+            self.app.root.after(1, lambda: self.apply(stamp, checked, start))
+            return
+        self.inflight = []
+        self.stamp = None
+        if self.dirty:
+            self.schedule(0)
+
+    def add_word(self, word):
+        """Accept word from now on, saving it to the personal dictionary."""
+        word = word.lower().replace("’", "'")
+        self.personal.add(word)
+
+        def append():
+            os.makedirs(APP_DATA_DIR, exist_ok=True)
+            with open(SPELL_DICTIONARY_FILE, "a", encoding="utf-8") as f:
+                f.write(word + "\n")
+
+        self.app.background_writer.submit(("dictionary", word), append)
+        tk_call = self.app.root.tk.call
+        widget = self.app.text_command
+        ranges = tk_call(widget, "tag", "ranges", "misspelled")
+        for i in range(0, len(ranges), 2):
+            first, last = str(ranges[i]), str(ranges[i + 1])
+            if tk_call(widget, "get", first, last).lower().replace("’", "'") == word:
+                tk_call(widget, "tag", "remove", "misspelled", first, last)
+
+class Inotify:
+    """Directory change notifications from the Linux inotify API, through ctypes."""
+
+    MASK = 0x8 | 0x80 | 0x100  # IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+    EVENT = struct.Struct("iIII")  # wd, mask, cookie, name length
+
+    def __init__(self):
+        import ctypes
+        import ctypes.util
+        self.libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self.fd = self.libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.watches = {}  # directory -> watch descriptor
+
+    def watch(self, directory):
+        """Report changes to files in directory from now on."""
+        if directory not in self.watches:
+            wd = self.libc.inotify_add_watch(self.fd, os.fsencode(directory), self.MASK)
+            if wd >= 0:
+                self.watches[directory] = wd
+
+    def read(self):
+        """Return the set of paths written or replaced since the last read."""
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return set()
+        directories = {wd: directory for directory, wd in self.watches.items()}
+        changed = set()
+        offset = 0
+        while offset + self.EVENT.size <= len(data):
+            wd, mask, cookie, length = self.EVENT.unpack_from(data, offset)
+            offset += self.EVENT.size
+            name = data[offset:offset + length].rstrip(b"\0")
+            offset += length
+            if wd in directories and name:
+                changed.add(os.path.join(directories[wd], os.fsdecode(name)))
+        return changed
+
+class FileWatcher:
+    """Notice when another program changes the active file and merge the change in.
+
+    The file's [size, mtime_ns] is compared with the signature it had when
+    the editor last read or wrote it, on a slow tick and whenever inotify
+    reports a write in its folder. A changed file is diffed line by line
+    against the buffer on the writer thread, and only the changed lines are
+    replaced in the text area, as one undoable step, with autosave paused.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.known = {}  # Absolute path -> signature as last read or written by the editor
+        self.inotify = None
+        self.tick_id = None
+        self.check_id = None
+        self.reloading = False
+        self.applying = False  # Merging a change, which is not the writer's own work
+
+    def start(self):
+        """Start the periodic check and, on Linux, inotify notifications."""
+        if self.tick_id is not None:
+            return
+        self.tick_id = self.app.root.after(WATCH_POLL_MS, self.tick)
+        if sys.platform.startswith("linux"):
+            try:
+                self.inotify = Inotify()
+                self.app.root.tk.createfilehandler(self.inotify.fd, tk.READABLE, self.on_notify)
+            except (OSError, AttributeError, tk.TclError):
+                self.inotify = None
+
+    def remember(self, path):
+        """Record the file as the editor now sees it; safe to call from the writer thread."""
+        try:
+            self.known[os.path.abspath(path)] = file_signature(path)
+        except OSError:
+            pass
+
+    def watch(self, path):
+        """Track a freshly loaded file."""
+        self.remember(path)
+        self.start()
+        if self.inotify:
+            self.inotify.watch(os.path.dirname(os.path.abspath(path)))
+
+    def tick(self):
+        self.tick_id = self.app.root.after(WATCH_POLL_MS, self.tick)
+        self.check()
+
+    def on_notify(self, fd, mask):
+        """inotify reported writes; check once they settle if the active file is among them."""
+        changed = self.inotify.read()
+        path = self.app.current_file
+        if path and os.path.abspath(path) in changed:
+            self.request()
+
+    def request(self):
+        if self.check_id is None:
+            self.check_id = self.app.root.after(WATCH_SETTLE_MS, self.check)
+
+    def check(self):
+        """Merge in the active file's changes if its signature moved behind the editor's back."""
+        if self.check_id is not None:
+            self.app.root.after_cancel(self.check_id)
+            self.check_id = None
+        app = self.app
+        path = app.current_file
+        if not path or app.large_doc or app.loader or self.reloading:
+            return
+        if app.background_writer.outstanding:
+            return  # A save of ours may be landing; look again on the next tick
+        key = os.path.abspath(path)
+        try:
+            signature = file_signature(path)
+        except OSError:
+            return  # Moved or deleted; the next save writes it again
+        if self.known.get(key, signature) == signature:
+            self.known[key] = signature
+            return
+        if app.document.dirty:
+            from tkinter import messagebox
+            self.reloading = True  # The dialog runs the event loop; keep ticks out
+            try:
+                accept = messagebox.askyesno(
+                    "File Changed",
+                    f"{os.path.basename(path)} was changed by another program.\n\n"
+                    "Load those changes? Your unsaved edits stay in a backup and can be undone.\n"
+                    "Choose No to keep your version, which overwrites the file on the next save."
+                )
+            finally:
+                self.reloading = False
+            if not accept:
+                self.known[key] = signature
+                return
+            if app.current_file != path:
+                return
+            app.document.deletion_tracker.reset()
+            app.create_backup_file()
+        self.reload(path)
+
+    def reload(self, path):
+        """Diff the file on disk against the buffer on the writer thread, then apply the changes."""
+        app = self.app
+        old = app.text_area.get("1.0", "end-1c").split("\n")
+        generation = app.document.generation
+        autosave_enabled = app.autosave_enabled
+        app.autosave_enabled = False
+        self.reloading = True
+        result = {}
+
+        def diff():
+            signature = file_signature(path)
+            with open(path, "rb") as f:
+                reader = TextReader(f)
+                new = "".join(reader).split("\n")
+            result["hunks"] = delta_hunks(line_delta(old, new), len(old))
+            result["signature"] = signature
+            result["format"] = reader.format
+
+        def on_done(error):
+            self.reloading = False
+            app.autosave_enabled = autosave_enabled
+            if app.current_file != path:
+                return
+            if error:
+                from tkinter import messagebox
+                self.remember(path)
+                messagebox.showerror("Error", f"Could not read the changed file:\n{str(error)}")
+                return
+            if app.document.generation != generation:
+                self.request()  # Typed over the snapshot; diff again
+                return
+            app.document.format = result["format"]
+            self.apply(result["hunks"], old)
+            self.known[os.path.abspath(path)] = result["signature"]
+            app.flash_document_name(f"{os.path.basename(path)} reloaded from disk")
+
+        app.background_writer.submit(("reload", os.path.abspath(path)), diff, on_done)
+
+    def apply(self, hunks, old):
+        """Replace the changed lines in the text area as one undo step."""
+        app = self.app
+        if not hunks:
+            return
+        text_area = app.text_area
+        text_area.configure(autoseparators=False)
+        text_area.edit_separator()
+        self.applying = True
+        try:
+            for start, end, text in hunk_edits(hunks, old):
+                text_area.replace("%d.%d" % start, "%d.%d" % end, text)
+        finally:
+            self.applying = False
+            text_area.edit_separator()
+            text_area.configure(autoseparators=True)
+        app.document.mark_saved()
+        if app.journal:
+            journal = app.journal
+            generation = app.document.generation
+            app.background_writer.submit(("compact", journal.path), lambda: journal.compact(generation))
+
+class LayoutEngine:
+    """Center the text area, coalescing resize bursts into one pass per frame.
+
+    Font metrics are cached per (family, size), and the text area is only
+    reconfigured when the computed padding or height actually changes.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.pending_id = None
+        self.metrics = {}  # (family, size) -> (char width, line height)
+        self.applied = None  # (padx, height) last configured
+
+    def on_configure(self, event):
+        """Root <Configure> handler; children's events bubble here too and are ignored."""
+        if event.widget is self.app.root:
+            self.request()
+
+    def request(self):
+        """Schedule a layout pass for the next frame."""
+        if self.pending_id is None:
+            self.pending_id = self.app.root.after(LAYOUT_FRAME_MS, self.run)
+
+    def font_metrics(self, family, size):
+        """Return (width of "M", line height) for a font, measuring it once."""
+        key = (family, size)
+        if key not in self.metrics:
+            tk_call = self.app.root.tk.call
+            spec = (family, size)
+            self.metrics[key] = (
+                int(tk_call("font", "measure", spec, "M")),
+                int(tk_call("font", "metrics", spec, "-linespace"))
+            )
+        return self.metrics[key]
+
+    def run(self):
+        """Compute padding and height from the container size and apply any change."""
+        if self.pending_id is not None:
+            self.app.root.after_cancel(self.pending_id)
+            self.pending_id = None
+        app = self.app
+        settings = app.settings
+        win_h = app.container.winfo_height()
+        win_w = app.container.winfo_width()
+        char_width, line_height = self.font_metrics(app.get_font_family(), settings["font_size"])
+        if settings.get("typewriter_scroll", False):
+            height = max(1, win_h // max(1, line_height))  # TypewriterView pins the caret instead
+        else:
+            typewriter_pos = float(settings.get("typewriter_position", 0.55))
+            height = max(1, int(win_h * typewriter_pos) // max(1, line_height))
+        padx = max(0, (win_w - char_width * settings.get("max_char_width", 50)) // 2)
+        if (padx, height) == self.applied:
+            return
+        self.applied = (padx, height)
+        app.text_area.config(height=height)
+        app.text_area.pack_configure(padx=padx, pady=0, anchor="center")
+        app.markdown.schedule()
+        app.spell.schedule()
+        app.typewriter.reset()
+
+class TypewriterView:
+    """Keep the caret line at typewriter_position and dim the text away from it.
+
+    With typewriter_scroll on, the view is scrolled by the caret's pixel
+    offset from its pinned height, taken from one bbox call; tags on the first
+    and last lines add the space that lets either end of the text reach that
+    height. focus_mode dims the text area's foreground and moves a single
+    "focus" tag range over the caret's sentence or paragraph (line).
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.pending_id = None
+        self.padding = None  # (top, bottom) pixels the padding tags are configured with
+
+    @property
+    def enabled(self):
+        settings = self.app.settings
+        return settings.get("typewriter_scroll", False) or settings.get("focus_mode", "off") != "off"
+
+    def request(self):
+        """Follow the caret once the current batch of events is handled."""
+        if self.pending_id is None and self.enabled:
+            self.pending_id = self.app.root.after_idle(self.run)
+
+    def reset(self):
+        """Re-measure the padding, e.g. after a resize or on a new text area."""
+        self.padding = None
+        app = self.app
+        if not app.settings.get("typewriter_scroll", False):
+            for tag in ("typewriter_top", "typewriter_bottom"):
+                app.root.tk.call(app.text_command, "tag", "remove", tag, "1.0", "end")
+        self.request()
+
+    def run(self):
+        self.pending_id = None
+        app = self.app
+        if app.loader:
+            return
+        if app.settings.get("typewriter_scroll", False):
+            self.pin()
+        if app.settings.get("focus_mode", "off") != "off":
+            self.update_focus()
+
+    def pin(self):
+        """Scroll so the caret line sits at typewriter_position of the text area's height."""
+        app = self.app
+        tk_call = app.root.tk.call
+        widget = app.text_command
+        height = app.text_area.winfo_height()
+        line_height = app.layout.font_metrics(app.get_font_family(), app.settings["font_size"])[1]
+        target = int(height * float(app.settings.get("typewriter_position", 0.55)))
+        padding = (target, max(0, height - target - line_height))
+        if padding != self.padding:
+            self.padding = padding
+            tk_call(widget, "tag", "configure", "typewriter_top", "-spacing1", padding[0])
+            tk_call(widget, "tag", "configure", "typewriter_bottom", "-spacing3", padding[1])
+        # Edits can carry the padding tags onto other lines; put them back on the ends
+        tk_call(widget, "tag", "remove", "typewriter_top", "2.0", "end")
+        tk_call(widget, "tag", "add", "typewriter_top", "1.0")
+        tk_call(widget, "tag", "remove", "typewriter_bottom", "1.0", "end-1c linestart")
+        tk_call(widget, "tag", "add", "typewriter_bottom", "end-1c linestart", "end")
+        bbox = tk_call(widget, "bbox", "insert")
+        if not bbox:
+            tk_call(widget, "see", "insert")
+            bbox = tk_call(widget, "bbox", "insert")
+            if not bbox:
+                return
+        offset = int(bbox[1]) - target
+        if offset:
+            app.text_area.yview_scroll(offset, "pixels")
+
+    def update_focus(self):
+        """Move the focus tag to the caret's sentence or line."""
+        app = self.app
+        tk_call = app.root.tk.call
+        widget = app.text_command
+        line, col = parse_index(tk_call(widget, "index", "insert"))
+        if app.settings.get("focus_mode") == "sentence":
+            text = tk_call(widget, "get", "%d.0" % line, "%d.end" % line)
+            start, end = 0, len(text)
+            for match in SENTENCE_END_RE.finditer(text):
+                if match.end() <= col:
+                    start = match.end()
+                else:
+                    end = match.end()
+                    break
+            span = ("%d.%d" % (line, start), "%d.%d" % (line, end))
+        else:
+            span = ("%d.0" % line, "%d.end" % line)
+        tk_call(widget, "tag", "remove", "focus", "1.0", "end")
+        tk_call(widget, "tag", "add", "focus", *span)
+
+class FontCatalog:
+    """Installed font families, cached in font_cache.json and refreshed in the background.
+
+    Tk can only be used from its own thread, so a refresh runs this script in
+    a child process with --list-fonts, which writes the cache file itself.
+    """
 
-# Base directory for portability (handles PyInstaller)
-if getattr(sys, 'frozen', False):
-    BASE_DIR = os.path.dirname(sys.executable)
-else:
-    BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+    def __init__(self, root, cache_path=FONT_CACHE_FILE):
+        self.root = root
+        self.cache_path = cache_path
+        self.families = None
+        self.fresh = False
+        self.refreshing = False
+        self.listeners = []
 
-# File paths
-SESSION_FILE = os.path.join(BASE_DIR, "last_session.txt")
-SETTINGS_FILE = os.path.join(BASE_DIR, "settings.json")
-README_FILENAME = os.path.join(BASE_DIR, "readme.txt")
+    @staticmethod
+    def invalidation_key():
+        """Fingerprint of the platform and font directories; cheap to compute."""
+        key = [sys.platform, tk.TkVersion]
+        for directory in FONT_DIRS:
+            try:
+                key.append([directory, os.stat(directory).st_mtime_ns])
+            except OSError:
+                pass
+        return key
 
-# Theme definitions
-NORD_BG = "#2e3440"
-NORD_FG = "#d8dee9"
+    @staticmethod
+    def write_cache(cache_path, root=None):
+        """Enumerate families with Tk and write them to the cache file."""
+        owner = root or tk.Tk()
+        if root is None:
+            owner.withdraw()
+        try:
+            families = sorted(set(owner.tk.splitlist(owner.tk.call("font", "families"))), key=str.lower)
+        finally:
+            if root is None:
+                owner.destroy()
+        data = {"key": FontCatalog.invalidation_key(), "families": families}
+        atomic_write(cache_path, json.dumps(data).encode("utf-8"))
+        return families
 
-# Dark theme for menus and popups
-MENU_THEME = {
-    "bg": "#1e1e1e",
-    "fg": "#d4d4d4",
-    "active_bg": "#2a2a2a",
-    "input_bg": "#1f1f1f"
-}
+    def read_cache(self):
+        """Load the cached families, noting whether they are still valid."""
+        try:
+            with open(self.cache_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            self.families = data["families"]
+            self.fresh = data.get("key") == json.loads(json.dumps(self.invalidation_key()))
+        except (OSError, ValueError, KeyError, TypeError):
+            self.families, self.fresh = None, False
 
-THEMES = {
-    "dark": {"bg": "#1e1e1e", "fg": "#d4d4d4", "insert": "#ffffff"},
-    "paper": {"bg": "#f5f5f5", "fg": "#222222", "insert": "#222222"},
-    "sepia": {"bg": "#f5e6c4", "fg": "#5b4636", "insert": "#5b4636"},
-    "nord": {"bg": NORD_BG, "fg": NORD_FG, "insert": NORD_FG},
-    "gruvbox_light": {"bg": "#fbf1c7", "fg": "#3c3836", "insert": "#3c3836"},
-    "gruvbox_dark": {"bg": "#282828", "fg": "#ebdbb2", "insert": "#ebdbb2"},
-    "monokai": {"bg": "#272822", "fg": "#f8f8f2", "insert": "#f8f8f2"},
-    "cobalt": {"bg": "#002240", "fg": "#ffffff", "insert": "#ffffff"}
-}
+    def get(self, on_update=None):
+        """Return the known families (maybe stale or None); on_update(families) follows a refresh."""
+        if self.families is None:
+            self.read_cache()
+        if on_update:
+            self.listeners.append(on_update)
+        if not self.fresh:
+            self.refresh()
+        return self.families
 
-THEME_CHOICES = [
-    "dark", "paper", "sepia", "nord", "gruvbox_light", "gruvbox_dark", "monokai", "cobalt", "custom"
-]
+    def refresh(self):
+        """Re-enumerate fonts in a child process without blocking the UI."""
+        if self.refreshing:
+            return
+        self.refreshing = True
+        import subprocess
+        if getattr(sys, 'frozen', False):
+            command = [sys.executable, "--list-fonts", self.cache_path]
+        else:
+            command = [sys.executable, os.path.abspath(__file__), "--list-fonts", self.cache_path]
+        result = {}
 
-# Font options
-BASIC_FONT_FAMILIES = [
-    "Arial", "Calibri", "Cambria", "Century", "Comic Sans", "Consolas",
-    "Courier New", "Serif", "Times New Roman", "Verdana", "More Fonts..."
-]
+        def run():
+            try:
+                result["ok"] = subprocess.run(
+                    command,
+                    stdin=subprocess.DEVNULL,
+                    stdout=subprocess.DEVNULL,
+                    stderr=subprocess.DEVNULL,
+                    timeout=120,
+                    creationflags=getattr(subprocess, "CREATE_NO_WINDOW", 0)
+                ).returncode == 0
+            except (OSError, subprocess.SubprocessError):
+                result["ok"] = False
 
-# Default settings
-DEFAULT_SETTINGS = {
-    "font_family": "Consolas",
-    "full_font_family": "",
-    "font_size": 16,
-    "theme": "nord",
-    "autosave_interval": 10,
-    "max_char_width": 50,
-    "typewriter_position": 0.55,
-    "custom_bg": "#222222",
-    "custom_fg": "#eaeaea",
-    "show_word_count": False
-}
+        worker = threading.Thread(target=run, daemon=True)
+        worker.start()
 
-README_TEXT = """Right click to see the context menu and hotkeys.
-Open any text document, and it will auto open next time.
-"""
+        def poll():
+            if worker.is_alive():
+                self.root.after(100, poll)
+                return
+            self.refreshing = False
+            self.read_cache()
+            if not result.get("ok") or not self.fresh:
+                try:  # Fall back to enumerating in-process, once
+                    self.families = self.write_cache(self.cache_path, self.root)
+                except (OSError, tk.TclError):
+                    self.families = self.families or []
+                self.fresh = True
+            listeners, self.listeners = self.listeners, []
+            for listener in listeners:
+                listener(self.families)
+
+        self.root.after(100, poll)
+
+class FontPicker(tk.Frame):
+    """Type-ahead font family chooser that fills its list in small batches."""
+
+    BATCH = 200
+
+    def __init__(self, master, catalog, current):
+        super().__init__(master, bg=MENU_THEME["bg"])
+        self.selected = current
+        self.families = []
+        self.matches = []
+        self.fill_id = None
+        self.filter_var = tk.StringVar()
+        tk.Entry(
+            self,
+            textvariable=self.filter_var,
+            background=MENU_THEME["input_bg"],
+            foreground=MENU_THEME["fg"],
+            insertbackground=MENU_THEME["fg"],
+            width=30
+        ).pack(fill="x")
+        self.listbox = tk.Listbox(
+            self,
+            height=6,
+            width=30,
+            exportselection=False,
+            bg=MENU_THEME["input_bg"],
+            fg=MENU_THEME["fg"],
+            selectbackground=MENU_THEME["active_bg"],
+            selectforeground=MENU_THEME["fg"],
+            highlightthickness=0,
+            bd=0
+        )
+        self.listbox.pack(fill="both", pady=(4, 0))
+        self.listbox.bind("<<ListboxSelect>>", self.on_select)
+        self.filter_var.trace_add("write", lambda *args: self.refilter())
+        self.set_families(catalog.get(self.set_families) or BASIC_FONT_FAMILIES[:-1])
+
+    def set_families(self, families):
+        """Show a new family list, keeping the current filter."""
+        if not self.winfo_exists():
+            return
+        self.families = families or ["Arial"]
+        self.refilter()
+
+    def refilter(self):
+        """Restart filling the list with families containing the typed text."""
+        if self.fill_id is not None:
+            self.after_cancel(self.fill_id)
+            self.fill_id = None
+        needle = self.filter_var.get().strip().lower()
+        self.matches = [f for f in self.families if needle in f.lower()] if needle else self.families
+        self.listbox.delete(0, "end")
+        self.fill(0)
+
+    def fill(self, start):
+        """Insert the next batch of matches, then yield to the event loop."""
+        self.fill_id = None
+        batch = self.matches[start:start + self.BATCH]
+        if batch:
+            self.listbox.insert("end", *batch)
+        if self.selected in batch:
+            index = start + batch.index(self.selected)
+            self.listbox.selection_set(index)
+            self.listbox.see(index)
+        if start + self.BATCH < len(self.matches):
+            self.fill_id = self.after(1, self.fill, start + self.BATCH)
+
+    def on_select(self, event=None):
+        """Remember the clicked family."""
+        selection = self.listbox.curselection()
+        if selection:
+            self.selected = self.listbox.get(selection[0])
+
+    def get(self):
+        """Return the chosen family, or the first match when nothing was picked."""
+        if self.selected:
+            return self.selected
+        return self.matches[0] if self.matches else ""
+
+    def destroy(self):
+        if self.fill_id is not None:
+            self.after_cancel(self.fill_id)
+            self.fill_id = None
+        super().destroy()
+
+class StartupProfiler:
+    """Record named startup phases and print a timing breakdown (--profile-startup)."""
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.marks = [("interpreter to module start", STARTUP_T0)]
+
+    def mark(self, phase):
+        """Note that a phase just finished."""
+        if self.enabled:
+            self.marks.append((phase, time.perf_counter()))
+
+    def report(self):
+        """Print each phase's duration and the running total in milliseconds."""
+        print("Startup profile (ms)      phase    total")
+        for (_, previous), (phase, stamp) in zip(self.marks, self.marks[1:]):
+            print(f"  {phase:<22}{(stamp - previous) * 1000:>8.1f} {(stamp - STARTUP_T0) * 1000:>8.1f}")
+
+class LatencyMonitor:
+    """Time wrapped handlers into log-scale histograms while enabled."""
+
+    def __init__(self):
+        self.enabled = False
+        self.stats = {}
+        self.started = time.time()
+
+    def wrap(self, owner, name):
+        """Replace owner.name with a wrapper that records its latency."""
+        handler = getattr(owner, name)
+
+        def timed(*args, **kwargs):
+            if not self.enabled:
+                return handler(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return handler(*args, **kwargs)
+            finally:
+                self.record(name, time.perf_counter() - start)
+
+        setattr(owner, name, timed)
+
+    def reset(self):
+        """Drop everything recorded so far."""
+        self.stats = {}
+        self.started = time.time()
+
+    def record(self, name, seconds):
+        """Add one call of the given duration to the handler's histogram."""
+        entry = self.stats.get(name)
+        if entry is None:
+            entry = self.stats[name] = [0, 0.0, 0.0, [0] * LATENCY_BUCKET_COUNT]
+        entry[0] += 1
+        entry[1] += seconds
+        if seconds > entry[2]:
+            entry[2] = seconds
+        micros = seconds * 1e6
+        bucket = 0
+        if micros > 1:
+            bucket = min(int(math.log2(micros) * LATENCY_BUCKETS_PER_OCTAVE) + 1, LATENCY_BUCKET_COUNT - 1)
+        entry[3][bucket] += 1
+
+    def percentile(self, name, fraction):
+        """Return the upper bound in seconds of the bucket holding the given fraction of calls."""
+        count, _, longest, buckets = self.stats[name]
+        wanted = max(1, math.ceil(count * fraction))
+        seen = 0
+        for bucket, hits in enumerate(buckets):
+            seen += hits
+            if seen >= wanted:
+                return min(2 ** (bucket / LATENCY_BUCKETS_PER_OCTAVE) / 1e6, longest)
+        return longest
+
+    def summary(self):
+        """Return {handler: {calls, mean_ms, p50_ms, p95_ms, max_ms}} for handlers with calls."""
+        result = {}
+        for name, (count, total, longest, _) in self.stats.items():
+            result[name] = {
+                "calls": count,
+                "mean_ms": round(total / count * 1000, 3),
+                "p50_ms": round(self.percentile(name, 0.5) * 1000, 3),
+                "p95_ms": round(self.percentile(name, 0.95) * 1000, 3),
+                "max_ms": round(longest * 1000, 3)
+            }
+        return result
+
+    def report(self):
+        """Return a JSON-ready report including the raw histograms."""
+        return {
+            "started": self.started,
+            "exported": time.time(),
+            "python": sys.version.split()[0],
+            "tk": tk.TkVersion,
+            "platform": sys.platform,
+            "bucket_us": [round(2 ** (b / LATENCY_BUCKETS_PER_OCTAVE), 3) for b in range(LATENCY_BUCKET_COUNT)],
+            "handlers": {
+                name: dict(stats, histogram=self.stats[name][3])
+                for name, stats in self.summary().items()
+            }
+        }
+
+class OpenDocument:
+    """An open file and its text widget; the active one's state lives on the app.
+
+    Switching documents copies FIELDS between the app and these records, so
+    the rest of the editor only ever deals with the active document. An
+    evicted document keeps just its path and reloads from disk when shown.
+    """
+
+    FIELDS = ("current_file", "text_area", "text_command", "document", "journal", "large_doc", "large_window_dirty")
+
+    def __init__(self, path=None):
+        self.path = path  # The file this document is for, even while it loads
+        self.view = None  # Cursor, scroll and text stats recorded for the session
+        self.current_file = None
+        self.text_area = None
+        self.text_command = None
+        self.document = None
+        self.journal = None
+        self.large_doc = None
+        self.large_window_dirty = False
+
+    @property
+    def warm(self):
+        return self.text_area is not None
+
+    def capture(self, app):
+        """Copy the app's active-document state into this record."""
+        for name in self.FIELDS:
+            setattr(self, name, getattr(app, name))
+
+    def restore(self, app):
+        """Make this record's state the app's active-document state."""
+        for name in self.FIELDS:
+            setattr(app, name, getattr(self, name))
+
+    def memory_estimate(self, interp):
+        """Approximate bytes held by the buffer and its undo history."""
+        chars = int(interp.call(self.text_command, "count", "-chars", "1.0", "end"))
+        return chars * BUFFER_BYTES_PER_CHAR + self.document.undo.size
 
 class DistractionFreeWriter:
-    def __init__(self, root):
+    def __init__(self, root, profiler=None, restore_session=True):
         self.root = root
+        self.profiler = profiler or StartupProfiler()
+        self.profiler.mark("tk root")
         self.settings = self.load_settings()
         self.current_file = None
         self.autosave_enabled = False
-        self.previous_text = ""  # For tracking large deletions
+        self.autosave = AutosaveScheduler(self)
+        self.watcher = FileWatcher(self)
+        self.background_writer = BackgroundWriter(root)
+        self.journal = None
+        self.backup_store = BackupStore(BACKUP_DIR)
+        self.history = VersionStore(HISTORY_DIR)
+        self.stats = StatsStore(STATS_FILE)
+        self.stats_flush_id = None
+        self.backup_ids = itertools.count()
         self.settings_window = None
+        self.layout = LayoutEngine(self)
+        self.font_catalog = FontCatalog(root)
+        self.text_area = None
+        self.text_command = None
+        self.document = None  # DocumentCore of the active text area
+        self.documents = []  # OpenDocuments, most recently used first
+        self.active = None
+        self.session_data = None
+        self.flash_label = None
+        self.flash_id = None
+        self.loading_file = False
+        self.loader = None
+        self.streaming_load = False  # Text proxy passes edits straight through
+        self.large_doc = None  # LargeDocument when a file is opened in large-file mode
+        self.large_window_dirty = False
+        self.large_check_id = None
+        self.context_menu = None  # Built on first right-click
+        self.mapped_callbacks = []
+        self.search_index = None  # Started when search is first opened
+        self.spell = SpellChecker(self)
+        self.markdown = MarkdownStyler(self)
+        self.typewriter = TypewriterView(self)
+        self.spelling_menu_entries = 0  # Spelling items at the top of the context menu
+        self.pending_location = None  # (line, col, length) to select once a load finishes
+        self.pending_view = None  # (session view, file unchanged) to restore once a load finishes
+        self.latency = LatencyMonitor()
+        self.latency_overlay = None
+        self.latency_overlay_id = None
+        for name in LATENCY_HANDLERS:  # Before anything binds or registers them
+            self.latency.wrap(self, name)
+        self.profiler.mark("settings and state")
 
         self.setup_window()
         self.build_layout()
-        self.build_context_menu()
+        self.profiler.mark("window and layout")
         self.bind_events()
-        self.root.after(100, self.startup_session_restore)
+        if restore_session:
+            self.startup_session_restore()
+            self.profiler.mark("session restore started")
+        if self.profiler.enabled:
+            self.root.after_idle(self.finish_startup_profile)
 
     def setup_window(self):
         """Configure the main window."""
@@ -93,15 +3455,30 @@ class DistractionFreeWriter:
 
     def bind_events(self):
         """Bind keyboard and mouse events."""
-        self.root.bind("<Escape>", lambda event: self.root.destroy())
+        self.root.protocol("WM_DELETE_WINDOW", self.quit_app)
+        self.root.bind("<Escape>", self.on_escape)
         self.root.bind("<F11>", self.toggle_fullscreen)
         self.root.bind("<Control-o>", self.open_file_dialog)
         self.root.bind("<Control-s>", self.save_as_dialog)
         self.root.bind("<F12>", self.open_settings_editor)
-        self.root.bind("<Configure>", self.on_window_resize)
-        self.text_area.bind("<Button-3>", self.show_context_menu)
+        self.root.bind("<Control-g>", self.go_to_line_dialog)
+        self.root.bind("<F9>", self.toggle_latency_overlay)
+        self.root.bind("<Control-F>", self.open_search_window)
+        self.root.bind("<Control-H>", self.open_history_window)
+        self.root.bind("<Control-w>", self.close_document)
+        self.root.bind("<Configure>", self.layout.on_configure)
         self.container.bind("<Button-3>", self.show_context_menu)
+
+    def bind_text_area(self):
+        """Bind the events handled by each document's text widget."""
+        self.text_area.bind("<Control-Home>", lambda event: self.jump_to_line(1))
+        self.text_area.bind("<Control-End>", lambda event: self.jump_to_line(None))
+        self.text_area.bind("<Control-Tab>", lambda event: self.cycle_documents(1))
+        self.text_area.bind("<Control-Shift-Tab>", lambda event: self.cycle_documents(-1))
+        self.text_area.bind("<Control-y>", self.redo_edit)  # Tk binds only Ctrl+Shift+Z on X11
+        self.text_area.bind("<Button-3>", self.show_context_menu)
         self.text_area.bind("<<Modified>>", self.on_text_modified)
+        self.text_area.bind("<Map>", self.on_text_area_mapped)
 
     def build_context_menu(self):
         """Create the right-click context menu."""
@@ -119,13 +3496,36 @@ class DistractionFreeWriter:
         self.context_menu.add_command(label="Settings - F12", command=self.open_settings_editor)
         self.context_menu.add_command(label="Save - Ctrl+S", command=self.save_as_dialog)
         self.context_menu.add_command(label="Open - Ctrl+O", command=self.open_file_dialog)
+        self.context_menu.add_command(label="Export...", command=self.open_export_window)
+        self.documents_var = tk.IntVar(self.root)
+        self.documents_menu = tk.Menu(
+            self.context_menu,
+            tearoff=0,
+            bg=MENU_THEME["bg"],
+            fg=MENU_THEME["fg"],
+            activebackground=MENU_THEME["active_bg"],
+            activeforeground=MENU_THEME["fg"],
+            selectcolor=MENU_THEME["fg"],
+            bd=0,
+            font=("Segoe UI", 11),
+            postcommand=self.fill_documents_menu
+        )
+        self.context_menu.add_cascade(label="Documents - Ctrl+Tab", menu=self.documents_menu)
+        self.context_menu.add_command(label="Close Document - Ctrl+W", command=self.close_document)
+        self.context_menu.add_command(label="Search Documents - Ctrl+Shift+F", command=self.open_search_window)
+        self.context_menu.add_command(label="History - Ctrl+Shift+H", command=self.open_history_window)
+        self.context_menu.add_command(label="Backups...", command=self.open_backups_window)
         self.context_menu.add_separator()
         self.context_menu.add_command(label="Toggle Fullscreen - F11", command=self.toggle_fullscreen)
-        self.context_menu.add_command(label="Exit - Esc", command=self.root.destroy)
+        self.context_menu.add_command(label="Latency Overlay - F9", command=self.toggle_latency_overlay)
+        self.context_menu.add_command(label="Export Latency Stats...", command=self.export_latency_stats)
+        self.context_menu.add_command(label="Exit - Esc", command=self.quit_app)
         self.update_context_menu_theme()
 
     def update_context_menu_theme(self):
         """Apply dark theme to context menu."""
+        if self.context_menu is None:
+            return
         try:
             self.context_menu.configure(
                 bg=MENU_THEME["bg"],
@@ -141,12 +3541,31 @@ class DistractionFreeWriter:
 
     def show_context_menu(self, event):
         """Display the context menu at the cursor position."""
+        if self.context_menu is None:
+            self.build_context_menu()
         self.update_context_menu_theme()
+        self.update_spelling_menu(event)
         try:
             self.context_menu.tk_popup(event.x_root, event.y_root)
         finally:
             self.context_menu.grab_release()
 
+    def update_spelling_menu(self, event):
+        """Offer to add the misspelled word under the pointer to the personal dictionary."""
+        if self.spelling_menu_entries:
+            self.context_menu.delete(0, self.spelling_menu_entries - 1)
+            self.spelling_menu_entries = 0
+        if event.widget is not self.text_area or not self.spell.enabled:
+            return
+        index = self.text_area.index(f"@{event.x},{event.y}")
+        if "misspelled" not in self.text_area.tag_names(index):
+            return
+        first, last = self.text_area.tag_prevrange("misspelled", f"{index}+1c")
+        word = self.text_area.get(first, last)
+        self.context_menu.insert_command(0, label=f'Add "{word}" to Dictionary', command=lambda: self.spell.add_word(word))
+        self.context_menu.insert_separator(1)
+        self.spelling_menu_entries = 2
+
     def theme(self, key):
         """Retrieve theme properties for editor."""
         if self.settings.get("theme") == "custom":
@@ -187,170 +3606,1227 @@ class DistractionFreeWriter:
         fg = self.theme("fg")
         self.root.configure(bg=bg)
         self.container.configure(bg=bg)
-        self.text_area.configure(
-            font=(self.get_font_family(), self.settings["font_size"]),
-            bg=bg,
-            fg=fg,
-            wrap="word",
-            width=self.settings.get("max_char_width", 50)
-        )
+        self.configure_text_area(self.text_area)
+        self.document.undo.set_budget(self.undo_budget())
+        for doc in self.documents:
+            if doc.warm and doc is not self.active:
+                self.configure_text_area(doc.text_area)
+                doc.document.undo.set_budget(self.undo_budget())
         self.word_count_label.configure(bg=bg, fg=fg)
+        if self.latency_overlay is not None:
+            self.latency_overlay.configure(bg=bg, fg=fg)
         self.center_text_area()
         self.update_context_menu_theme()
         if self.settings_window and self.settings_window.winfo_exists():
             self.update_settings_window_theme(self.settings_window)
         self.update_word_count_label()
+        self.markdown.reset()
+        self.spell.refresh()
+        self.typewriter.reset()
+
+    def configure_text_area(self, widget):
+        """Apply the font, colors and width settings to a text widget."""
+        focus = self.settings.get("focus_mode", "off") != "off"
+        widget.configure(
+            font=(self.get_font_family(), self.settings["font_size"]),
+            bg=self.theme("bg"),
+            fg=self.dimmed_foreground() if focus else self.theme("fg"),
+            wrap="word",
+            width=self.settings.get("max_char_width", 50)
+        )
+        widget.tag_configure("focus", foreground=self.theme("fg"))
+        self.configure_markdown_tags(widget)
+
+    def dimmed_foreground(self):
+        """Blend the theme foreground FOCUS_DIM of the way from the background."""
+        fg = self.root.winfo_rgb(self.theme("fg"))
+        bg = self.root.winfo_rgb(self.theme("bg"))
+        return "#%02x%02x%02x" % tuple(int(b + (f - b) * FOCUS_DIM) >> 8 for f, b in zip(fg, bg))
+
+    def configure_markdown_tags(self, widget):
+        """Derive the Markdown styles from the text font; later tags take precedence."""
+        family = self.get_font_family()
+        size = self.settings["font_size"]
+        widget.tag_configure("md_h1", font=(family, size + 8, "bold"))
+        widget.tag_configure("md_h2", font=(family, size + 4, "bold"))
+        widget.tag_configure("md_h3", font=(family, size, "bold"))
+        widget.tag_configure("md_quote", font=(family, size, "italic"), lmargin1=size * 2, lmargin2=size * 2)
+        widget.tag_configure("md_italic", font=(family, size, "italic"))
+        widget.tag_configure("md_bold", font=(family, size, "bold"))
+        widget.tag_configure("md_code", font=("Courier", size))
 
     def build_layout(self):
         """Create the main UI layout."""
         self.container = tk.Frame(self.root, bg=self.theme("bg"))
         self.container.pack(fill="both", expand=True)
 
+        self.create_text_area()
+        self.active = OpenDocument()
+        self.documents.append(self.active)
+
+        self.word_count_label = tk.Label(
+            self.container,
+            bg=self.theme("bg"),
+            fg=self.theme("fg"),
+            anchor="e",
+            font=("Segoe UI", 12),
+            bd=0
+        )
+        self.word_count_label.place(relx=1.0, rely=1.0, anchor="se", x=-12, y=-10)
+        self.update_word_count_label()
+        self.layout.request()
+
+    def center_text_area(self, event=None):
+        """Center the text area horizontally and vertically."""
+        self.layout.run()
+
+    def create_text_area(self):
+        """Create and show a text widget with a fresh DocumentCore as the active buffer."""
         self.text_area = tk.Text(
             self.container,
             wrap="word",
             font=(self.get_font_family(), self.settings["font_size"]),
             bg=self.theme("bg"),
             fg=self.theme("fg"),
-            undo=True,
+            undo=False,  # The document's UndoHistory takes Tk's edit undo commands
             width=self.settings.get("max_char_width", 50),
             bd=0
         )
+        self.configure_text_area(self.text_area)
+        self.text_area.tag_configure("misspelled", underline=True)
         self.text_area.pack(side="top", anchor="center", pady=0)
+        self.install_text_proxy()
+        self.bind_text_area()
+        self.layout.applied = None
 
-        self.word_count_label = tk.Label(
-            self.container,
-            bg=self.theme("bg"),
-            fg=self.theme("fg"),
-            anchor="e",
-            font=("Segoe UI", 12),
-            bd=0
+    def install_text_proxy(self):
+        """Route the text widget's Tcl command through text_proxy to observe edits."""
+        widget = str(self.text_area)
+        inner = widget + "_inner"
+        self.text_command = inner
+        self.root.tk.call("rename", widget, inner)
+        self.root.tk.createcommand(widget, lambda *args: self.text_proxy(inner, *args))
+        self.document = DocumentCore(TextWidgetBuffer(self.root.tk, inner))
+        self.document.undo.budget = self.undo_budget()
+
+    def undo_budget(self):
+        """Return the undo history budget of each document in bytes."""
+        return float(self.settings.get("undo_memory_mb", 32)) * 1024 * 1024
+
+    def destroy_text_area(self, widget):
+        """Destroy a text widget along with its proxy command."""
+        name = str(widget)
+        widget.destroy()
+        self.root.tk.deletecommand(name)
+
+    def text_index(self, index):
+        """Resolve an index to a (line, col) tuple, clamped to the end of the text."""
+        tk_call = self.root.tk.call
+        resolved = tk_call(self.text_command, "index", index)
+        if self.root.tk.getboolean(tk_call(self.text_command, "compare", resolved, ">", "end-1c")):
+            resolved = tk_call(self.text_command, "index", "end-1c")
+        return parse_index(resolved)
+
+    def text_proxy(self, command, *args):
+        """Forward a text widget command and report the span an edit replaced."""
+        tk_call = self.root.tk.call
+        if self.streaming_load or command != self.text_command:
+            return tk_call((command,) + args)  # Inactive documents only see settings changes
+        op = args[0] if args else ""
+        if op == "edit" and args[1:2] in (("undo",), ("redo",), ("separator",), ("reset",)):
+            return self.edit_history(args[1])
+        if op == "configure" and "-autoseparators" in args[1:-1]:
+            self.document.undo.auto = self.root.tk.getboolean(args[args.index("-autoseparators") + 1])
+            self.document.undo.separator()
+        if op == "insert" and len(args) >= 3:
+            start = end = self.text_index(args[1])
+            inserted = "".join(args[2::2])
+        elif op == "delete" and 2 <= len(args) <= 3:
+            start = self.text_index(args[1])
+            end = self.text_index(args[2] if len(args) == 3 else f"{args[1]}+1c")
+            inserted = ""
+        elif op == "replace" and len(args) >= 4:
+            start = self.text_index(args[1])
+            end = self.text_index(args[2])
+            inserted = "".join(args[3::2])
+        else:
+            result = tk_call((self.text_command,) + args)
+            if self.large_doc:
+                return result
+            if op in ("delete", "replace"):
+                self.document.resync()
+                self.document.undo.clear()  # An edit it cannot place
+                self.markdown.reset()
+            elif op in ("yview", "see") and len(args) > 1:
+                self.spell.schedule()  # The visible lines may have changed
+                self.markdown.schedule()
+            elif op == "mark" and args[1:3] == ("set", "insert"):
+                self.typewriter.request()
+            return result
+        if start > end:
+            return tk_call((self.text_command,) + args)
+        deleted = ""
+        if start != end and not self.loading_file:
+            deleted = tk_call(self.text_command, "get", "%d.%d" % start, "%d.%d" % end)
+        result = tk_call((self.text_command,) + args)
+        if self.large_doc:
+            self.large_window_dirty = True
+            self.document.touch()
+            self.document.undo.record(start, deleted, inserted)
+            self.autosave.note_edit()
+            self.typewriter.request()
+        else:
+            self.on_text_edit(start, end, deleted, inserted)
+        return result
+
+    def redo_edit(self, event=None):
+        """Redo the last undone edit."""
+        self.edit_history("redo")
+        return "break"
+
+    def edit_history(self, action):
+        """Carry out a Tk edit undo, redo, separator or reset on the document's UndoHistory."""
+        history = self.document.undo
+        if action == "separator":
+            history.separator()
+            return ""
+        if action == "reset":
+            history.clear()
+            return ""
+        step = history.undo() if action == "undo" else history.redo()
+        if step is None:
+            return ""
+        replacements, cursor = step
+        history.replaying = True
+        try:
+            for start, end, text in replacements:
+                self.text_area.replace("%d.%d" % start, "%d.%d" % end, text)
+        finally:
+            history.replaying = False
+        self.text_area.mark_set("insert", "%d.%d" % cursor)
+        self.text_area.see("insert")
+        return ""
+
+    def on_text_edit(self, start, end, deleted, inserted):
+        """Pass an edit that replaced start..end to the document core, then journal it."""
+        words = self.document.word_counter.total
+        backup_due = self.document.edited(start, end, deleted, inserted, track=not self.loading_file)
+        if self.loading_file:
+            return
+        if self.current_file and not self.watcher.applying:
+            self.record_stats(self.document.word_counter.total - words)
+        self.autosave.note_edit()
+        new_last = start[0] + inserted.count("\n")
+        self.markdown.note_edit(start[0], end[0], new_last)
+        self.spell.note_edit(start[0], end[0], new_last)
+        self.typewriter.request()
+        if self.journal:
+            self.journal.record(self.document.generation, start, end, inserted)
+        if backup_due:
+            self.create_backup_file()
+
+    def record_stats(self, delta):
+        """Count words written in the current file, writing the batch out every STATS_FLUSH_MS."""
+        self.stats.record(os.path.abspath(self.current_file), delta)
+        if self.stats_flush_id is None:
+            self.stats_flush_id = self.root.after(STATS_FLUSH_MS, self.flush_stats)
+
+    def flush_stats(self):
+        """Hand the batched writing statistics to the background writer."""
+        if self.stats_flush_id is not None:
+            self.root.after_cancel(self.stats_flush_id)
+            self.stats_flush_id = None
+        self.background_writer.submit(("stats",), self.stats.flush)
+
+    def update_word_count_label(self, event=None):
+        """Update the word count display."""
+        if self.loader:
+            return  # The label shows load progress
+        if self.settings.get("show_word_count", False):
+            if self.large_doc:
+                line = self.large_doc.window_start + parse_index(self.text_area.index("insert"))[0]
+                self.word_count_label.config(text=f"Line {line:,} of {self.large_line_count():,}")
+            else:
+                word_count = self.document.word_counter.total
+                self.word_count_label.config(text=f"{word_count} words")
+            self.word_count_label.lift()
+            self.word_count_label.place(relx=1.0, rely=1.0, anchor="se", x=-12, y=-10)
+        else:
+            self.word_count_label.config(text="")
+            self.word_count_label.place_forget()
+
+    def startup_session_restore(self):
+        """Reopen the last session's documents, loading the most recent, or create a readme file."""
+        entries = []
+        try:
+            with open(SESSION_FILE, "r", encoding="utf-8") as f:
+                data = f.read()
+            try:
+                entries = [(entry["path"], entry.get("view")) for entry in json.loads(data)["documents"]]
+            except (ValueError, KeyError, TypeError, AttributeError):
+                entries = [(data.strip(), None)]  # Sessions from before multiple documents
+        except OSError:
+            pass
+        entries = [(path, view) for path, view in entries if path and os.path.isfile(path)]
+        if not entries:
+            self.create_readme()
+            return
+        for path, view in entries[1:]:  # Loaded when first switched to
+            doc = OpenDocument(path)
+            doc.view = view
+            self.documents.append(doc)
+        self.active.path, self.active.view = entries[0]
+        self.load_file(entries[0][0])
+
+    def create_readme(self):
+        """Create and load the readme file if no session exists."""
+        if not os.path.isfile(README_FILENAME):
+            with open(README_FILENAME, "w", encoding="utf-8") as f:
+                f.write(README_TEXT)
+        self.load_file(README_FILENAME)
+
+    def scroll_to_bottom_and_center(self):
+        """Scroll to the bottom of the text area and center the cursor."""
+        self.text_area.mark_set("insert", "end-1c")
+        self.text_area.focus_set()
+        self.text_area.see("insert")
+
+    def save_session(self):
+        """Save the open documents, most recent first, for session restoration."""
+        data = json.dumps({
+            "documents": [
+                {"path": doc.path, "view": doc.view} if doc.view else {"path": doc.path}
+                for doc in self.documents if doc.path
+            ]
+        })
+        if data == self.session_data:
+            return
+        self.session_data = data
+        try:
+            with open(SESSION_FILE, "w", encoding="utf-8") as f:
+                f.write(data)
+        except IOError:
+            pass
+
+    def load_file(self, file_path, location=None):
+        """Stream a file into the text area without blocking the event loop.
+
+        location, a (line, col, length) span, is selected once the file is shown;
+        by default the cursor goes to the end.
+        """
+        self.pending_location = location
+        self.pending_view = None
+        if self.active.path != file_path:
+            self.active.view = None
+        self.active.path = file_path
+        if self.loader:
+            self.loader.cancel()
+        self.current_file = None  # Nothing is saved until the load completes
+        self.journal = None
+        self.close_large_doc()
+        threshold = float(self.settings.get("large_file_threshold_mb", 64)) * 1024 * 1024
+        try:
+            large = threshold > 0 and os.path.getsize(file_path) >= threshold
+            if large:  # Large-file mode reads and writes UTF-8 only; other encodings stream in whole
+                with open(file_path, "rb") as f:
+                    large = sniff_format(f.read(LOAD_CHUNK_BYTES)).encoding == "utf-8"
+        except OSError:
+            large = False
+        if large:
+            self.open_large_file(file_path)
+            return
+        self.streaming_load = True
+        self.text_area.delete("1.0", "end")
+        view = self.active.view
+        self.loader = FileLoader(
+            self.root,
+            file_path,
+            self.on_load_chunk,
+            lambda line_counts, error: self.on_load_done(file_path, line_counts, error),
+            known=(view["blocks"], stats_path(file_path)) if view and "blocks" in view else None
         )
+        self.show_load_progress(0)
+        self.loader.start()
+
+    def on_load_chunk(self, text, fraction):
+        """Append a chunk delivered by the loader."""
+        self.text_area.insert("end", text)
+        self.show_load_progress(fraction)
+
+    def show_load_progress(self, fraction):
+        """Show load progress where the word count normally appears."""
+        self.word_count_label.config(text=f"Loading {int(fraction * 100)}% - Esc to cancel")
+        self.word_count_label.lift()
         self.word_count_label.place(relx=1.0, rely=1.0, anchor="se", x=-12, y=-10)
+
+    def finish_streaming(self):
+        """Re-enable edit tracking and start a fresh undo history after a load ends."""
+        self.loader = None
+        self.streaming_load = False
+        self.text_area.edit_reset()
+        self.text_area.edit_modified(False)
+
+    def on_load_done(self, file_path, line_counts, error):
+        """Finish a load: adopt word counts, recover the journal and enable autosave."""
+        blocks = self.loader.blocks
+        text_format = self.loader.format
+        self.finish_streaming()
+        if error:
+            self.load_failed(error)
+            return
+        self.document.load(line_counts=line_counts)
+        self.document.format = text_format
+        view = self.active.view
+        unchanged = False
+        if view and "hash" in view:
+            unchanged = view["hash"] == blocks_hash(blocks)
+            self.pending_view = (view, unchanged)
+        self.journal = EditJournal(file_path, self.background_writer, self.root)
+        records = self.journal.recover()
+        if records:
+            self.replay_journal(records)
+        elif unchanged:
+            self.load_undo_history(file_path, view["hash"])
+        self.current_file = file_path
+        self.save_session()
+        self.autosave_enabled = True
+        self.autosave.start()
+        self.watcher.watch(file_path)
+        self.profiler.mark("file loaded")
+        self.when_mapped(self.show_initial_position)
+        self.update_word_count_label()
+        self.markdown.reset()
+        self.spell.reset()
+        self.typewriter.reset()
+
+    def load_failed(self, error):
+        """Report a file that could not be opened, leaving an empty, untitled document in its place."""
+        from tkinter import messagebox
+        self.active.path = None
+        self.streaming_load = True  # Chunks read before the failure are not edits
+        try:
+            self.text_area.delete("1.0", "end")
+        finally:
+            self.streaming_load = False
+        self.document.load()
+        self.markdown.reset()
+        self.spell.reset()
+        self.save_session()
+        self.update_word_count_label()
+        messagebox.showerror("Error", f"Could not load file:\n{str(error)}")
+
+    def load_undo_history(self, file_path, content_hash):
+        """Bring back the undo history saved with the session for a file that has not changed since."""
+        try:
+            with open(undo_path(file_path), "rb") as f:
+                stacks = decode_undo(f.read(), content_hash)
+        except OSError:
+            return
+        if stacks:
+            self.document.undo.adopt(*stacks)
+        self.profiler.mark("undo history loaded")
+
+    def show_initial_position(self):
+        """Place the cursor for a freshly loaded file: at a requested span, else the end."""
+        location, self.pending_location = self.pending_location, None
+        view, self.pending_view = self.pending_view, None
+        if location:
+            self.show_location(*location)
+        elif view:
+            self.restore_view(*view)
+        else:
+            self.scroll_to_bottom_and_center()
+
+    def restore_view(self, view, unchanged):
+        """Put the cursor and scroll position back where the last session left them.
+
+        If the file changed since, the cursor's line is looked for nearby by
+        its checksum, then by paragraph number, before falling back to the
+        same line number.
+        """
+        if self.large_doc:
+            self.jump_to_line(view["line"])
+            self.text_area.mark_set("insert", f"insert+{view['col']}c")
+        else:
+            line, col = parse_index(view["cursor"])
+            if not unchanged:
+                line = self.relocate_line(line, view.get("line_crc"), view.get("paragraph"))
+            self.text_area.mark_set("insert", f"{line}.{col}")
+            if unchanged:
+                self.text_area.yview_moveto(view["yview"])
+        self.text_area.see("insert")
+        self.text_area.focus_set()
+        self.update_word_count_label()
+
+    def relocate_line(self, line, line_crc, paragraph):
+        """Find where a recorded line went in a document changed outside the editor."""
+        lines = self.document.buffer.text().split("\n")
+        for distance in range(SESSION_RELOCATE_LINES):
+            for candidate in (line - distance, line + distance):
+                if 1 <= candidate <= len(lines) and zlib.crc32(lines[candidate - 1].encode("utf-8")) == line_crc:
+                    return candidate
+        if paragraph is not None:
+            seen = 0
+            for number, text in enumerate(lines, 1):
+                if text.strip():
+                    if seen == paragraph:
+                        return number
+                    seen += 1
+        return min(line, len(lines))
+
+    def capture_view(self, doc):
+        """Record a document's cursor, scroll position and text stats for the next launch."""
+        widget = doc.text_area
+        line, col = parse_index(widget.index("insert"))
+        try:
+            size, mtime_ns = file_signature(doc.current_file)
+        except OSError:
+            return
+        if doc.large_doc:
+            doc.view = {"size": size, "mtime_ns": mtime_ns, "line": doc.large_doc.window_start + line, "col": col}
+            return
+        lines = doc.document.buffer.text().split("\n")
+        line_counts = doc.document.word_counter.line_counts
+        blocks = block_stats(lines, line_counts)
+        doc.view = {
+            "size": size,
+            "mtime_ns": mtime_ns,
+            "hash": blocks_hash(blocks),
+            "cursor": f"{line}.{col}",
+            "yview": widget.yview()[0],
+            "words": doc.document.word_counter.total,
+            "paragraph": sum(1 for text in lines[:line - 1] if text.strip()),
+            "line_crc": zlib.crc32(lines[line - 1].encode("utf-8")),
+            "blocks": blocks
+        }
+        counts = array("I", line_counts)
+        path = stats_path(doc.current_file)
+        self.background_writer.submit(path, lambda: write_line_counts(path, counts))
+        content_hash = doc.view["hash"]
+        undo_groups, redo_groups = doc.document.undo.snapshot()
+        history_path = undo_path(doc.current_file)
+        self.background_writer.submit(
+            history_path,
+            lambda: write_undo_history(history_path, encode_undo(content_hash, undo_groups, redo_groups))
+        )
+
+    def quit_app(self, event=None):
+        """Save, record every open document's view for the next launch, then close."""
+        if self.loader:
+            self.loader.cancel()
+        self.autosave.flush()
+        self.flush_stats()
+        self.active.capture(self)
+        for doc in self.documents:
+            if doc.warm and doc.current_file:
+                self.capture_view(doc)
+        self.save_session()
+        self.root.destroy()
+
+    def finish_session(self):
+        """After the last writes land, refresh file signatures in the session and drop stale counts."""
+        for doc in self.documents:
+            if doc.view and doc.path:
+                try:
+                    doc.view["size"], doc.view["mtime_ns"] = file_signature(doc.path)
+                except OSError:
+                    pass
+        self.save_session()
+        keep = {path for doc in self.documents if doc.path for path in (stats_path(doc.path), undo_path(doc.path))}
+        try:
+            names = os.listdir(SESSION_STATS_DIR)
+        except OSError:
+            return
+        for name in names:
+            path = os.path.join(SESSION_STATS_DIR, name)
+            if path not in keep:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    def show_location(self, line, col, length):
+        """Select length characters at line.col and bring them into view."""
+        self.jump_to_line(line)
+        start = self.text_area.index(f"insert+{col}c")
+        self.text_area.tag_remove("sel", "1.0", "end")
+        self.text_area.tag_add("sel", start, f"{start}+{length}c")
+        self.text_area.mark_set("insert", start)
+        self.text_area.see("insert")
+        self.text_area.focus_set()
+
+    def when_mapped(self, callback):
+        """Run callback now if the text area is on screen, otherwise once it is mapped."""
+        if self.text_area.winfo_ismapped():
+            callback()
+        else:
+            self.mapped_callbacks.append(callback)
+
+    def on_text_area_mapped(self, event=None):
+        """Lay out the freshly mapped text area and run callbacks waiting for it."""
+        self.layout.run()
+        callbacks, self.mapped_callbacks = self.mapped_callbacks, []
+        for callback in callbacks:
+            callback()
+        self.profiler.mark("window mapped")
+
+    def finish_startup_profile(self):
+        """Report once the editor is idle and ready for keystrokes, then exit."""
+        if not self.profiler.enabled:
+            return
+        if not (self.current_file and self.text_area.winfo_ismapped()):
+            self.root.after(5, self.finish_startup_profile)
+            return
+        self.profiler.mark("ready for input")
+        self.profiler.enabled = False
+        self.profiler.report()
+        self.root.destroy()
+
+    def cancel_loading(self, event=None):
+        """Abandon a load in progress, leaving an empty untitled document."""
+        if not self.loader:
+            return
+        self.loader.cancel()
+        self.active.path = None
+        self.text_area.delete("1.0", "end")
+        self.document.load()
+        self.finish_streaming()
+        self.update_word_count_label()
+
+    def on_escape(self, event=None):
+        """Cancel a load in progress, otherwise exit."""
+        if self.loader:
+            self.cancel_loading()
+        else:
+            self.quit_app()
+
+    def open_large_file(self, file_path):
+        """Open a file in large-file mode, showing a window of lines at its end."""
+        try:
+            self.large_doc = LargeDocument(file_path)
+        except (OSError, ValueError) as e:
+            self.load_failed(e)
+            return
+        self.text_area.configure(yscrollcommand=self.on_large_view_change)
+        view = self.active.view
+        if view and "line" in view:
+            self.pending_view = (view, [view.get("size"), view.get("mtime_ns")] == file_signature(file_path))
+            self.show_large_window(view["line"] - LARGE_WINDOW_LINES // 2)
+        else:
+            self.show_large_window(self.large_doc.total - LARGE_WINDOW_LINES)
+        self.document.mark_saved()
+        self.current_file = file_path
+        self.save_session()
+        self.autosave_enabled = True
+        self.autosave.start()
+        self.profiler.mark("file loaded")
+        self.when_mapped(self.show_initial_position)
         self.update_word_count_label()
-        self.center_text_area()
 
-    def center_text_area(self, event=None):
-        """Center the text area horizontally and vertically."""
-        self.root.update_idletasks()
-        win_h = self.container.winfo_height()
-        win_w = self.container.winfo_width()
-        typewriter_pos = float(self.settings.get("typewriter_position", 0.55))
+    def close_large_doc(self):
+        """Leave large-file mode, releasing the mapped file."""
+        if not self.large_doc:
+            return
+        self.large_doc.release()
+        self.large_doc = None
+        self.large_window_dirty = False
+        self.text_area.configure(yscrollcommand="")
+        if self.large_check_id is not None:
+            self.root.after_cancel(self.large_check_id)
+            self.large_check_id = None
+
+    def large_line_count(self):
+        """Logical line count, including uncommitted changes in the window."""
+        doc = self.large_doc
+        return doc.total - doc.window_len + parse_index(self.text_area.index("end-1c"))[0]
+
+    def commit_large_window(self):
+        """Write the window's edits back into the piece table."""
+        doc = self.large_doc
+        if not (doc and self.large_window_dirty):
+            return
+        lines = self.text_area.get("1.0", "end-1c").split("\n")
+        doc.replace_lines(doc.window_start, doc.window_start + doc.window_len, lines)
+        doc.window_len = len(lines)
+        self.large_window_dirty = False
+
+    def show_large_window(self, start):
+        """Replace the text area with the window of lines beginning at start (0-based)."""
+        doc = self.large_doc
+        self.commit_large_window()
+        start = max(0, min(start, doc.total - 1))
+        lines = doc.get_lines(start, min(doc.total, start + LARGE_WINDOW_LINES))
+        self.streaming_load = True
         try:
-            line_height = self.text_area.dlineinfo("1.0")[3]
-        except (tk.TclError, TypeError):
-            line_height = self.settings.get("font_size", 18) + 4
-        lines = int(win_h * typewriter_pos) // line_height
-        self.text_area.config(height=lines)
+            self.text_area.delete("1.0", "end")
+            self.text_area.insert("1.0", "\n".join(lines))
+        finally:
+            self.streaming_load = False
+        doc.window_start, doc.window_len = start, len(lines)
+        self.text_area.edit_reset()
+        self.markdown.reset()
+        self.spell.reset()
 
-        font_obj = font.Font(family=self.get_font_family(), size=self.settings["font_size"])
-        char_width = font_obj.measure("M")
-        text_width = char_width * self.settings.get("max_char_width", 50)
-        padx = max(0, (win_w - text_width) // 2)
+    def on_large_view_change(self, first, last):
+        """yscrollcommand hook: check the window once the view settles."""
+        if self.large_check_id is None:
+            self.large_check_id = self.root.after_idle(self.check_large_window)
 
-        self.text_area.pack_configure(padx=padx, pady=0, anchor="center")
+    def check_large_window(self):
+        """Re-center the window when the view nears one of its edges."""
+        self.large_check_id = None
+        doc = self.large_doc
+        if not doc:
+            return
+        top = parse_index(self.text_area.index("@0,0"))[0]
+        bottom = parse_index(self.text_area.index(f"@0,{self.text_area.winfo_height()}"))[0]
+        window_lines = parse_index(self.text_area.index("end-1c"))[0]
+        more_above = doc.window_start > 0
+        more_below = doc.window_start + window_lines < self.large_line_count()
+        if (more_above and top <= LARGE_WINDOW_MARGIN) or (more_below and bottom >= window_lines - LARGE_WINDOW_MARGIN):
+            self.move_large_window(doc.window_start + top - 1)
+        self.update_word_count_label()
 
-    def update_word_count_label(self, event=None):
-        """Update the word count display."""
-        if self.settings.get("show_word_count", False):
-            text = self.text_area.get("1.0", "end-1c")
-            word_count = len(text.split())
-            self.word_count_label.config(text=f"{word_count} words")
-            self.word_count_label.lift()
-            self.word_count_label.place(relx=1.0, rely=1.0, anchor="se", x=-12, y=-10)
+    def move_large_window(self, top, cursor=None):
+        """Center the window on logical line top (0-based), keeping it at the top of the view."""
+        doc = self.large_doc
+        if cursor is None:
+            line, col = parse_index(self.text_area.index("insert"))
+            cursor = (doc.window_start + line - 1, col)
+        self.commit_large_window()
+        self.show_large_window(top - LARGE_WINDOW_LINES // 2)
+        self.text_area.yview(f"{top - doc.window_start + 1}.0")
+        line = cursor[0] - doc.window_start + 1
+        if 1 <= line <= doc.window_len:
+            self.text_area.mark_set("insert", f"{line}.{cursor[1]}")
         else:
-            self.word_count_label.config(text="")
-            self.word_count_label.place_forget()
+            self.text_area.mark_set("insert", "@0,0")
 
-    def on_window_resize(self, event):
-        """Handle window resize events."""
-        self.center_text_area()
+    def jump_to_line(self, line):
+        """Move the cursor to a 1-based line, or the end when line is None."""
+        if self.large_doc:
+            total = self.large_line_count()
+            target = total - 1 if line is None else max(0, min(line, total) - 1)
+            self.move_large_window(target, (target, 0))
+            self.text_area.see("insert")
+        else:
+            self.text_area.mark_set("insert", "end-1c" if line is None else f"{line}.0")
+            self.text_area.see("insert")
         self.update_word_count_label()
+        return "break"
 
-    def startup_session_restore(self):
-        """Load the last session or create a readme file."""
-        if not os.path.exists(SESSION_FILE):
-            self.create_readme()
-        else:
-            with open(SESSION_FILE, "r", encoding="utf-8") as f:
-                last_path = f.read().strip()
-            if last_path and os.path.isfile(last_path):
-                self.load_file(last_path)
-                self.autosave_enabled = True
-                threading.Thread(target=self.autosave_loop, daemon=True).start()
-                self.root.after(150, self.scroll_to_bottom_and_center)
-                return
-            self.create_readme()
+    def go_to_line_dialog(self, event=None):
+        """Ask for a line number and jump to it."""
+        from tkinter import simpledialog
+        line = simpledialog.askinteger("Go to Line", "Line number:", parent=self.root, minvalue=1)
+        if line:
+            self.jump_to_line(line)
+        return "break"
 
-    def create_readme(self):
-        """Create and load the readme file if no session exists."""
-        if not os.path.isfile(README_FILENAME):
-            with open(README_FILENAME, "w", encoding="utf-8") as f:
-                f.write(README_TEXT)
-        self.load_file(README_FILENAME)
-        self.current_file = README_FILENAME
-        self.save_session(README_FILENAME)
-        self.autosave_enabled = True
-        threading.Thread(target=self.autosave_loop, daemon=True).start()
-        self.root.after(150, self.scroll_to_bottom_and_center)
+    def save_large_file(self, file_path):
+        """Stream the piece table to a temp file on the writer thread, then swap it in."""
+        doc = self.large_doc
+        document = self.document
+        self.commit_large_window()
+        document.mark_saved()
+        if doc.saving:
+            document.mark_saved(-1)  # Save again once the current write lands
+            return
+        pieces, log_position = doc.snapshot()
+        doc.saving = True
+        tmp_path = temp_path_for(file_path)
 
-    def scroll_to_bottom_and_center(self):
-        """Scroll to the bottom of the text area and center the cursor."""
-        self.text_area.mark_set("insert", "end-1c")
-        self.text_area.focus_set()
-        self.text_area.see("insert")
+        def on_done(error):
+            if not error:
+                try:
+                    doc.finish_save(tmp_path, file_path, log_position)
+                except OSError as e:
+                    error = e
+            else:
+                doc.saving = False
+                if doc.released:
+                    doc.close()
+                try:
+                    os.remove(tmp_path)
+                except OSError:
+                    pass
+            if error:
+                from tkinter import messagebox
+                document.mark_saved(-1)
+                messagebox.showerror("Error", f"Could not save file:\n{str(error)}")
+            elif self.search_index:
+                self.search_index.update(file_path)
 
-    def save_session(self, file_path):
-        """Save the current file path for session restoration."""
-        try:
-            with open(SESSION_FILE, "w", encoding="utf-8") as f:
-                f.write(file_path)
-        except IOError:
-            pass
+        self.background_writer.submit(
+            os.path.abspath(file_path),
+            lambda: doc.write_copy(pieces, tmp_path),
+            on_done
+        )
 
-    def load_file(self, file_path):
-        """Load a file into the text area."""
+    def replay_journal(self, records):
+        """Re-apply journaled edits that never reached the file before a crash."""
+        self.loading_file = True
         try:
-            with open(file_path, "r", encoding="utf-8") as f:
-                content = f.read()
-                self.text_area.delete("1.0", "end")
-                self.text_area.insert("1.0", content)
-                self.previous_text = content
-            self.current_file = file_path
-            self.save_session(file_path)
-            self.update_word_count_label()
-        except (IOError, UnicodeDecodeError) as e:
-            tk.messagebox.showerror("Error", f"Could not load file:\n{str(e)}")
-            self.root.destroy()
+            for seq, line1, col1, line2, col2, inserted in records:
+                self.text_area.delete(f"{line1}.{col1}", f"{line2}.{col2}")
+                self.text_area.insert(f"{line1}.{col1}", inserted)
+        finally:
+            self.loading_file = False
+        # Leave the recovered edits unsaved so the next autosave folds them into the file
+        self.document.generation = max(self.document.generation, records[-1][0]) + 1
 
     def save_file(self, file_path):
-        """Save the text area content to a file."""
-        try:
-            content = self.text_area.get("1.0", "end-1c")
-            with open(file_path, "w", encoding="utf-8") as f:
-                f.write(content)
+        """Snapshot the text area and hand it to the background writer."""
+        if self.large_doc:
             self.current_file = file_path
-            self.save_session(file_path)
-            self.previous_text = content
-        except IOError as e:
-            tk.messagebox.showerror("Error", f"Could not save file:\n{str(e)}")
+            self.save_session()
+            self.save_large_file(file_path)
+            return
+        document = self.document
+        encoding = document.format.encoding
+        data, generation = document.snapshot()
+        if document.format.encoding != encoding:
+            self.flash_document_name(f"Saved as UTF-8: {encoding} cannot hold this text")
+        versioned = data if document.format.plain else document.buffer.text().encode("utf-8")
+        document.mark_saved()
+        self.current_file = file_path
+        self.save_session()
+        if self.journal and self.journal.path != journal_path(file_path):
+            self.journal.discard()  # Its edits now live in the new file
+            self.journal = None
+        if self.journal is None:
+            self.journal = EditJournal(file_path, self.background_writer, self.root)
+        journal = self.journal
+        history = self.history
+        history_interval = float(self.settings.get("history_interval", 60))
+
+        watcher = self.watcher
+
+        def write():
+            atomic_write(file_path, data)
+            watcher.remember(file_path)
+            journal.compact(generation)
+            history.add(file_path, versioned, history_interval)
+
+        def on_done(error):
+            if error:
+                from tkinter import messagebox
+                document.mark_saved(-1)  # Retry on the next autosave
+                messagebox.showerror("Error", f"Could not save file:\n{str(error)}")
+            elif self.search_index:
+                self.search_index.update(file_path)
+
+        self.background_writer.submit(
+            os.path.abspath(file_path),
+            write,
+            on_done
+        )
 
     def create_backup_file(self):
-        """Create a backup file if a large deletion occurs."""
+        """Back up the document as it was before a burst of large deletions."""
         if not self.current_file:
             return
-        try:
-            content = self.previous_text
-            base, ext = os.path.splitext(self.current_file)
-            random_suffix = ''.join(random.choices(string.digits, k=4))
-            backup_path = f"{base}_backup_{random_suffix}{ext}"
-            with open(backup_path, "w", encoding="utf-8") as f:
-                f.write(content)
-        except IOError as e:
-            tk.messagebox.showerror("Error", f"Could not create backup file:\n{str(e)}")
+        content = self.document.backup_content()
+        source = self.current_file
+        limits = (
+            int(self.settings.get("backup_max_count", 50)),
+            float(self.settings.get("backup_max_age_days", 30)),
+            float(self.settings.get("backup_max_total_mb", 100)) * 1024 * 1024
+        )
+
+        def on_done(error):
+            if error:
+                from tkinter import messagebox
+                messagebox.showerror("Error", f"Could not create backup file:\n{str(error)}")
+
+        self.background_writer.submit(
+            ("backup", next(self.backup_ids)),
+            lambda: self.backup_store.add(source, content, *limits),
+            on_done
+        )
+
+    def open_backups_window(self, event=None):
+        """List stored backups and restore one into the text area."""
+        from tkinter import messagebox
+        win = tk.Toplevel(self.root)
+        win.title("Backups")
+        win.geometry("480x360")
+        win.configure(bg=MENU_THEME["bg"])
+        entries = self.backup_store.entries()
+
+        listbox = tk.Listbox(
+            win,
+            bg=MENU_THEME["input_bg"],
+            fg=MENU_THEME["fg"],
+            selectbackground=MENU_THEME["active_bg"],
+            selectforeground=MENU_THEME["fg"],
+            highlightthickness=0,
+            bd=0,
+            font=("Segoe UI", 10)
+        )
+        listbox.pack(fill="both", expand=True, padx=8, pady=8)
+        for entry in entries:
+            stamp = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(entry["time"]))
+            listbox.insert("end", f"{stamp}   {entry['source']}   {entry['size'] // 1024 + 1} KB")
+        if not entries:
+            listbox.insert("end", "No backups yet.")
+
+        def restore():
+            selection = listbox.curselection()
+            if not entries or not selection:
+                return
+            entry = entries[selection[0]]
+            if not messagebox.askyesno("Restore Backup", "Replace the current text with this backup?", parent=win):
+                return
+            try:
+                content = self.backup_store.read(entry["hash"])
+            except (OSError, zlib.error, UnicodeDecodeError) as e:
+                messagebox.showerror("Error", f"Could not read backup:\n{str(e)}", parent=win)
+                return
+            self.text_area.edit_separator()
+            self.text_area.delete("1.0", "end")
+            self.text_area.insert("1.0", content)
+            self.text_area.edit_separator()
+            win.destroy()
+
+        button_frame = tk.Frame(win, bg=MENU_THEME["bg"])
+        button_frame.pack(pady=(0, 10))
+        for label, command in (("Restore", restore), ("Close", win.destroy)):
+            tk.Button(
+                button_frame,
+                text=label,
+                command=command,
+                background=MENU_THEME["bg"],
+                foreground=MENU_THEME["fg"],
+                activebackground=MENU_THEME["active_bg"],
+                width=8
+            ).pack(side="left", padx=10)
+
+    def open_export_window(self, event=None):
+        """Export the current document or chosen files from the app folder to HTML, Markdown or EPUB."""
+        from tkinter import ttk, messagebox, filedialog
+        win = tk.Toplevel(self.root)
+        win.title("Export")
+        win.geometry("520x460")
+        win.configure(bg=MENU_THEME["bg"])
+        paths = sorted(SearchIndex(BASE_DIR, SEARCH_DIR, skip=(SESSION_FILE,)).candidates())
+        current = os.path.abspath(self.current_file) if self.current_file else None
+        if current and current not in paths:
+            paths.insert(0, current)
+
+        tk.Label(win, text="Files (the current document is selected)", bg=MENU_THEME["bg"], fg=MENU_THEME["fg"]).pack(anchor="w", padx=8, pady=(8, 0))
+        listbox = tk.Listbox(
+            win,
+            selectmode="extended",
+            bg=MENU_THEME["input_bg"],
+            fg=MENU_THEME["fg"],
+            selectbackground=MENU_THEME["active_bg"],
+            selectforeground=MENU_THEME["fg"],
+            highlightthickness=0,
+            bd=0,
+            exportselection=False,
+            font=("Segoe UI", 10)
+        )
+        listbox.pack(fill="both", expand=True, padx=8, pady=8)
+        for i, path in enumerate(paths):
+            listbox.insert("end", os.path.relpath(path, BASE_DIR) if path.startswith(BASE_DIR) else path)
+            if path == current:
+                listbox.selection_set(i)
+                listbox.see(i)
+
+        options = tk.Frame(win, bg=MENU_THEME["bg"])
+        options.pack(fill="x", padx=8)
+        tk.Label(options, text="Format", bg=MENU_THEME["bg"], fg=MENU_THEME["fg"]).grid(row=0, column=0, sticky="e", padx=8, pady=4)
+        format_cb = ttk.Combobox(options, values=list(EXPORT_FORMATS), state="readonly", width=18)
+        format_cb.set("html")
+        format_cb.grid(row=0, column=1, sticky="w", padx=8, pady=4)
+        tk.Label(options, text="Title", bg=MENU_THEME["bg"], fg=MENU_THEME["fg"]).grid(row=1, column=0, sticky="e", padx=8, pady=4)
+        title_entry = tk.Entry(options, bg=MENU_THEME["input_bg"], fg=MENU_THEME["fg"], insertbackground=MENU_THEME["fg"], width=30)
+        title_entry.grid(row=1, column=1, sticky="w", padx=8, pady=4)
+        status = tk.Label(win, text="", bg=MENU_THEME["bg"], fg=MENU_THEME["fg"], anchor="w")
+        status.pack(fill="x", padx=16, pady=(6, 0))
+        job = None
+
+        def start():
+            nonlocal job
+            if job and not job.done:
+                return
+            chosen = [paths[i] for i in listbox.curselection()]
+            if not chosen:
+                status.configure(text="Select at least one file.")
+                return
+            fmt = format_cb.get()
+            first = os.path.splitext(os.path.basename(chosen[0]))[0]
+            out_path = filedialog.asksaveasfilename(
+                parent=win,
+                defaultextension=EXPORT_FORMATS[fmt],
+                initialfile=(title_entry.get().strip() or first) + EXPORT_FORMATS[fmt],
+                filetypes=[(fmt.upper(), "*" + EXPORT_FORMATS[fmt]), ("All Files", "*.*")]
+            )
+            if not out_path:
+                return
+            if current in chosen:
+                self.autosave.flush()  # Export what is on screen; the job waits for the save
+            job = ExportJob(chosen, out_path, fmt, title_entry.get().strip() or None, before=self.background_writer.wait_idle)
+            watch(job, out_path)
+
+        def watch(current_job, out_path):
+            if not win.winfo_exists():
+                current_job.cancel()
+                return
+            if not current_job.done:
+                status.configure(text=f"Exporting {int(current_job.fraction * 100)}%")
+                win.after(100, lambda: watch(current_job, out_path))
+            elif current_job.error:
+                status.configure(text="Export failed.")
+                messagebox.showerror("Error", f"Could not export:\n{str(current_job.error)}", parent=win)
+            elif current_job.cancelled:
+                status.configure(text="Export cancelled.")
+            else:
+                status.configure(text=f"Exported to {out_path}")
+
+        def cancel():
+            if job and not job.done:
+                job.cancel()
+
+        button_frame = tk.Frame(win, bg=MENU_THEME["bg"])
+        button_frame.pack(pady=10)
+        for label, command in (("Export", start), ("Cancel", cancel), ("Close", win.destroy)):
+            tk.Button(
+                button_frame,
+                text=label,
+                command=command,
+                background=MENU_THEME["bg"],
+                foreground=MENU_THEME["fg"],
+                activebackground=MENU_THEME["active_bg"],
+                width=8
+            ).pack(side="left", padx=10)
+
+    def open_history_window(self, event=None):
+        """Browse saved versions of the current document and restore all or one paragraph of one."""
+        from tkinter import messagebox
+        if not self.current_file or self.large_doc:
+            messagebox.showinfo("History", "Version history is kept for saved documents outside large-file mode.")
+            return
+        file_path = self.current_file
+        versions = self.history.versions(file_path)
+        win = tk.Toplevel(self.root)
+        win.title(f"History - {os.path.basename(file_path)}")
+        win.geometry("820x480")
+        win.configure(bg=MENU_THEME["bg"])
+        listbox = tk.Listbox(
+            win,
+            width=28,
+            bg=MENU_THEME["input_bg"],
+            fg=MENU_THEME["fg"],
+            selectbackground=MENU_THEME["active_bg"],
+            selectforeground=MENU_THEME["fg"],
+            highlightthickness=0,
+            exportselection=False,
+            bd=0,
+            font=("Segoe UI", 10)
+        )
+        listbox.pack(side="left", fill="y", padx=(8, 0), pady=8)
+        preview = tk.Text(
+            win,
+            wrap="word",
+            bg=MENU_THEME["input_bg"],
+            fg=MENU_THEME["fg"],
+            insertbackground=MENU_THEME["fg"],
+            highlightthickness=0,
+            bd=0,
+            font=(self.get_font_family(), 11)
+        )
+        preview.pack(side="top", fill="both", expand=True, padx=8, pady=8)
+        for stamp, words in reversed(versions):  # Newest first
+            listbox.insert("end", f"{time.strftime('%Y-%m-%d %H:%M', time.localtime(stamp))}   {words:,} words")
+        if not versions:
+            listbox.insert("end", "No versions yet.")
+        shown = {"text": None}
+
+        def show(event=None):
+            selection = listbox.curselection()
+            if not versions or not selection:
+                return
+            stamp = versions[len(versions) - 1 - selection[0]][0]
+            try:
+                shown["text"] = self.history.version_at(file_path, stamp)
+            except (OSError, zlib.error, ValueError, IndexError) as e:
+                messagebox.showerror("Error", f"Could not read version:\n{str(e)}", parent=win)
+                return
+            preview.configure(state="normal")
+            preview.delete("1.0", "end")
+            preview.insert("1.0", shown["text"])
+            preview.configure(state="disabled")
+
+        def restore_version():
+            if shown["text"] is None or self.current_file != file_path:
+                return
+            if not messagebox.askyesno("Restore Version", "Replace the current text with this version?", parent=win):
+                return
+            self.text_area.edit_separator()
+            self.text_area.delete("1.0", "end")
+            self.text_area.insert("1.0", shown["text"])
+            self.text_area.edit_separator()
+            win.destroy()
+
+        def restore_paragraph():
+            if shown["text"] is None or self.current_file != file_path:
+                return
+            line = parse_index(preview.index("insert"))[0]
+            paragraph = preview.get(f"{line}.0", f"{line}.end")
+            if not paragraph.strip():
+                win.bell()
+                return
+            target, insert_new = self.matching_paragraph(paragraph, line)
+            self.text_area.edit_separator()
+            if insert_new:
+                self.text_area.insert(f"{target}.0", paragraph + "\n")
+            else:
+                self.text_area.replace(f"{target}.0", f"{target}.end", paragraph)
+            self.text_area.edit_separator()
+            self.text_area.mark_set("insert", f"{target}.0")
+            self.text_area.see("insert")
+
+        listbox.bind("<<ListboxSelect>>", show)
+        button_frame = tk.Frame(win, bg=MENU_THEME["bg"])
+        button_frame.pack(side="bottom", pady=(0, 10))
+        for label, command in (
+            ("Restore Version", restore_version),
+            ("Restore Paragraph", restore_paragraph),
+            ("Close", win.destroy)
+        ):
+            tk.Button(
+                button_frame,
+                text=label,
+                command=command,
+                background=MENU_THEME["bg"],
+                foreground=MENU_THEME["fg"],
+                activebackground=MENU_THEME["active_bg"],
+                width=16
+            ).pack(side="left", padx=10)
+        win.bind("<Escape>", lambda event: win.destroy())
+        if versions:
+            listbox.selection_set(0)
+            show()
+
+    def matching_paragraph(self, paragraph, line):
+        """Find the current paragraph an older one corresponds to, searching near its old line.
+
+        Returns (line, False) for a paragraph to replace, or (cursor line, True)
+        when nothing is similar enough and the old paragraph should be inserted.
+        """
+        import difflib
+        last = self.text_index("end-1c")[0]
+        first = max(1, line - HISTORY_PARAGRAPH_RADIUS)
+        candidates = self.document.buffer.get_lines(first, min(last, line + HISTORY_PARAGRAPH_RADIUS))
+        best, best_ratio = None, 0.6
+        matcher = difflib.SequenceMatcher(None, b=paragraph, autojunk=False)
+        for number, text in enumerate(candidates, first):
+            if not text.strip():
+                continue
+            matcher.set_seq1(text)
+            if matcher.real_quick_ratio() > best_ratio and matcher.quick_ratio() > best_ratio:
+                ratio = matcher.ratio()
+                if ratio > best_ratio:
+                    best, best_ratio = number, ratio
+        if best is None:
+            return parse_index(self.text_area.index("insert"))[0], True
+        return best, False
+
+    def open_search_window(self, event=None):
+        """Search every text file in the app folder and open a result at its match."""
+        if self.search_index is None:
+            self.search_index = SearchIndex(BASE_DIR, SEARCH_DIR, skip=(SESSION_FILE,))
+        index = self.search_index
+        index.start()
+        win = tk.Toplevel(self.root)
+        win.title("Search Documents")
+        win.geometry("640x420")
+        win.configure(bg=MENU_THEME["bg"])
+        query = tk.StringVar()
+        entry = tk.Entry(
+            win,
+            textvariable=query,
+            bg=MENU_THEME["input_bg"],
+            fg=MENU_THEME["fg"],
+            insertbackground=MENU_THEME["fg"],
+            highlightthickness=0,
+            bd=0,
+            font=("Segoe UI", 12)
+        )
+        entry.pack(fill="x", padx=8, pady=(8, 4), ipady=4)
+        status = tk.Label(win, anchor="w", bg=MENU_THEME["bg"], fg=MENU_THEME["fg"], font=("Segoe UI", 9))
+        status.pack(fill="x", padx=8)
+        listbox = tk.Listbox(
+            win,
+            bg=MENU_THEME["input_bg"],
+            fg=MENU_THEME["fg"],
+            selectbackground=MENU_THEME["active_bg"],
+            selectforeground=MENU_THEME["fg"],
+            highlightthickness=0,
+            activestyle="none",
+            bd=0,
+            font=("Segoe UI", 10)
+        )
+        listbox.pack(fill="both", expand=True, padx=8, pady=8)
+        hits = []
+        state = {"search_id": None, "version": None}
+
+        def run_search():
+            state["search_id"] = None
+            state["version"] = index.version
+            start = time.perf_counter()
+            hits[:] = index.search(query.get())
+            elapsed = (time.perf_counter() - start) * 1000
+            listbox.delete(0, "end")
+            for path, line, col, length, offset in hits:
+                name = os.path.relpath(path, BASE_DIR)
+                listbox.insert("end", f"{name}:{line}   {SearchIndex.snippet(path, offset)}")
+            indexing = "  (indexing...)" if index.busy else ""
+            status.configure(text=f"{len(hits)} files in {elapsed:.0f} ms{indexing}" if query.get().strip() else indexing.strip())
+
+        def schedule_search(*_):
+            if state["search_id"] is not None:
+                win.after_cancel(state["search_id"])
+            state["search_id"] = win.after(80, run_search)
+
+        def watch_index():
+            if not win.winfo_exists():
+                return
+            if state["version"] != index.version and state["search_id"] is None:
+                run_search()
+            win.after(250, watch_index)
+
+        def open_hit(event=None):
+            selection = listbox.curselection()
+            if not selection:
+                return
+            path, line, col, length, _ = hits[selection[0]]
+            win.destroy()
+            self.open_document(path, location=(line, col, length))
+
+        def to_results(event=None):
+            if hits:
+                listbox.focus_set()
+                listbox.selection_clear(0, "end")
+                listbox.selection_set(0)
+                listbox.activate(0)
+            return "break"
+
+        query.trace_add("write", schedule_search)
+        entry.bind("<Return>", to_results)
+        entry.bind("<Down>", to_results)
+        listbox.bind("<Double-Button-1>", open_hit)
+        listbox.bind("<Return>", open_hit)
+        win.bind("<Escape>", lambda event: win.destroy())
+        entry.focus_set()
+        run_search()
+        watch_index()
 
     def open_file_dialog(self, event=None, force_prompt=False):
         """Open a file dialog to select a text file."""
+        from tkinter import filedialog, messagebox
         file_path = filedialog.askopenfilename(
             initialdir=BASE_DIR,
             defaultextension=".txt",
@@ -359,21 +4835,19 @@ class DistractionFreeWriter:
         )
         if file_path:
             if not os.path.abspath(file_path).startswith(BASE_DIR):
-                tk.messagebox.showerror("Error", "All files must be inside the app folder for portability.")
+                messagebox.showerror("Error", "All files must be inside the app folder for portability.")
                 self.open_file_dialog(force_prompt=force_prompt)
                 return
-            self.load_file(file_path)
-            self.current_file = file_path
-            self.autosave_enabled = True
-            threading.Thread(target=self.autosave_loop, daemon=True).start()
-            self.root.after(150, self.scroll_to_bottom_and_center)
-            self.update_word_count_label()
+            self.open_document(file_path)
         elif force_prompt:
-            tk.messagebox.showinfo("No File Selected", "No file selected. Exiting.")
+            messagebox.showinfo("No File Selected", "No file selected. Exiting.")
             self.root.destroy()
 
     def save_as_dialog(self, event=None):
         """Open a save dialog to save the current text."""
+        if self.loader:
+            return
+        from tkinter import filedialog, messagebox
         file_path = filedialog.asksaveasfilename(
             initialdir=BASE_DIR,
             defaultextension=".txt",
@@ -382,37 +4856,252 @@ class DistractionFreeWriter:
         )
         if file_path:
             if not os.path.abspath(file_path).startswith(BASE_DIR):
-                tk.messagebox.showerror("Error", "All files must be inside the app folder for portability.")
+                messagebox.showerror("Error", "All files must be inside the app folder for portability.")
                 self.save_as_dialog()
                 return
             self.save_file(file_path)
             self.current_file = file_path
+            self.active.path = file_path
+            self.save_session()
             self.autosave_enabled = True
+            self.autosave.start()
 
-    def autosave_loop(self):
-        """Periodically save the current file."""
-        while True:
-            time.sleep(self.settings.get("autosave_interval", 10))
-            if self.current_file and self.autosave_enabled:
-                self.save_file(self.current_file)
+    def open_document(self, file_path, location=None):
+        """Show file_path, switching to it if it is already open, else opening it as a new document."""
+        target = os.path.abspath(file_path)
+        for doc in self.documents:
+            if doc.path and os.path.abspath(doc.path) == target:
+                self.switch_document(doc, location)
+                return
+        if self.loader or (self.active.path is None and not self.document.dirty):
+            self.load_file(file_path, location)  # Reuse an empty or still-loading buffer
+            return
+        doc = OpenDocument(file_path)
+        self.documents.append(doc)
+        self.switch_document(doc, location)
+
+    def switch_document(self, doc, location=None):
+        """Make an open document active, reloading it from disk if it was evicted."""
+        if doc is self.active:
+            if location:
+                self.show_location(*location)
+            return
+        if self.loader:
+            return  # A half-loaded buffer cannot be parked
+        self.autosave.flush()
+        if self.large_check_id is not None:
+            self.root.after_cancel(self.large_check_id)
+            self.large_check_id = None
+        self.active.capture(self)
+        if self.current_file:
+            self.capture_view(self.active)
+        self.text_area.pack_forget()
+        self.documents.remove(doc)
+        self.documents.insert(0, doc)
+        self.active = doc
+        if doc.warm:
+            doc.restore(self)
+            self.text_area.pack(side="top", anchor="center", pady=0)
+            self.layout.applied = None
+            self.layout.run()
+            if location:
+                self.show_location(*location)
+            else:
+                self.text_area.focus_set()
+                self.text_area.see("insert")
+            self.update_word_count_label()
+            self.markdown.reset()
+            self.spell.reset()
+            self.typewriter.reset()
+            self.watcher.request()
+        else:
+            OpenDocument().restore(self)  # Blank state for the new widget
+            self.create_text_area()
+            self.load_file(doc.path, location)
+        self.flash_document_name()
+        self.evict_buffers()
+        self.save_session()
+
+    def cycle_documents(self, step):
+        """Switch to the next (step 1) or least recently used (step -1) document."""
+        if len(self.documents) > 1:
+            self.switch_document(self.documents[1 if step > 0 else -1])
+        return "break"
+
+    def close_document(self, event=None):
+        """Save and close the active document, then show the most recently used other one."""
+        from tkinter import messagebox
+        if len(self.documents) < 2:
+            self.root.bell()
+            return "break"
+        if self.loader:
+            self.cancel_loading()
+        self.autosave.flush()
+        if self.document.dirty and not self.current_file:
+            if not messagebox.askyesno("Close Document", "Discard this unsaved text?"):
+                return "break"
+        closing = self.active
+        self.switch_document(self.documents[1])
+        self.unload_document(closing)
+        self.documents.remove(closing)
+        self.save_session()
+        return "break"
+
+    def unload_document(self, doc):
+        """Free an inactive document's widget and buffers; only its path is kept."""
+        if doc.large_doc:
+            doc.large_doc.release()
+        self.destroy_text_area(doc.text_area)
+        OpenDocument().restore(doc)
+
+    def evict_buffers(self):
+        """Unload the least recently used saved documents that do not fit in buffer_cache_mb."""
+        budget = float(self.settings.get("buffer_cache_mb", 256)) * 1024 * 1024
+        used = 0
+        for doc in self.documents[1:]:
+            if not doc.warm:
+                continue
+            size = doc.memory_estimate(self.root.tk)
+            if used + size > budget and doc.current_file and not doc.document.dirty:
+                self.unload_document(doc)
+            else:
+                used += size
+
+    def fill_documents_menu(self):
+        """Rebuild the Documents submenu from the open documents."""
+        menu = self.documents_menu
+        menu.delete(0, "end")
+        self.documents_var.set(0)  # The active document is always first
+        for position, doc in enumerate(self.documents):
+            name = os.path.basename(doc.path) if doc.path else "Untitled"
+            menu.add_radiobutton(
+                label=name if doc.warm or doc is self.active else f"{name} (on disk)",
+                value=position,
+                variable=self.documents_var,
+                command=lambda doc=doc: self.switch_document(doc)
+            )
+
+    def flash_document_name(self, text=None):
+        """Briefly show the active document's name, or another note, at the top of the window."""
+        if self.flash_label is None:
+            self.flash_label = tk.Label(self.container, font=("Segoe UI", 12), bd=0)
+        if text is None:
+            text = os.path.basename(self.active.path) if self.active.path else "Untitled"
+        self.flash_label.configure(
+            text=text,
+            bg=self.theme("bg"),
+            fg=self.theme("fg")
+        )
+        self.flash_label.place(relx=0.5, rely=0.0, anchor="n", y=10)
+        self.flash_label.lift()
+        if self.flash_id is not None:
+            self.root.after_cancel(self.flash_id)
+        self.flash_id = self.root.after(DOCUMENT_NAME_FLASH_MS, self.hide_document_name)
+
+    def hide_document_name(self):
+        self.flash_id = None
+        self.flash_label.place_forget()
 
     def on_text_modified(self, event=None):
-        """Handle text modifications, including large deletions."""
+        """Handle text modifications; large deletions are caught in on_text_edit."""
         if self.text_area.edit_modified():
-            current_text = self.text_area.get("1.0", "end-1c")
-            if len(self.previous_text) - len(current_text) > 3000:
-                self.create_backup_file()
-            self.previous_text = current_text
             self.text_area.edit_modified(False)
         self.update_word_count_label()
 
+    def toggle_latency_overlay(self, event=None):
+        """Start or stop timing handlers and show their latencies in the top-left corner."""
+        if self.latency.enabled:
+            self.latency.enabled = False
+            if self.latency_overlay_id:
+                self.root.after_cancel(self.latency_overlay_id)
+                self.latency_overlay_id = None
+            self.latency_overlay.place_forget()
+            return
+        self.latency.reset()
+        self.latency.enabled = True
+        if self.latency_overlay is None:
+            self.latency_overlay = tk.Label(
+                self.container,
+                anchor="nw",
+                justify="left",
+                font=("Consolas", 9),
+                bd=0
+            )
+        self.latency_overlay.configure(bg=self.theme("bg"), fg=self.theme("fg"))
+        self.latency_overlay.place(relx=0.0, rely=0.0, anchor="nw", x=12, y=10)
+        self.refresh_latency_overlay()
+
+    def refresh_latency_overlay(self):
+        """Redraw the overlay table from the current histograms."""
+        lines = [f"{'handler':<24}{'calls':>7}{'p50':>8}{'p95':>8}{'max':>8}  ms"]
+        for name, stats in sorted(self.latency.summary().items()):
+            lines.append(
+                f"{name:<24}{stats['calls']:>7}{stats['p50_ms']:>8.2f}"
+                f"{stats['p95_ms']:>8.2f}{stats['max_ms']:>8.2f}"
+            )
+        lines.append(f"autosave: {self.autosave.saves_done} saved, {self.autosave.saves_skipped} idle ticks skipped")
+        self.latency_overlay.configure(text="\n".join(lines))
+        self.latency_overlay.lift()
+        self.latency_overlay_id = self.root.after(LATENCY_OVERLAY_MS, self.refresh_latency_overlay)
+
+    def export_latency_stats(self, event=None):
+        """Write the latency histograms to a timestamped JSON file in the app folder."""
+        from tkinter import messagebox
+        if not self.latency.stats:
+            messagebox.showinfo("Latency Stats", "Nothing recorded yet. Press F9 to start timing.")
+            return
+        path = os.path.join(BASE_DIR, time.strftime("latency-%Y%m%d-%H%M%S.json"))
+        report = self.latency.report()
+        report["autosave"] = self.autosave.counters()
+        data = json.dumps(report, indent=2).encode("utf-8")
+
+        def on_done(error):
+            if error:
+                messagebox.showerror("Error", f"Could not export latency stats:\n{str(error)}")
+            else:
+                messagebox.showinfo("Latency Stats", f"Saved to {os.path.basename(path)}")
+
+        self.background_writer.submit(path, lambda: atomic_write(path, data), on_done)
+
     def toggle_fullscreen(self, event=None):
         """Toggle fullscreen mode."""
         current = self.root.attributes("-fullscreen")
         self.root.attributes("-fullscreen", not current)
 
+    def build_stats_panel(self, win):
+        """Summarize writing statistics for the settings window from the daily rollups."""
+        import sqlite3
+        panel = tk.Frame(win, bg=MENU_THEME["bg"])
+        tk.Label(panel, text="Writing Stats", font=("Segoe UI", 12, "bold"), bg=MENU_THEME["bg"], fg=MENU_THEME["fg"]).pack(anchor="w")
+        try:
+            dash = self.stats.dashboard()
+        except (sqlite3.Error, OSError) as e:
+            lines = ["Statistics are unavailable:", str(e)]
+        else:
+            days = dict(dash["days"])
+            today = days.get(dash["today"], [0, 0, 0])
+            net = today[0] - today[1]
+            goal = int(self.settings.get("daily_word_goal", 500))
+            lines = [f"Today: {net:,} words" + (f" of {goal:,} ({100 * net // goal}%)" if goal > 0 else "")]
+            lines.append(f"Streak: {dash['streak']} day{'s' if dash['streak'] != 1 else ''} (best {dash['best_streak']})")
+            lines.append(f"This session: {dash['session_words']:,} words, {dash['session_wpm']:.0f} WPM")
+            lines.append("")
+            lines.append("Day          Added  Removed  Minutes")
+            for day, (added, removed, minutes) in dash["days"]:
+                lines.append(f"{day}  {added:>7,}  {removed:>7,}  {minutes:>7,}")
+        tk.Label(
+            panel,
+            text="\n".join(lines),
+            justify="left",
+            font=("Courier", 10),
+            bg=MENU_THEME["bg"],
+            fg=MENU_THEME["fg"]
+        ).pack(anchor="w", pady=(6, 0))
+        return panel
+
     def update_settings_window_theme(self, win):
         """Apply dark theme to the settings window."""
+        from tkinter import ttk
         bg = MENU_THEME["bg"]
         fg = MENU_THEME["fg"]
         active_bg = MENU_THEME["active_bg"]
@@ -440,13 +5129,15 @@ class DistractionFreeWriter:
             self.update_settings_window_theme(self.settings_window)
             return
 
+        from tkinter import ttk, messagebox
         win = tk.Toplevel(self.root)
         self.settings_window = win
         win.title("Settings Editor")
-        win.geometry("480x600")
+        win.geometry("860x800")
         win.configure(bg=MENU_THEME["bg"])
         entries = {}
         base_row = 2
+        self.font_catalog.get()  # Warm the font list before "More Fonts..." is picked
 
         style = ttk.Style(win)
         style.theme_use('default')
@@ -473,11 +5164,9 @@ class DistractionFreeWriter:
         def show_more_fonts(event=None):
             nonlocal full_font_cb, base_row
             if font_family_cb.get() == "More Fonts...":
-                fonts = sorted(list(font.families())) or ["Arial"]
                 if full_font_cb:
                     full_font_cb.destroy()
-                full_font_cb = ttk.Combobox(win, values=fonts, state="readonly", style="CustomTheme.TCombobox", width=30)
-                full_font_cb.set(self.settings.get("full_font_family") or fonts[0])
+                full_font_cb = FontPicker(win, self.font_catalog, self.settings.get("full_font_family"))
                 full_font_cb.grid(row=current_row+1, column=1, sticky="w", padx=8, pady=8)
                 tk.Label(win, text="Pick a font", background=MENU_THEME["bg"], foreground=MENU_THEME["fg"]).grid(row=current_row+1, column=0, sticky="e", padx=8, pady=8)
                 entries["full_font_family"] = full_font_cb
@@ -529,6 +5218,13 @@ class DistractionFreeWriter:
         typewriter_entry.insert(0, str(self.settings.get("typewriter_position", "")))
         entries["typewriter_position"] = typewriter_entry
 
+        goal_label = tk.Label(win, text="Daily Word Goal", background=MENU_THEME["bg"], foreground=MENU_THEME["fg"])
+        goal_entry = tk.Entry(win, background=MENU_THEME["input_bg"], foreground=MENU_THEME["fg"], width=20)
+        goal_entry.insert(0, str(self.settings.get("daily_word_goal", "")))
+        entries["daily_word_goal"] = goal_entry
+
+        stats_panel = self.build_stats_panel(win)
+
         show_word_count_var = tk.BooleanVar(value=self.settings.get("show_word_count", False))
         word_count_cb = tk.Checkbutton(
             win,
@@ -542,6 +5238,50 @@ class DistractionFreeWriter:
         )
         entries["show_word_count"] = show_word_count_var
 
+        spell_check_var = tk.BooleanVar(value=self.settings.get("spell_check", False))
+        spell_check_cb = tk.Checkbutton(
+            win,
+            text="Check Spelling",
+            variable=spell_check_var,
+            bg=MENU_THEME["bg"],
+            fg=MENU_THEME["fg"],
+            selectcolor=MENU_THEME["bg"],
+            activebackground=MENU_THEME["bg"],
+            activeforeground=MENU_THEME["fg"]
+        )
+        entries["spell_check"] = spell_check_var
+
+        markdown_var = tk.BooleanVar(value=self.settings.get("markdown_styling", False))
+        markdown_cb = tk.Checkbutton(
+            win,
+            text="Markdown Styling (.md files)",
+            variable=markdown_var,
+            bg=MENU_THEME["bg"],
+            fg=MENU_THEME["fg"],
+            selectcolor=MENU_THEME["bg"],
+            activebackground=MENU_THEME["bg"],
+            activeforeground=MENU_THEME["fg"]
+        )
+        entries["markdown_styling"] = markdown_var
+
+        typewriter_scroll_var = tk.BooleanVar(value=self.settings.get("typewriter_scroll", False))
+        typewriter_scroll_cb = tk.Checkbutton(
+            win,
+            text="Typewriter Scrolling (keep the cursor line in place)",
+            variable=typewriter_scroll_var,
+            bg=MENU_THEME["bg"],
+            fg=MENU_THEME["fg"],
+            selectcolor=MENU_THEME["bg"],
+            activebackground=MENU_THEME["bg"],
+            activeforeground=MENU_THEME["fg"]
+        )
+        entries["typewriter_scroll"] = typewriter_scroll_var
+
+        focus_label = tk.Label(win, text="Focus Mode", background=MENU_THEME["bg"], foreground=MENU_THEME["fg"])
+        focus_cb = ttk.Combobox(win, values=FOCUS_MODES, state="readonly", style="CustomTheme.TCombobox", width=20)
+        focus_cb.set(self.settings.get("focus_mode", "off"))
+        entries["focus_mode"] = focus_cb
+
         button_frame = tk.Frame(win, bg=MENU_THEME["bg"])
         apply_button = tk.Button(
             button_frame,
@@ -591,7 +5331,15 @@ class DistractionFreeWriter:
             typewriter_label.grid(row=other_row+2, column=0, sticky="e", padx=8, pady=8)
             typewriter_entry.grid(row=other_row+2, column=1, sticky="w", padx=8, pady=8)
             word_count_cb.grid(row=other_row+3, column=0, columnspan=2, pady=(10, 10), sticky="w")
-            button_frame.grid(row=other_row+4, column=0, columnspan=2, pady=15, sticky="ew")
+            spell_check_cb.grid(row=other_row+4, column=0, columnspan=2, pady=(0, 10), sticky="w")
+            markdown_cb.grid(row=other_row+5, column=0, columnspan=2, pady=(0, 10), sticky="w")
+            typewriter_scroll_cb.grid(row=other_row+6, column=0, columnspan=2, pady=(0, 10), sticky="w")
+            focus_label.grid(row=other_row+7, column=0, sticky="e", padx=8, pady=8)
+            focus_cb.grid(row=other_row+7, column=1, sticky="w", padx=8, pady=8)
+            goal_label.grid(row=other_row+8, column=0, sticky="e", padx=8, pady=8)
+            goal_entry.grid(row=other_row+8, column=1, sticky="w", padx=8, pady=8)
+            button_frame.grid(row=other_row+9, column=0, columnspan=2, pady=15, sticky="ew")
+            stats_panel.grid(row=0, column=2, rowspan=other_row+10, sticky="n", padx=(8, 16), pady=8)
 
         def show_custom_fields(event=None):
             """Show or hide custom theme fields."""
@@ -609,13 +5357,20 @@ class DistractionFreeWriter:
                 self.settings["max_char_width"] = int(entries["max_char_width"].get())
                 self.settings["typewriter_position"] = float(entries["typewriter_position"].get())
                 self.settings["show_word_count"] = bool(entries["show_word_count"].get())
+                self.settings["spell_check"] = bool(entries["spell_check"].get())
+                self.settings["markdown_styling"] = bool(entries["markdown_styling"].get())
+                self.settings["typewriter_scroll"] = bool(entries["typewriter_scroll"].get())
+                self.settings["focus_mode"] = entries["focus_mode"].get()
+                self.settings["daily_word_goal"] = int(entries["daily_word_goal"].get())
                 if self.settings["theme"] == "custom":
                     self.settings["custom_bg"] = entries["custom_bg"].get().strip()
                     self.settings["custom_fg"] = entries["custom_fg"].get().strip()
                 self.save_settings()
                 self.apply_settings()
+                if self.settings["spell_check"] and SpellChecker.wordlist_path() is None:
+                    messagebox.showwarning("Spelling", "No word list found. Put one word per line in words.txt next to the editor.")
             except (ValueError, tk.TclError) as e:
-                tk.messagebox.showerror("Error", f"Invalid input: {str(e)}")
+                messagebox.showerror("Error", f"Invalid input: {str(e)}")
 
         theme_cb.bind("<<ComboboxSelected>>", show_custom_fields)
         show_more_fonts()  # Initialize font selection
@@ -626,7 +5381,310 @@ class DistractionFreeWriter:
 
         self.update_settings_window_theme(win)
 
+BENCHMARK_WORDS = (
+    "the a of and to in river morning window quiet paper ink light chapter "
+    "scene draft voice letter garden winter summer house road evening"
+).split()
+
+def synthetic_text(rng, size):
+    """Return about size characters of prose lines with a blank line between paragraphs."""
+    lines = []
+    total = 0
+    while total < size:
+        line = " ".join(rng.choice(BENCHMARK_WORDS) for _ in range(rng.randint(4, 16)))
+        lines.append(line)
+        total += len(line) + 1
+        if rng.random() < 0.2:
+            lines.append("")
+            total += 1
+    return "\n".join(lines)
+
+class CoreBenchmarkDriver:
+    """Replay benchmark edits against a headless DocumentCore."""
+
+    name = "core"
+
+    def __init__(self):
+        self.document = DocumentCore()
+
+    def load(self, text):
+        self.document.load(text)
+
+    def edit(self, start, end, inserted):
+        """Apply an edit; return True when a deletion backup is due."""
+        return self.document.apply(start, end, inserted)
+
+    def undo(self):
+        self.document.undo_step()
+
+    def redo(self):
+        self.document.undo_step(redo=True)
+
+    def settle(self):
+        pass
+
+    def close(self):
+        pass
+
+class WidgetBenchmarkDriver:
+    """Replay benchmark edits through a live DistractionFreeWriter text widget."""
+
+    name = "widget"
+
+    def __init__(self):
+        self.root = tk.Tk()
+        # Stay on the untitled document: no session, readme, autosave or journal is touched
+        self.app = DistractionFreeWriter(self.root, restore_session=False)
+        self.app.create_backup_file = self.note_backup
+        self.backup_due = False
+        self.document = self.app.document
+        self.root.update()
+
+    def note_backup(self):
+        self.backup_due = True
+
+    def load(self, text):
+        self.app.streaming_load = True
+        try:
+            self.app.text_area.delete("1.0", "end")
+            self.app.text_area.insert("1.0", text)
+        finally:
+            self.app.streaming_load = False
+        self.document.load()
+        self.app.text_area.edit_reset()
+        self.settle()
+
+    def edit(self, start, end, inserted):
+        self.backup_due = False
+        self.app.text_area.replace("%d.%d" % start, "%d.%d" % end, inserted)
+        self.app.text_area.see("insert")
+        return self.backup_due
+
+    def undo(self):
+        self.app.text_area.edit_undo()
+
+    def redo(self):
+        self.app.text_area.edit_redo()
+
+    def settle(self):
+        """Let Tk redraw so its display cost is part of each timed operation."""
+        self.root.update_idletasks()
+
+    def close(self):
+        self.root.destroy()
+
+def bench_typing_bursts(driver, timed, rng):
+    """Type bursts of keystrokes, with backspaces, at the end of a 200 KB document."""
+    driver.load(synthetic_text(rng, 200 * 1024))
+    for _ in range(150):
+        for _ in range(rng.randint(5, 60)):
+            pos = driver.document.buffer.end()
+            if pos[1] and rng.random() < 0.08:
+                timed("backspace", driver.edit, (pos[0], pos[1] - 1), pos, "")
+            else:
+                timed("keystroke", driver.edit, pos, pos, "\n" if rng.random() < 0.02 else rng.choice(" etaoinshr"))
+
+def bench_big_pastes(driver, timed, rng):
+    """Paste 64 KB blocks at random line starts of a 512 KB document."""
+    driver.load(synthetic_text(rng, 512 * 1024))
+    for _ in range(40):
+        line = rng.randint(1, driver.document.buffer.end()[0])
+        timed("paste 64 KB", driver.edit, (line, 0), (line, 0), synthetic_text(rng, 64 * 1024))
+
+def bench_mass_deletes(driver, timed, rng):
+    """Delete runs of about 60 lines from a 2 MB document, snapshotting backups as they trigger."""
+    driver.load(synthetic_text(rng, 2 * 1024 * 1024))
+    for _ in range(60):
+        last_line = driver.document.buffer.end()[0]
+        first = rng.randint(1, max(1, last_line - 60))
+        if timed("delete ~60 lines", driver.edit, (first, 0), (min(first + 60, last_line), 0), ""):
+            timed("backup snapshot", driver.document.backup_content)
+
+def bench_large_file(driver, timed, rng):
+    """Load a 10 MB document, type in its middle, then save it."""
+    import tempfile
+    text = synthetic_text(rng, 10 * 1024 * 1024)
+    timed("load 10 MB", driver.load, text)
+    line = driver.document.buffer.end()[0] // 2
+    for col in range(2000):
+        timed("keystroke", driver.edit, (line, col), (line, col), rng.choice(" etaoinshr"))
+    with tempfile.TemporaryDirectory() as directory:
+        timed("save 10 MB", driver.document.save, os.path.join(directory, "bench.txt"))
+
+def bench_undo_history(driver, timed, rng):
+    """Type and paste into a 200 KB document, then pack and unpack its undo history as a session would."""
+    driver.load(synthetic_text(rng, 200 * 1024))
+    for _ in range(20000):
+        pos = driver.document.buffer.end()
+        driver.edit(pos, pos, "\n" if rng.random() < 0.02 else rng.choice(" etaoinshr"))
+    for _ in range(20):
+        line = rng.randint(1, driver.document.buffer.end()[0])
+        driver.edit((line, 0), (line, 0), synthetic_text(rng, 64 * 1024))
+    content_hash = "0" * 32
+    for _ in range(20):
+        data = timed("pack undo history", encode_undo, content_hash, *driver.document.undo.snapshot())
+        timed("unpack undo history", decode_undo, data, content_hash)
+    for _ in range(200):
+        timed("undo", driver.undo)
+    for _ in range(200):
+        timed("redo", driver.redo)
+
+def replay_scenario(document_path):
+    """Build a scenario that replays the edits journaled next to a document."""
+    with open(document_path, "rb") as f:
+        base = "".join(TextReader(f))
+    records = []
+    with open(journal_path(document_path), "r", encoding="utf-8") as f:
+        f.readline()  # Header; the base signature is irrelevant to a replay
+        for line in f:
+            try:
+                records.append(json.loads(line))
+            except json.JSONDecodeError:
+                break
+
+    def bench_replay(driver, timed, rng):
+        """Replay a recorded session from an edit journal."""
+        driver.load(base)
+        for seq, line1, col1, line2, col2, inserted in records:
+            timed("recorded edit", driver.edit, (line1, col1), (line2, col2), inserted)
+
+    bench_replay.__name__ = "replay " + os.path.basename(document_path)
+    return bench_replay
+
+BENCHMARK_SCENARIOS = (bench_typing_bursts, bench_big_pastes, bench_mass_deletes, bench_large_file, bench_undo_history)
+
+def run_scenario(driver_class, scenario, seed, measure_memory):
+    """Run one scenario on a fresh driver; return (LatencyMonitor, peak bytes or None, counts match)."""
+    import random
+    import tracemalloc
+    monitor = LatencyMonitor()
+    monitor.enabled = True
+    driver = driver_class()
+
+    def timed(operation, function, *args):
+        start = time.perf_counter()
+        result = function(*args)
+        driver.settle()
+        monitor.record(operation, time.perf_counter() - start)
+        return result
+
+    if measure_memory:
+        tracemalloc.start()
+    try:
+        scenario(driver, timed, random.Random(seed))
+        peak = tracemalloc.get_traced_memory()[1] if measure_memory else None
+        counts_match = driver.document.word_counter.total == len(driver.document.buffer.text().split())
+    finally:
+        if measure_memory:
+            tracemalloc.stop()
+        driver.close()
+    return monitor, peak, counts_match
+
+def run_benchmark(argv):
+    """Replay synthetic (and optionally recorded) typing sessions and report latency and memory."""
+    import argparse
+    parser = argparse.ArgumentParser(prog="writer.py --benchmark", description=run_benchmark.__doc__)
+    parser.add_argument("--widget", action="store_true", help="drive the real Tk text widget (needs a display, e.g. xvfb-run)")
+    parser.add_argument("--replay", metavar="DOCUMENT", action="append", default=[], help="also replay the edit journal recorded next to DOCUMENT")
+    parser.add_argument("--only", metavar="NAME", help="run only scenarios whose name contains NAME")
+    parser.add_argument("--seed", type=int, default=1, help="random seed for the synthetic sessions")
+    parser.add_argument("--no-memory", action="store_true", help="skip the second, memory-traced pass")
+    parser.add_argument("--json", metavar="PATH", help="write the results to PATH as JSON")
+    args = parser.parse_args(argv)
+    driver_class = WidgetBenchmarkDriver if args.widget else CoreBenchmarkDriver
+    scenarios = list(BENCHMARK_SCENARIOS)
+    try:
+        scenarios += [replay_scenario(path) for path in args.replay]
+    except OSError as e:
+        parser.error(f"cannot replay: {e}")
+    if args.only:
+        scenarios = [s for s in scenarios if args.only in s.__name__]
+    results = {
+        "driver": driver_class.name,
+        "seed": args.seed,
+        "python": sys.version.split()[0],
+        "platform": sys.platform,
+        "scenarios": {}
+    }
+    failed = False
+    for scenario in scenarios:
+        try:
+            monitor, _, counts_match = run_scenario(driver_class, scenario, args.seed, False)
+            peak = None if args.no_memory else run_scenario(driver_class, scenario, args.seed, True)[1]
+        except tk.TclError as e:
+            print(f"Cannot start Tk ({e}); run the widget benchmark under a display such as xvfb-run.")
+            return 2
+        failed = failed or not counts_match
+        name = scenario.__name__.replace("bench_", "")
+        results["scenarios"][name] = {
+            "operations": monitor.summary(),
+            "peak_python_mb": None if peak is None else round(peak / 1024 / 1024, 2),
+            "word_count_ok": counts_match
+        }
+        memory = "" if peak is None else f", peak Python heap {peak / 1024 / 1024:.1f} MB"
+        print(f"{name} [{driver_class.name}]{memory}{'' if counts_match else ', WORD COUNT MISMATCH'}")
+        for operation, stats in monitor.summary().items():
+            print(
+                f"  {operation:<20}{stats['calls']:>7} calls  p50 {stats['p50_ms']:>8.3f}  "
+                f"p95 {stats['p95_ms']:>8.3f}  max {stats['max_ms']:>8.3f} ms"
+            )
+    if args.json:
+        atomic_write(args.json, json.dumps(results, indent=2).encode("utf-8"))
+    return 1 if failed else 0
+
+def run_export(argv):
+    """Export text files to one HTML, combined Markdown or EPUB file without opening a window."""
+    import argparse
+    parser = argparse.ArgumentParser(prog="writer.py --export", description=run_export.__doc__)
+    parser.add_argument("output", help="file to write; its extension picks the format unless --format is given")
+    parser.add_argument("files", nargs="*", help="files to export, in order (default: every .txt and .md file in the app folder)")
+    parser.add_argument("--format", choices=sorted(EXPORT_FORMATS), help="output format")
+    parser.add_argument("--title", help="title of the HTML page or book (default: the output file name)")
+    args = parser.parse_args(argv)
+    fmt = args.format
+    if fmt is None:
+        extension = os.path.splitext(args.output)[1].lower()
+        fmt = next((name for name, ext in EXPORT_FORMATS.items() if ext == extension), None)
+        if fmt is None:
+            parser.error("cannot tell the format from the output name; pass --format")
+    output = os.path.abspath(args.output)
+    files = args.files or sorted(
+        path for path in SearchIndex(BASE_DIR, SEARCH_DIR, skip=(SESSION_FILE,)).candidates() if path != output
+    )
+    if not files:
+        parser.error("no files to export")
+    last = [-1]
+
+    def progress(fraction):
+        percent = int(fraction * 100)
+        if percent != last[0]:
+            last[0] = percent
+            print(f"\rExporting {percent}%", end="", file=sys.stderr, flush=True)
+
+    try:
+        export_documents(files, output, fmt, args.title, progress)
+    except OSError as e:
+        print(f"\nCould not export: {e}", file=sys.stderr)
+        return 1
+    except KeyboardInterrupt:
+        print("\nExport cancelled.", file=sys.stderr)
+        return 1
+    print(f"\rExported {len(files)} file{'s' if len(files) != 1 else ''} to {output}", file=sys.stderr)
+    return 0
+
 if __name__ == "__main__":
+    if len(sys.argv) == 3 and sys.argv[1] == "--list-fonts":
+        FontCatalog.write_cache(sys.argv[2])
+        sys.exit(0)
+    if sys.argv[1:2] == ["--benchmark"]:
+        sys.exit(run_benchmark(sys.argv[2:]))
+    if sys.argv[1:2] == ["--export"]:
+        sys.exit(run_export(sys.argv[2:]))
+    profiler = StartupProfiler("--profile-startup" in sys.argv[1:])
+    profiler.mark("imports")
     root = tk.Tk()
-    app = DistractionFreeWriter(root)
+    app = DistractionFreeWriter(root, profiler)
     root.mainloop()
+    app.background_writer.wait_idle()
+    app.finish_session()
+    app.background_writer.drain()
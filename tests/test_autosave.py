@@ -0,0 +1,43 @@
+from types import SimpleNamespace
+
+from writer import AutosaveScheduler
+
+class PendingCallbacks:
+    """Stand-in for the Tk root that never fires timers by itself."""
+
+    def after(self, ms, callback):
+        return callback
+
+    def after_cancel(self, callback_id):
+        pass
+
+def make_app():
+    app = SimpleNamespace(
+        root=PendingCallbacks(),
+        settings={},
+        current_file="notes.txt",
+        autosave_enabled=True,
+        document=SimpleNamespace(dirty=False),
+        saved=0
+    )
+
+    def save_file(path):
+        app.saved += 1
+        app.document.dirty = False
+
+    app.save_file = save_file
+    return app
+
+def test_only_idle_ticks_count_as_skipped():
+    app = make_app()
+    autosave = AutosaveScheduler(app)
+    autosave.tick()  # Nothing changed: the old loop would have written anyway
+    autosave.flush()  # A debounce or switch with nothing to save never wrote before either
+    app.document.dirty = True
+    autosave.note_edit()
+    autosave.tick()
+    assert app.saved == 1
+    assert autosave.counters() == {"saves_done": 1, "saves_skipped": 1}
+    app.autosave_enabled = False
+    autosave.tick()
+    assert autosave.counters() == {"saves_done": 1, "saves_skipped": 1}
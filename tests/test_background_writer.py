@@ -0,0 +1,22 @@
+import threading
+
+from writer import BackgroundWriter
+
+class PendingCallbacks:
+    """Stand-in for the Tk root; the test drains results itself."""
+
+    def after(self, ms, callback):
+        return callback
+
+def test_replaced_job_runs_only_the_newest_callback():
+    writer = BackgroundWriter(PendingCallbacks())
+    gate = threading.Event()
+    ran, done = [], []
+    writer.submit("block", gate.wait)  # Hold the worker so the next jobs stay pending
+    writer.submit("save", lambda: ran.append(1), lambda error: done.append((1, error)))
+    writer.submit("save", lambda: ran.append(2), lambda error: done.append((2, error)))
+    gate.set()
+    writer.wait_idle()
+    writer.drain()
+    assert ran == [2]
+    assert done == [(2, None)]
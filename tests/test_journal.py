@@ -0,0 +1,102 @@
+import json
+import os
+import random
+
+from writer import EditJournal, apply_edit, atomic_write, journal_path
+
+class ImmediateWriter:
+    """Run BackgroundWriter jobs synchronously on the calling thread."""
+
+    def submit(self, key, job, on_done=None):
+        job()
+
+class PendingCallbacks:
+    """Collect root.after callbacks so the test decides when group commits happen."""
+
+    def __init__(self):
+        self.callbacks = []
+
+    def after(self, ms, callback):
+        self.callbacks.append(callback)
+        return len(self.callbacks)
+
+    def after_cancel(self, callback_id):
+        pass
+
+    def run(self):
+        callbacks, self.callbacks = self.callbacks, []
+        for callback in callbacks:
+            callback()
+
+def random_edit(lines, rng):
+    l1 = rng.randint(1, len(lines))
+    c1 = rng.randint(0, len(lines[l1 - 1]))
+    l2 = rng.randint(l1, min(len(lines), l1 + 2))
+    c2 = rng.randint(c1 if l2 == l1 else 0, len(lines[l2 - 1]))
+    inserted = rng.choice(("", "x", "word ", "é\n", "two\nlines", "\"quoted\" \\ text"))
+    apply_edit(lines, (l1, c1), (l2, c2), inserted)
+    return (l1, c1), (l2, c2), inserted
+
+def complete_records(data):
+    """Count the journal lines after the header that a reader can parse."""
+    count = 0
+    for line in data.split(b"\n")[1:]:
+        try:
+            json.loads(line)
+        except ValueError:
+            break
+        count += 1
+    return count
+
+def save(path, lines):
+    atomic_write(path, "\n".join(lines).encode("utf-8"))
+
+def run_session(directory, seed):
+    """Edit, save now and then, and crash; return (document path, text after each generation)."""
+    rng = random.Random(seed)
+    path = os.path.join(directory, "doc.txt")
+    lines = ["first line", "second line", ""]
+    save(path, lines)
+    root = PendingCallbacks()
+    journal = EditJournal(path, ImmediateWriter(), root)
+    states = {}
+    generation = 0
+    for _ in range(rng.randint(20, 120)):
+        start, end, inserted = random_edit(lines, rng)
+        generation += 1
+        journal.record(generation, start, end, inserted)
+        states[generation] = "\n".join(lines)
+        if rng.random() < 0.3:
+            root.run()  # A group commit
+        if rng.random() < 0.05:
+            save(path, lines)
+            journal.compact(generation)
+    root.run()
+    return path, states
+
+def test_replay_after_torn_journal(tmp_path):
+    checked = 0
+    for seed in range(40):
+        directory = tmp_path / str(seed)
+        directory.mkdir()
+        path, states = run_session(str(directory), seed)
+        with open(path, encoding="utf-8") as f:
+            saved = f.read()
+        jpath = journal_path(path)
+        if not os.path.exists(jpath):
+            continue  # Everything was saved
+        with open(jpath, "rb") as f:
+            data = f.read()
+        rng = random.Random(seed)
+        for _ in range(5):
+            cut = rng.randint(0, len(data))
+            with open(jpath, "wb") as f:
+                f.write(data[:cut])
+            records = EditJournal(path, ImmediateWriter(), PendingCallbacks()).recover()
+            lines = saved.split("\n")
+            for seq, line1, col1, line2, col2, inserted in records:
+                apply_edit(lines, (line1, col1), (line2, col2), inserted)
+            assert len(records) == complete_records(data[:cut])
+            assert "\n".join(lines) == (states[records[-1][0]] if records else saved)
+            checked += bool(records)
+    assert checked > 50
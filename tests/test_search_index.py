@@ -0,0 +1,22 @@
+import time
+
+from writer import SearchIndex
+
+def wait_until_idle(index):
+    deadline = time.monotonic() + 10
+    while index.busy:
+        assert time.monotonic() < deadline, "the search index never finished"
+        time.sleep(0.01)
+
+def test_mixed_encoding_file_is_skipped(tmp_path):
+    (tmp_path / "good.txt").write_text("the lighthouse keeper\n", encoding="utf-8")
+    (tmp_path / "mixed.txt").write_bytes("é".encode("utf-8") * 40000 + b"\xe9 lighthouse\n")
+    index = SearchIndex(str(tmp_path), str(tmp_path / ".search"))
+    index.start()
+    wait_until_idle(index)
+    assert [hit[0] for hit in index.search("lighthouse")] == [str(tmp_path / "good.txt")]
+    (tmp_path / "later.txt").write_text("another lighthouse\n", encoding="utf-8")
+    index.update(str(tmp_path / "mixed.txt"))
+    index.start()  # The worker is still alive after both failures
+    wait_until_idle(index)
+    assert len(index.search("lighthouse")) == 2
@@ -0,0 +1,99 @@
+import codecs
+import io
+import os
+import random
+import time
+
+import pytest
+
+from writer import LOAD_CHUNK_BYTES, DocumentCore, ListBuffer, TextFormat, TextReader
+
+PROSE = "Première ligne, un café au lait.\nLe naïve Zürich façade “quoted”.\nPlain ASCII words here.\n" * 400
+
+CORPUS = {
+    "utf-8": PROSE.encode("utf-8"),
+    "utf-8 crlf": PROSE.replace("\n", "\r\n").encode("utf-8"),
+    "utf-8 cr": PROSE.replace("\n", "\r").encode("utf-8"),
+    "utf-8 bom": codecs.BOM_UTF8 + PROSE.encode("utf-8"),
+    "utf-16-le bom crlf": codecs.BOM_UTF16_LE + PROSE.replace("\n", "\r\n").encode("utf-16-le"),
+    "utf-16-be bom": codecs.BOM_UTF16_BE + PROSE.encode("utf-16-be"),
+    "utf-16-le no bom": PROSE.encode("utf-16-le"),
+    "utf-32-le bom": codecs.BOM_UTF32_LE + PROSE.encode("utf-32-le"),
+    "cp1252": PROSE.encode("cp1252"),
+    "latin-1 crlf": PROSE.replace("“", "'").replace("”", "'").replace("\n", "\r\n").encode("latin-1"),
+    "latin-1 undefined in cp1252": PROSE.replace("“", "'").replace("”", "'").encode("latin-1") + b"\x81\x8d",
+    "latin-1 trailing byte": b"caf\xe9",
+    "latin-1 short": "Olá".encode("latin-1"),
+    "ascii then latin-1": b"plain text\r\n" * 10000 + "Zürich".encode("latin-1"),
+    "emoji across chunks": ("😀" * 30000 + "\n").encode("utf-8"),
+    "crlf across chunks": b"x" * (LOAD_CHUNK_BYTES - 1) + b"\r\n" + b"y\r\n" * 10,
+    "trailing cr": b"a\r\nb\r",
+    "no line break": b"just one line",
+    "empty": b""
+}
+
+def read(data, chunk_bytes=LOAD_CHUNK_BYTES):
+    reader = TextReader(io.BytesIO(data), chunk_bytes)
+    return "".join(reader), reader.format
+
+@pytest.mark.parametrize("name", sorted(CORPUS))
+@pytest.mark.parametrize("chunk_bytes", [LOAD_CHUNK_BYTES, 7, 10])
+def test_round_trip(name, chunk_bytes):
+    data = CORPUS[name]
+    text, fmt = read(data, chunk_bytes)
+    assert fmt.encode(text) == data
+
+@pytest.mark.parametrize("name, encoding, newline, bom", [
+    ("utf-8 crlf", "utf-8", "\r\n", False),
+    ("utf-8 cr", "utf-8", "\r", False),
+    ("utf-8 bom", "utf-8", "\n", True),
+    ("utf-16-le bom crlf", "utf-16-le", "\r\n", True),
+    ("utf-16-le no bom", "utf-16-le", "\n", False),
+    ("cp1252", "cp1252", "\n", False),
+    ("latin-1 undefined in cp1252", "latin-1", "\n", False),
+    ("latin-1 trailing byte", "cp1252", "\n", False)
+])
+def test_detection(name, encoding, newline, bom):
+    text, fmt = read(CORPUS[name])
+    assert (fmt.encoding, fmt.newline, bool(fmt.bom)) == (encoding, newline, bom)
+    assert "\r" not in text or newline == "\n"
+    assert "\ufeff" not in text
+
+def test_mixed_encodings_are_refused():
+    with pytest.raises(UnicodeDecodeError):
+        read("é".encode("utf-8") * 40000 + b"\xe9", 1024)
+
+def test_mixed_line_breaks_keep_the_most_common():
+    text, fmt = read(b"a\r\nb\r\nc\nd\r\n")
+    assert fmt.encode(text) == b"a\r\nb\r\nc\r\nd\r\n"
+
+def test_unencodable_text_saves_as_utf8():
+    document = DocumentCore(ListBuffer())
+    document.load("café \U0001f600\nline")
+    document.format = TextFormat("latin-1", "\r\n")
+    data, _ = document.snapshot()
+    assert data == "café \U0001f600\r\nline".encode("utf-8")
+    assert document.format.encoding == "utf-8"
+
+LARGE_FORMATS = [("utf-8", "\n"), ("utf-8", "\r\n"), ("latin-1", "\n"), ("utf-16", "\n")]
+
+def large_text():
+    rng = random.Random(0)
+    words = "the quick brown fox jumps over café naïve façade".split()
+    return "\n".join(" ".join(rng.choice(words) for _ in range(12)) for _ in range(100000))
+
+@pytest.mark.parametrize("encoding, newline", LARGE_FORMATS)
+def test_large_round_trip(encoding, newline):
+    data = large_text().replace("\n", newline).encode(encoding)
+    decoded, fmt = read(data)
+    assert fmt.encode(decoded) == data
+
+@pytest.mark.skipif(not os.environ.get("VOIDWRITER_PERF_TESTS"), reason="set VOIDWRITER_PERF_TESTS=1 to measure load speed")
+@pytest.mark.parametrize("encoding, newline", LARGE_FORMATS)
+def test_load_throughput(encoding, newline):
+    data = large_text().replace("\n", newline).encode(encoding)
+    start = time.perf_counter()
+    read(data)
+    elapsed = time.perf_counter() - start
+    # Loose floor: an order of magnitude under what a quiet machine reaches
+    assert len(data) / elapsed > 20e6, len(data) / elapsed / 1e6
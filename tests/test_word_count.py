@@ -0,0 +1,47 @@
+import random
+
+from writer import WordCounter
+
+FRAGMENTS = ("", " ", "word", "two words", "\n", "a\nb", " x \n\n y ", "tail\n", "\t\tindent")
+
+def replace(lines, start, end, chars):
+    """Replace start..end of a list of lines like a Tk replace; return the new last line."""
+    (l1, c1), (l2, c2) = start, end
+    lines[l1 - 1:l2] = (lines[l1 - 1][:c1] + chars + lines[l2 - 1][c2:]).split("\n")
+    return l1 + chars.count("\n")
+
+def random_span(lines, rng):
+    l1 = rng.randint(1, len(lines))
+    c1 = rng.randint(0, len(lines[l1 - 1]))
+    l2 = rng.randint(l1, min(len(lines), l1 + 3))
+    c2 = rng.randint(c1 if l2 == l1 else 0, len(lines[l2 - 1]))
+    return (l1, c1), (l2, c2)
+
+def test_incremental_count_matches_full_recount():
+    for seed in range(20):
+        rng = random.Random(seed)
+        lines = "some starting text\nover two lines".split("\n")
+        counter = WordCounter()
+        counter.reset("\n".join(lines))
+        for _ in range(500):
+            start, end = random_span(lines, rng)
+            new_last = replace(lines, start, end, rng.choice(FRAGMENTS))
+            counter.replace_lines(start[0], end[0], lines[start[0] - 1:new_last])
+            text = "\n".join(lines)
+            assert counter.total == len(text.split())
+            assert counter.line_counts == [len(line.split()) for line in lines]
+
+def test_keystrokes_and_backspaces():
+    rng = random.Random(1)
+    lines = [""]
+    counter = WordCounter()
+    counter.reset("")
+    for _ in range(2000):
+        end = (len(lines), len(lines[-1]))
+        if end[1] and rng.random() < 0.2:
+            start, chars = (end[0], end[1] - 1), ""
+        else:
+            start, chars = end, rng.choice("ab \n")
+        new_last = replace(lines, start, end, chars)
+        counter.replace_lines(start[0], end[0], lines[start[0] - 1:new_last])
+    assert counter.total == len("\n".join(lines).split())